@@ -1,5 +1,9 @@
 """atomic-operator-runner executes commands both locally and remotely using SSH or WinRM."""
+from .cancellation import CancellationToken
+from .checkpoint import CheckpointStore
 from .runner import Runner
+from .scheduler import Scheduler
+from .watch import OutputWatch
 
 
-__all__ = ["Runner"]
+__all__ = ["CancellationToken", "CheckpointStore", "OutputWatch", "Runner", "Scheduler"]
@@ -2,10 +2,13 @@
 # Copyright: (c) 2022, Swimlane <info@swimlane.com>
 # MIT License (see LICENSE or https://opensource.org/licenses/MIT)
 from typing import Optional
+from typing import Tuple
 
 import click
 
 from atomic_operator_runner import Runner
+from atomic_operator_runner.store import ResultStore
+from atomic_operator_runner.watch import OutputWatch
 
 
 @click.command()
@@ -13,7 +16,7 @@ from atomic_operator_runner import Runner
 @click.option(
     "--platform",
     required=True,
-    type=click.Choice(["windows", "macos", "linux"], case_sensitive=False),
+    type=click.Choice(["windows", "macos", "linux", "aws"], case_sensitive=False),
     help="Platform to run commands on.",
 )
 @click.option("--hostname", help="Remote hostname to run commands on.")
@@ -24,9 +27,40 @@ from atomic_operator_runner import Runner
 @click.option("--verify_ssl", default=False, help="Whether or not to verify SSL when authenticating.")
 @click.option("--ssh_port", default=22, help="Port used for SSH connections.")
 @click.option("--ssh_timeout", default=5, help="Timeout used for SSH connections.")
+@click.option("--elevation_password", help="Password sent to sudo for elevated commands. Defaults to the password.")
+@click.option("--bastion_hostname", help="Jump host through which the remote host is reached.")
+@click.option("--bastion_port", default=22, help="Port used for SSH connections to the jump host.")
+@click.option("--bastion_username", help="Username to authenticate to the jump host. Defaults to the username.")
+@click.option(
+    "--max_output_size",
+    default=10485760,
+    help="Bytes of output kept in memory before output is written to a temporary file.",
+)
+@click.option("--encoding", help="Encoding of command output. Detected when not provided.")
+@click.option(
+    "--compression",
+    default="off",
+    type=click.Choice(["off", "gzip", "auto"], case_sensitive=False),
+    help="Compress output on the remote host before it is transferred.",
+)
+@click.option(
+    "--profile",
+    default="off",
+    type=click.Choice(["off", "basic", "memory", "cpu", "full"], case_sensitive=False),
+    help="Measure the time and memory used by each phase of the execution.",
+)
+@click.option(
+    "--profile_directory", type=click.Path(file_okay=False), help="Directory profiling reports are written to."
+)
+@click.option("--aws_profile", help="AWS CLI profile used when the platform is aws.")
+@click.option("--aws_region", help="AWS region used when the platform is aws.")
 @click.argument("command")
 @click.argument("executor")
 @click.option("--elevated", default=False, help="Whether or not to run the command elevated.")
+@click.option("--watch", multiple=True, help="A regular expression to look for in the output. Can be repeated.")
+@click.option("--stop_on_match", is_flag=True, default=False, help="Stop the command on the first watched match.")
+@click.option("--results_db", type=click.Path(dir_okay=False), help="Path to a result store to save the response in.")
+@click.option("--run_name", default="default", help="Name of the run the response is saved under in the result store.")
 def main(
     platform: str,
     command: str,
@@ -39,10 +73,25 @@ def main(
     verify_ssl: bool = False,
     ssh_port: int = 22,
     ssh_timeout: int = 5,
+    elevation_password: Optional[str] = None,
+    bastion_hostname: Optional[str] = None,
+    bastion_port: int = 22,
+    bastion_username: Optional[str] = None,
+    max_output_size: int = 10485760,
+    encoding: Optional[str] = None,
+    compression: str = "off",
+    profile: str = "off",
+    profile_directory: Optional[str] = None,
+    aws_profile: Optional[str] = None,
+    aws_region: Optional[str] = None,
     elevated: bool = False,
+    watch: Tuple[str, ...] = (),
+    stop_on_match: bool = False,
+    results_db: Optional[str] = None,
+    run_name: str = "default",
 ) -> None:
     """atomic-operator-runner executes powershell, cmd or bash/sh commands both locally or remotely using SSH or WinRM."""
-    Runner(
+    runner = Runner(
         platform=platform,
         hostname=hostname,
         username=username,
@@ -52,7 +101,82 @@ def main(
         verify_ssl=verify_ssl,
         ssh_port=ssh_port,
         ssh_timeout=ssh_timeout,
-    ).run(command=command, executor=executor, elevation_required=elevated)
+        elevation_password=elevation_password,
+        bastion_hostname=bastion_hostname,
+        bastion_port=bastion_port,
+        bastion_username=bastion_username,
+        max_output_size=max_output_size,
+        encoding=encoding,
+        compression=compression,
+        profile=profile,
+        profile_directory=profile_directory,
+        aws_profile=aws_profile,
+        aws_region=aws_region,
+    )
+    runner.run(
+        command=command,
+        executor=executor,
+        elevation_required=elevated,
+        watch=OutputWatch(patterns=list(watch), stop_on_match=stop_on_match) if watch else None,
+    )
+    if results_db:
+        store = ResultStore(path=results_db)
+        store.add(runner.responses[-1:], run=run_name)
+        store.close()
+
+
+@click.group()
+@click.option("--db", required=True, type=click.Path(dir_okay=False), help="Path to the result store.")
+@click.pass_context
+def results(ctx: click.Context, db: str) -> None:
+    """Queries and compares responses saved in a result store."""
+    ctx.obj = ResultStore(path=db)
+    ctx.call_on_close(ctx.obj.close)
+
+
+@results.command()
+@click.pass_obj
+def runs(store: ResultStore) -> None:
+    """Lists the stored runs."""
+    for name in store.runs():
+        click.echo(name)
+
+
+@results.command()
+@click.option("--run", help="Name of the run.")
+@click.option("--hostname", help="Host the command ran on.")
+@click.option("--command", help="Exact command string.")
+@click.option("--executor", help="Executor used to run the command.")
+@click.option("--return_code", type=int, help="Return code of the command.")
+@click.option("--since", type=click.DateTime(), help="Earliest start timestamp.")
+@click.option("--until", type=click.DateTime(), help="Latest start timestamp.")
+@click.option("--limit", type=int, help="Maximum number of results.")
+@click.pass_obj
+def query(store: ResultStore, **filters: Optional[str]) -> None:
+    """Prints a JSON summary of each stored response matching the provided filters."""
+    for result in store.query(**filters):
+        click.echo(result.json())
+
+
+@results.command()
+@click.argument("result_id", type=int)
+@click.pass_obj
+def show(store: ResultStore, result_id: int) -> None:
+    """Prints the full stored response with the provided id."""
+    response = store.get(result_id)
+    if response is None:
+        raise click.ClickException(f"No stored response with id {result_id}.")
+    click.echo(response.json())
+
+
+@results.command()
+@click.argument("before")
+@click.argument("after")
+@click.pass_obj
+def diff(store: ResultStore, before: str, after: str) -> None:
+    """Prints the executions that were added, removed or changed between two runs."""
+    for difference in store.diff(before=before, after=after):
+        click.echo(difference.json())
 
 
 if __name__ == "__main__":
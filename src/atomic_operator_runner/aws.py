@@ -1,61 +1,76 @@
-"""Runs a command on a local system."""
+"""Runs AWS CLI commands on the local system."""
 # Copyright: (c) 2022, Swimlane <info@swimlane.com>
 # MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import os
+import shutil
 import subprocess
+import threading
 from typing import Dict
 from typing import Optional
+from typing import Tuple
 
 from .base import Base
-from .processor import Processor
+from .executors import EXECUTORS
+from .local import LocalRunner
+from .utils.exceptions import AWSCLINotFoundError
+from .utils.exceptions import IncorrectExecutorError
 
 
 class AWSRunner(Base):
     """Used to run commands on a Amazon Web Services system."""
 
-    def _run(
-        self,
-        executor: str,
-        command: str,
-        timeout: int = 5,
-        shell: bool = False,
-        env: Optional[Dict[str, str]] = None,
-        cwd: Optional[str] = None,
-    ) -> None:
-        """Runs the provided command string using the provided executor.
+    _cli_path: Optional[str] = None
+    _cli_version: Optional[str] = None
+    _environments: Dict[Tuple[Optional[str], Optional[str]], Dict[str, str]] = {}
+    _lock = threading.Lock()
 
-        Args:
-            executor (str): The executor to use when executing the provided command string.
-            command (str): The command string to run.
-            timeout (int, optional): Timeout when running a command. Defaults to 5.
-            shell (bool, optional): Whether to spawn a new shell or not. Defaults to False.
-            env (dict, optional): Environment to use including environmental variables.. Defaults to os.environ.
-            cwd (str, optional): The current working directory. Defaults to None.
+    def _resolve_cli(self) -> str:
+        """Locates the AWS CLI and checks its version once per process.
+
+        Raises:
+            AWSCLINotFoundError: Raised when the aws executable cannot be found or run.
+
+        Returns:
+            str: The path to the aws executable.
         """
-        self.__logger.debug("Starting a subprocess on the local system.")
-        process = subprocess.Popen(
-            executor,
-            shell=shell,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            env=env,
-            cwd=cwd,
-        )
-        try:
-            self.__logger.info("Running command now.")
-            outs, errs = process.communicate(bytes(command, "utf-8") + b"\n", timeout=timeout)
-            Processor(
-                command=command, executor=executor, return_code=process.returncode, output=str(outs), errors=str(errs)
-            )
-        except subprocess.TimeoutExpired as e:
-            if e.output:
-                self.__logger.warning(e.output)
-            if e.stdout:
-                self.__logger.warning(e.stdout)
-            if e.stderr:
-                self.__logger.warning(e.stderr)
-            self.__logger.warning("Command timed out!")
-            process.kill()
+        if AWSRunner._cli_path:
+            return AWSRunner._cli_path
+        with AWSRunner._lock:
+            if not AWSRunner._cli_path:
+                self.__logger.info("Checking for AWS CLI tools...")
+                path = shutil.which("aws")
+                if not path:
+                    raise AWSCLINotFoundError()
+                try:
+                    version = subprocess.run(  # noqa: S603
+                        [path, "--version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=30
+                    )
+                except (OSError, subprocess.TimeoutExpired) as e:
+                    self.__logger.debug(e)
+                    raise AWSCLINotFoundError() from e
+                AWSRunner._cli_version = version.stdout.decode("utf-8", "ignore").strip()
+                AWSRunner._cli_path = path
+                self.__logger.info(f"AWS CLI tools found ({AWSRunner._cli_version}).")
+        return AWSRunner._cli_path
+
+    def _get_env(self) -> Dict[str, str]:
+        """Builds the environment used for AWS CLI commands once per profile and region.
+
+        Returns:
+            Dict[str, str]: The environment including the configured AWS profile and region.
+        """
+        key = (Base.config.aws_profile, Base.config.aws_region)
+        env = AWSRunner._environments.get(key)
+        if env is None:
+            env = dict(os.environ)
+            # the pager would otherwise wait on input that never comes
+            env["AWS_PAGER"] = ""
+            if Base.config.aws_profile:
+                env["AWS_PROFILE"] = Base.config.aws_profile
+            if Base.config.aws_region:
+                env["AWS_DEFAULT_REGION"] = Base.config.aws_region
+            AWSRunner._environments[key] = env
+        return env
 
     def run(
         self,
@@ -68,17 +83,35 @@ class AWSRunner(Base):
     ) -> None:
         """Runs the provided command string using the provided executor.
 
-        There are several executors that can be used: sh, bash, powershell and cmd
+        Any executor in the executor registry with a binary on the local system can be used.
+
+        The AWS CLI is located once per process and commands run with the configured
+        AWS profile and region.
 
         Args:
             executor (str): The executor to use when executing the provided command string.
             command (str): The command string to run.
             timeout (int, optional): Timeout when running a command. Defaults to 5.
             shell (bool, optional): Whether to spawn a new shell or not. Defaults to False.
-            env (dict, optional): Environment to use including environmental variables.. Defaults to os.environ.
+            env (dict, optional): Environment to use including environmental variables.. Defaults to the
+                current environment with the configured AWS profile and region.
             cwd (str, optional): The current working directory. Defaults to None.
+
+        Raises:
+            IncorrectExecutorError: Raised when the executor is not available on the local system.
         """
-        self.__logger.info("Checking for AWS CLI tools...")
-        self._run(executor=executor, command="aws --version", timeout=timeout, shell=shell, env=env, cwd=cwd)
-        self.__logger.info("AWS CLI tools found. Starting to run command...")
-        self._run(executor=executor, command=command, timeout=timeout, shell=shell, env=env, cwd=cwd)
+        _executor = EXECUTORS.path(executor, self.get_local_system_platform())
+        if not _executor:
+            raise IncorrectExecutorError(provided_executor=executor)
+        self._resolve_cli()
+        LocalRunner()._run(
+            executor=_executor,
+            arguments=[_executor],
+            command=command,
+            write_command=True,
+            timeout=timeout,
+            shell=shell,
+            env=env or self._get_env(),
+            cwd=cwd,
+            platform=self.get_local_system_platform(),
+        )
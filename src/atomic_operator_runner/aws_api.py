@@ -0,0 +1,114 @@
+"""Runs AWS API actions through botocore."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import json
+import threading
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from .base import Base
+from .capture import OutputCapture
+from .models import AWSAction
+from .processor import Processor
+from .utils.exceptions import BotocoreNotInstalledError
+
+
+class AWSAPIRunner(Base):
+    """Used to run AWS API actions without shelling out to the AWS CLI.
+
+    All actions share a single botocore session. Clients are created once per service, region and
+    endpoint so that HTTPS connections are pooled and reused across actions and threads.
+    """
+
+    MAX_POOL_CONNECTIONS = 50
+    MAX_ATTEMPTS = 3
+
+    _sessions: Dict[Optional[str], Any] = {}
+    _clients: Dict[Tuple[Optional[str], str, Optional[str], Optional[str]], Any] = {}
+    _lock = threading.Lock()
+
+    def _get_client(self, service: str) -> Any:
+        """Returns a cached botocore client for the provided service.
+
+        Botocore clients are thread safe but creating them is not, so creation happens under a lock.
+
+        Args:
+            service (str): The AWS service name, e.g. ec2 or s3.
+
+        Raises:
+            BotocoreNotInstalledError: Raised when botocore is not installed.
+
+        Returns:
+            Any: A botocore client.
+        """
+        key = (Base.config.aws_profile, service, Base.config.aws_region, Base.config.aws_endpoint_url)
+        client = AWSAPIRunner._clients.get(key)
+        if client is not None:
+            return client
+        try:
+            import botocore.session
+            from botocore.config import Config
+        except ImportError as e:
+            raise BotocoreNotInstalledError() from e
+        with AWSAPIRunner._lock:
+            client = AWSAPIRunner._clients.get(key)
+            if client is None:
+                session = AWSAPIRunner._sessions.get(Base.config.aws_profile)
+                if session is None:
+                    session = botocore.session.Session(profile=Base.config.aws_profile)
+                    AWSAPIRunner._sessions[Base.config.aws_profile] = session
+                self.__logger.debug(f"Creating botocore client for {service}.")
+                client = session.create_client(
+                    service,
+                    region_name=Base.config.aws_region,
+                    endpoint_url=Base.config.aws_endpoint_url,
+                    config=Config(
+                        max_pool_connections=self.MAX_POOL_CONNECTIONS,
+                        retries={"max_attempts": self.MAX_ATTEMPTS, "mode": "standard"},
+                    ),
+                )
+                AWSAPIRunner._clients[key] = client
+        return client
+
+    def run(self, action: AWSAction) -> None:
+        """Runs the provided AWS API action.
+
+        The return code follows the AWS CLI: 0 on success, 254 when the service returned an error
+        and 255 for any other failure.
+
+        Args:
+            action (AWSAction): The service, operation and parameters to call.
+        """
+        client = self._get_client(action.service)
+        from botocore import xform_name
+        from botocore.exceptions import ClientError
+
+        command = f"{action.service} {action.operation} {json.dumps(action.parameters, default=str)}"
+        output: Optional[str] = None
+        errors: Optional[str] = None
+        try:
+            self.__logger.info("Running AWS API action now.")
+            result = getattr(client, xform_name(action.operation.replace("-", "_")))(**action.parameters)
+            result.pop("ResponseMetadata", None)
+            output = json.dumps(result, indent=4, default=str)
+            return_code = 0
+        except ClientError as e:
+            error = e.response.get("Error", {})
+            errors = f"{error.get('Code')}: {error.get('Message')}"
+            return_code = 254
+        except Exception as e:
+            errors = f"{type(e).__name__}: {e}"
+            return_code = 255
+        capture = OutputCapture(max_size=Base.config.max_output_size)
+        capture.write(output or "")
+        output, output_file = capture.close()
+        Processor(
+            command=command,
+            executor="botocore",
+            return_code=return_code,
+            output=output,
+            errors=errors,
+            output_file=output_file,
+        )
@@ -3,38 +3,113 @@
 # MIT License (see LICENSE or https://opensource.org/licenses/MIT)
 import inspect
 import platform
+import threading
+from contextlib import contextmanager
 from typing import Dict
+from typing import Iterator
+from typing import Optional
 
+from pydantic import BaseModel
+
+from .executors import EXECUTORS
 from .models import Host
 from .models import RunnerResponse
 from .utils.logger import LoggingBase
 
 
-class Base(metaclass=LoggingBase):
+class _ExecutionContext(threading.local):
+    """Per-thread configuration and response used while executing concurrently."""
+
+    bound = False
+    config: Optional[Host] = None
+    response: Optional[RunnerResponse] = None
+
+
+_context = _ExecutionContext()
+_shared: Dict[str, Optional[BaseModel]] = {"config": None, "response": RunnerResponse()}
+
+
+def _get_context_value(name: str) -> Optional[BaseModel]:
+    """Returns the value bound to the current thread, falling back to the process wide value."""
+    if _context.bound:
+        return getattr(_context, name)
+    return _shared[name]
+
+
+def _set_context_value(name: str, value: Optional[BaseModel]) -> None:
+    """Sets the value for the current thread when it is bound, otherwise the process wide value."""
+    if _context.bound:
+        setattr(_context, name, value)
+    else:
+        _shared[name] = value
+
+
+class ExecutionContextBase(LoggingBase):
+    """Metaclass which resolves Base.config and Base.response through the current execution context."""
+
+    @property
+    def config(cls) -> Host:
+        """The host configuration of the current execution."""
+        return _get_context_value("config")
+
+    @config.setter
+    def config(cls, value: Host) -> None:
+        _set_context_value("config", value)
+
+    @property
+    def response(cls) -> RunnerResponse:
+        """The response of the current execution."""
+        return _get_context_value("response")
+
+    @response.setter
+    def response(cls, value: RunnerResponse) -> None:
+        _set_context_value("response", value)
+
+
+class Base(metaclass=ExecutionContextBase):
     """Base class to all other classes within this project."""
 
-    COMMAND_MAP: Dict[str, Dict[str, str]] = {
-        "command_prompt": {
-            "windows": "C:\\Windows\\System32\\cmd.exe",
-            "linux": "/bin/sh",
-            "macos": "/bin/sh",
-            "default": "/bin/sh",
-        },
-        "powershell": {"windows": "C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe"},
-        "sh": {"linux": "/bin/sh", "macos": "/bin/sh"},
-        "bash": {"linux": "/bin/bash", "macos": "/bin/bash"},
-    }
-    ELEVATION_COMMAND_MAP: Dict[str, str] = {
-        "powershell": "Start-Process PowerShell -Verb RunAs;",
-        "cmd": "cmd.exe /c",
-        "command_prompt": "cmd.exe /c",
-        "sh": "sudo",
-        "bash": "sudo",
-        "ssh": "sudo",
-    }
-
-    config: Host
-    response: RunnerResponse = RunnerResponse()
+    # views of the executor registry, which stay current as executors are registered
+    COMMAND_MAP: Dict[str, Dict[str, str]] = EXECUTORS.command_map
+    ELEVATION_COMMAND_MAP: Dict[str, str] = EXECUTORS.elevation_map
+
+    config = property(
+        lambda self: type(self).config,
+        lambda self, value: setattr(Base, "config", value),
+        doc="The host configuration of the current execution.",
+    )
+    response = property(
+        lambda self: type(self).response,
+        lambda self, value: setattr(Base, "response", value),
+        doc="The response of the current execution.",
+    )
+
+    @staticmethod
+    @contextmanager
+    def execution_context(
+        config: Optional[Host] = None, response: Optional[RunnerResponse] = None
+    ) -> Iterator[RunnerResponse]:
+        """Gives the current thread its own config and response for the duration of the block.
+
+        Executions running concurrently in other threads each need their own context so they do not
+        overwrite each other's host configuration or response.
+
+        Args:
+            config (Host, optional): The host configuration to use. Defaults to the current configuration.
+            response (RunnerResponse, optional): The response to populate. Defaults to a new RunnerResponse.
+
+        Yields:
+            RunnerResponse: The response populated by executions within the block.
+        """
+        previous = (_context.bound, _context.config, _context.response)
+        config = config or Base.config
+        _context.bound = True
+        _context.config = config
+        _context.response = response or RunnerResponse()
+        try:
+            yield _context.response
+        finally:
+            _context.bound, _context.config, _context.response = previous
 
     def get_local_system_platform(self) -> str:
         """Identifies the local systems operating system platform.
@@ -50,16 +125,18 @@ class Base(metaclass=LoggingBase):
     def log(self, val, level="info") -> None:
         """Used to centralize logging across components.
 
-        We identify the source of the logging class by inspecting the calling stack.
+        We identify the source of the logging class by inspecting the calling frame.
 
         Args:
             val (str): The log value string to output.
             level (str, optional): The log level. Defaults to "info".
         """
         component = None
-        parent = inspect.stack()[1][0].f_locals.get("self", None)
+        # only the calling frame is needed; inspect.stack() would read source files for every frame
+        parent = inspect.currentframe().f_back.f_locals.get("self", None)
         component = parent.__class__.__name__
         try:
             getattr(getattr(parent, f"_{component}__logger"), level)(val)
-        except AttributeError as ae:
-            getattr(self.__logger, level)(val + ae)
+        except AttributeError:
+            # callers without a class logger of their own (e.g. exceptions) log through Base
+            getattr(self.__logger, level)(val)
@@ -0,0 +1,162 @@
+"""Cancels executions which are in flight."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import os
+import signal
+import subprocess
+import threading
+from contextlib import contextmanager
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+from .base import Base
+
+
+class CancellationToken(Base):
+    """Signals the executions it is passed to that they should stop.
+
+    One token can be passed to any number of executions, e.g. every command of Runner.run_many, so
+    that a whole sweep stops at once. While a command runs, the runner registers a callback which
+    interrupts it: local processes are killed with their children, SSH channels are closed, PowerShell
+    pipelines are stopped and WinRS commands are terminated. Executions which have not started yet are
+    not ran. Every cancelled execution returns the output received so far in a response whose
+    cancelled attribute is set.
+    """
+
+    # the number of seconds a PowerShell or WinRS command is polled for before the token is checked again
+    POLL_INTERVAL = 1
+
+    def __init__(self) -> None:
+        """Creates a token which is not cancelled."""
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether or not cancel has been called."""
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        """Cancels the executions using this token and interrupts the commands which are running."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        self.__logger.info(f"Cancelling {len(callbacks)} running commands.")
+        for callback in callbacks:
+            self._call(callback)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the token is cancelled.
+
+        Args:
+            timeout (float, optional): The number of seconds to wait. Defaults to None, which waits forever.
+
+        Returns:
+            bool: True when the token was cancelled.
+        """
+        return self._event.wait(timeout)
+
+    @contextmanager
+    def on_cancel(self, callback: Callable[[], None]) -> Iterator[None]:
+        """Calls the provided callback when the token is cancelled while the block runs.
+
+        The callback is called right away when the token is already cancelled.
+
+        Args:
+            callback (Callable[[], None]): Interrupts the running command. It is called from the thread
+                calling cancel.
+        """
+        with self._lock:
+            cancelled = self._event.is_set()
+            if not cancelled:
+                self._callbacks.append(callback)
+        if cancelled:
+            self._call(callback)
+        try:
+            yield
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+
+    def _call(self, callback: Callable[[], None]) -> None:
+        """Calls the provided callback, logging instead of raising its errors."""
+        try:
+            callback()
+        except Exception as e:
+            self.__logger.debug(f"Unable to interrupt a running command. {e}")
+
+
+def kill_process_tree(process: subprocess.Popen) -> None:
+    """Kills the provided process and the processes it started.
+
+    On Linux and macOS the process has to be the leader of its own session, i.e. started with
+    start_new_session, so that its whole process group is killed.
+
+    Args:
+        process (subprocess.Popen): The process to kill.
+    """
+    if process.poll() is not None:
+        return
+    if os.name == "nt":
+        subprocess.run(  # noqa: S603,S607
+            ["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True, check=False
+        )
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            process.kill()
+
+
+def invoke_powershell(powershell: Any, cancellation: Optional[CancellationToken] = None) -> List[Any]:
+    """Invokes the provided pypsrp PowerShell pipeline, stopping it when the token is cancelled.
+
+    The pipeline is polled on the calling thread, since the WSMan connection of its runspace pool
+    cannot be used from the thread calling cancel.
+
+    Args:
+        powershell (PowerShell): The pipeline to invoke.
+        cancellation (CancellationToken, optional): Stops the pipeline when cancelled. Defaults to None.
+
+    Returns:
+        List[Any]: The output objects received before the pipeline completed or was stopped.
+    """
+    from pypsrp.complex_objects import PSInvocationState
+
+    if cancellation is None:
+        return powershell.invoke()
+    powershell.begin_invoke()
+    while powershell.state == PSInvocationState.RUNNING:
+        if cancellation.cancelled:
+            powershell.stop()
+            break
+        powershell.poll_invoke(timeout=CancellationToken.POLL_INTERVAL)
+    return powershell.output
+
+
+def invoke_process(process: Any, cancellation: Optional[CancellationToken] = None) -> None:
+    """Invokes the provided pypsrp WinRS process, terminating it when the token is cancelled.
+
+    Args:
+        process (Process): The WinRS process to invoke.
+        cancellation (CancellationToken, optional): Terminates the process when cancelled. Defaults to None.
+    """
+    from pypsrp.shell import CommandState
+    from pypsrp.shell import SignalCode
+
+    if cancellation is None:
+        process.invoke()
+        return
+    process.begin_invoke()
+    while process.state != CommandState.DONE:
+        if cancellation.cancelled:
+            process.signal(SignalCode.TERMINATE)
+            break
+        process.poll_invoke(timeout=CancellationToken.POLL_INTERVAL)
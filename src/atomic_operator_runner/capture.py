@@ -0,0 +1,234 @@
+"""Bounded-memory capture of command output."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import codecs
+import locale
+import os
+import tempfile
+import time
+import zlib
+from typing import IO
+from typing import Any
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from .base import Base
+from .models import OutputFile
+from .watch import OutputScanner
+
+
+def get_console_encoding(platform: Optional[str], executor: Optional[str] = None) -> str:
+    """Returns the encoding command output is expected in when it is not UTF-8.
+
+    Windows consoles write cmd output in the OEM code page (e.g. cp437) and PowerShell output in the
+    ANSI code page (e.g. cp1252). Other platforms are expected to write UTF-8.
+
+    Args:
+        platform (str): The platform the command ran on.
+        executor (str, optional): The executor the command ran with. Defaults to None.
+
+    Returns:
+        str: The name of the encoding.
+    """
+    if platform != "windows":
+        return "utf-8"
+    if executor and ("cmd" in executor.lower() or executor == "command_prompt"):
+        if os.name == "nt":
+            import ctypes
+
+            return f"cp{ctypes.windll.kernel32.GetOEMCP()}"  # type: ignore[attr-defined]
+        return "cp437"
+    if os.name == "nt":
+        return locale.getpreferredencoding(False)
+    return "cp1252"
+
+
+class OutputCapture(Base):
+    """Collects command output in memory up to a limit and spills anything larger to a temporary file.
+
+    Output is kept as raw bytes until the capture is closed, where it is decoded exactly once. UTF-8 is
+    tried first and the fallback encoding is used when the output is not valid UTF-8. Output is also
+    fed to the OutputScanner which is active on the thread creating the capture, if any.
+    """
+
+    CHUNK_SIZE = 65536
+    GZIP_MAGIC = b"\x1f\x8b"
+
+    def __init__(
+        self,
+        max_size: int = 10485760,
+        preview_size: int = 4096,
+        encoding: Optional[str] = None,
+        fallback_encoding: str = "utf-8",
+    ) -> None:
+        """Captures output written in chunks without holding more than max_size bytes in memory.
+
+        Args:
+            max_size (int, optional): The maximum number of bytes kept in memory. Defaults to 10485760 (10MB).
+            preview_size (int, optional): The size of the head and tail previews of spilled output. Defaults to 4096.
+            encoding (str, optional): The encoding of the output. Defaults to None (detected).
+            fallback_encoding (str, optional): The encoding used when detected output is not valid UTF-8.
+                Defaults to "utf-8".
+        """
+        self.max_size = max_size
+        self.preview_size = preview_size
+        self.encoding = encoding
+        self.fallback_encoding = fallback_encoding
+        self.size = 0
+        self.transfer_size = 0
+        self.transfer_time = 0.0
+        self._buffer = bytearray()
+        self._file: Optional[IO[bytes]] = None
+        self._head = bytearray()
+        self._tail = b""
+        self._decoder: Optional[Any] = None
+        self._passthrough = False
+        self._closed = False
+        self._scanner = OutputScanner.current()
+
+    @property
+    def spilled(self) -> bool:
+        """Whether or not the captured output has been written to disk."""
+        return self._file is not None
+
+    def write(self, data: Union[str, bytes, bytearray, memoryview]) -> None:
+        """Adds a chunk of output to the capture.
+
+        Args:
+            data (Union[str, bytes, bytearray, memoryview]): The output chunk.
+        """
+        if not data or self._closed:
+            # a reader which outlived the capture, e.g. of a killed command, has nothing left to add
+            return
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+            if self.encoding is None:
+                self.encoding = "utf-8"
+        size = len(data)
+        if len(self._head) < self.preview_size:
+            self._head += data[: self.preview_size - len(self._head)]
+        if size >= self.preview_size:
+            self._tail = bytes(data[-self.preview_size :])
+        else:
+            self._tail = (self._tail + data)[-self.preview_size :]
+        self.size += size
+        if self._file is None and self.size > self.max_size:
+            self.__logger.debug(f"Output exceeded {self.max_size} bytes. Spilling to disk.")
+            self._file = tempfile.NamedTemporaryFile(prefix="atomic-operator-runner-", suffix=".out", delete=False)
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._buffer += data
+        if self._scanner is not None:
+            self._scanner.feed(data)
+
+    def write_compressed(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        """Adds a chunk of gzip compressed output to the capture, decompressing it as it arrives.
+
+        Output which does not start with the gzip magic bytes is captured as is. Decompressed data is
+        produced in chunks, so highly compressed output never needs to fit in memory at once.
+
+        Args:
+            data (Union[bytes, bytearray, memoryview]): The compressed output chunk.
+        """
+        data = bytes(data)
+        if self._passthrough:
+            self.write(data)
+            return
+        if self._decoder is None:
+            if self.size == 0 and data and not data.startswith(self.GZIP_MAGIC[: len(data)]):
+                self._passthrough = True
+                self.write(data)
+                return
+            self._decoder = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        while True:
+            output = self._decoder.decompress(data, self.CHUNK_SIZE)
+            self.write(output)
+            if self._decoder.eof:
+                # gzip allows several members one after another
+                data = self._decoder.unused_data
+                self._decoder = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+                if not data:
+                    break
+                continue
+            data = self._decoder.unconsumed_tail
+            # a full chunk may leave more output pending even when all input was consumed
+            if not data and len(output) < self.CHUNK_SIZE:
+                break
+
+    def consume(self, stream: Any, compressed: bool = False) -> int:
+        """Reads the provided file-like stream until it is exhausted.
+
+        Streams supporting readinto1 or readinto are read into a single reused buffer. The bytes read after
+        the first chunk and the time taken to read them are kept in transfer_size and transfer_time, so
+        that the time the command took to write its first output is not counted as transfer time.
+
+        Args:
+            stream (Any): A file-like object with a read method (e.g. a pipe or paramiko ChannelFile).
+            compressed (bool, optional): Whether or not the stream is gzip compressed. Defaults to False.
+
+        Returns:
+            int: The number of bytes read from the stream.
+        """
+        write = self.write_compressed if compressed else self.write
+        received = 0
+        first: Optional[Tuple[int, float]] = None
+        readinto = getattr(stream, "readinto1", None) or getattr(stream, "readinto", None)
+        if readinto is None:
+            chunk = stream.read(self.CHUNK_SIZE)
+            while chunk:
+                first = first or (len(chunk), time.monotonic())
+                received += len(chunk)
+                write(chunk)
+                chunk = stream.read(self.CHUNK_SIZE)
+        else:
+            view = memoryview(bytearray(self.CHUNK_SIZE))
+            count = readinto(view)
+            while count:
+                first = first or (count, time.monotonic())
+                received += count
+                write(view[:count])
+                count = readinto(view)
+        if first is not None:
+            self.transfer_size = received - first[0]
+            self.transfer_time = time.monotonic() - first[1]
+        return received
+
+    def _detect_encoding(self, sample: Union[bytes, bytearray]) -> str:
+        """Chooses UTF-8 when the provided sample decodes as UTF-8, otherwise the fallback encoding."""
+        if self.encoding:
+            return self.encoding
+        try:
+            # a multi-byte character may be cut off at the end of the sample, which is not an error here
+            codecs.getincrementaldecoder("utf-8")().decode(sample, final=len(sample) < self.preview_size)
+            return "utf-8"
+        except UnicodeDecodeError:
+            return self.fallback_encoding
+
+    def close(self) -> Tuple[Optional[str], Optional[OutputFile]]:
+        """Finishes the capture.
+
+        Returns:
+            Tuple[Optional[str], Optional[OutputFile]]: The output string when it fit in memory,
+                otherwise a reference to the spilled output file, which the caller has to remove.
+        """
+        self._closed = True
+        if self._file is None:
+            if self.encoding:
+                return self._buffer.decode(self.encoding, "replace"), None
+            try:
+                return self._buffer.decode("utf-8"), None
+            except UnicodeDecodeError:
+                return self._buffer.decode(self.fallback_encoding, "replace"), None
+        self._file.close()
+        encoding = self._detect_encoding(self._head)
+        return None, OutputFile(
+            path=self._file.name,
+            size=self.size,
+            encoding=encoding,
+            head=self._head.decode(encoding, "ignore"),
+            tail=self._tail.decode(encoding, "ignore"),
+        )
@@ -0,0 +1,102 @@
+"""Records completed executions so interrupted sweeps can be resumed."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import hashlib
+import json
+import os
+import threading
+from typing import Dict
+from typing import Optional
+
+from .base import Base
+from .models import RunnerResponse
+
+
+class CheckpointStore(Base):
+    """An append-only JSON lines file of completed executions.
+
+    Each line holds the key of a (host, command, executor) execution and its response. Lines are
+    flushed to disk as soon as an execution completes, so a sweep that is interrupted loses at most
+    the executions that were still running. A partially written last line is ignored on load.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Loads any executions already recorded in the provided file.
+
+        Args:
+            path (str): The path to the checkpoint file. It is created when it does not exist.
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self._responses: Dict[str, RunnerResponse] = {}
+        self._lock = threading.Lock()
+        self._partial_line = False
+        self._load()
+
+    @staticmethod
+    def key(hostname: Optional[str], command: str, executor: str) -> str:
+        """Returns the checkpoint key of an execution.
+
+        Args:
+            hostname (str): The host the command runs on. None for the local system.
+            command (str): The command string.
+            executor (str): The executor used to run the command.
+
+        Returns:
+            str: A sha256 hex digest identifying the execution.
+        """
+        data = json.dumps([hostname or "localhost", hashlib.sha256(command.encode("utf-8")).hexdigest(), executor])
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def _load(self) -> None:
+        """Reads previously recorded executions from disk."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for number, line in enumerate(f, start=1):
+                self._partial_line = not line.endswith("\n")
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    self._responses[entry["key"]] = RunnerResponse.parse_obj(entry["response"])
+                except (ValueError, KeyError, TypeError) as e:
+                    self.__logger.warning(f"Skipping unreadable checkpoint entry on line {number} of {self.path}. {e}")
+        self.__logger.info(f"Loaded {len(self._responses)} completed executions from {self.path}.")
+
+    def __contains__(self, key: str) -> bool:
+        """Whether or not the execution with the provided key has completed."""
+        return key in self._responses
+
+    def __len__(self) -> int:
+        """The number of completed executions."""
+        return len(self._responses)
+
+    def get(self, key: str) -> Optional[RunnerResponse]:
+        """Returns the recorded response of a completed execution.
+
+        Args:
+            key (str): The checkpoint key of the execution.
+
+        Returns:
+            Optional[RunnerResponse]: The recorded response or None when the execution has not completed.
+        """
+        return self._responses.get(key)
+
+    def add(self, key: str, response: RunnerResponse) -> None:
+        """Records a completed execution.
+
+        Args:
+            key (str): The checkpoint key of the execution.
+            response (RunnerResponse): The response of the execution.
+        """
+        line = json.dumps({"key": key, "response": json.loads(response.json(by_alias=True))}) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                if self._partial_line:
+                    # never append to the remains of an interrupted write
+                    f.write("\n")
+                    self._partial_line = False
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._responses[key] = response
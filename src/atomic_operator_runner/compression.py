@@ -0,0 +1,119 @@
+"""Compresses command output on the remote host before it is transferred."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import threading
+from typing import Dict
+from typing import Optional
+
+from .base import Base
+
+
+class Compression(Base):
+    """Decides per host whether output is compressed and wraps commands to do so.
+
+    Host.compression is one of "off", "gzip" or "auto". In auto mode output is compressed once a
+    transfer from the host has been measured slower than Host.compression_threshold bytes per second.
+    Transfers are measured on SSH output streams from their first chunk on, so that the time a command
+    takes before writing output is not counted. PowerShell remoting returns output together with the
+    completion of the command, so its transfer time cannot be told apart from the runtime of the
+    command and is not measured.
+    """
+
+    OFF = "off"
+    GZIP = "gzip"
+    AUTO = "auto"
+    MODES = [OFF, GZIP, AUTO]
+    # transfers smaller than this finish too quickly to say anything about the link
+    MIN_SAMPLE_SIZE = 65536
+    SMOOTHING = 0.3
+
+    _bandwidth: Dict[str, float] = {}
+    _lock = threading.Lock()
+
+    def enabled(self) -> bool:
+        """Whether or not output from the configured host should be compressed.
+
+        Returns:
+            bool: True when the output should be compressed.
+        """
+        if Base.config.compression == self.GZIP:
+            return True
+        if Base.config.compression == self.AUTO:
+            bandwidth = self.bandwidth(Base.config.hostname)
+            return bandwidth is not None and bandwidth < Base.config.compression_threshold
+        return False
+
+    def bandwidth(self, hostname: Optional[str]) -> Optional[float]:
+        """Returns the measured transfer rate from the provided host in bytes per second.
+
+        Args:
+            hostname (str): The host to look up.
+
+        Returns:
+            Optional[float]: The smoothed transfer rate or None when nothing has been measured yet.
+        """
+        return Compression._bandwidth.get(hostname or "localhost")
+
+    def record(self, size: int, seconds: float) -> None:
+        """Records a transfer of the provided number of bytes from the configured host.
+
+        Args:
+            size (int): The number of bytes received, as sent over the wire.
+            seconds (float): The time taken to receive them.
+        """
+        if size < self.MIN_SAMPLE_SIZE or seconds <= 0:
+            return
+        key = Base.config.hostname or "localhost"
+        with Compression._lock:
+            previous = Compression._bandwidth.get(key)
+            current = size / seconds
+            if previous is not None:
+                current = self.SMOOTHING * current + (1 - self.SMOOTHING) * previous
+            Compression._bandwidth[key] = current
+
+    @staticmethod
+    def wrap_posix(command: str) -> str:
+        """Wraps a shell command so that its stdout is gzip compressed, keeping its exit status.
+
+        The command runs unchanged when gzip is not available on the remote host. Output is only
+        decompressed when it starts with the gzip magic bytes, so both cases are handled on receipt.
+
+        Args:
+            command (str): The command string to wrap.
+
+        Returns:
+            str: The wrapped command string.
+        """
+        return (
+            f"atomic_operator_runner_command() (\n{command}\n)\n"
+            "if command -v gzip >/dev/null 2>&1; then\n"
+            "exec 4>&1\n"
+            "rc=$( { { atomic_operator_runner_command; echo $? >&3; } | gzip -c >&4; } 3>&1 )\n"
+            'exit "$rc"\n'
+            "fi\n"
+            "atomic_operator_runner_command"
+        )
+
+    @staticmethod
+    def wrap_powershell(command: str) -> str:
+        """Wraps a PowerShell script so that its output is returned as base64 encoded gzip data.
+
+        The output is formatted with Out-String before it is compressed. Error and other streams are
+        returned as usual.
+
+        Args:
+            command (str): The script to wrap.
+
+        Returns:
+            str: The wrapped script.
+        """
+        return (
+            f"$atomicOperatorRunnerOutput = & {{\n{command}\n}} | Out-String\n"
+            "$atomicOperatorRunnerBytes = [System.Text.Encoding]::UTF8.GetBytes($atomicOperatorRunnerOutput)\n"
+            "$atomicOperatorRunnerStream = New-Object System.IO.MemoryStream\n"
+            "$atomicOperatorRunnerGzip = New-Object System.IO.Compression.GZipStream("
+            "$atomicOperatorRunnerStream, [System.IO.Compression.CompressionMode]::Compress)\n"
+            "$atomicOperatorRunnerGzip.Write($atomicOperatorRunnerBytes, 0, $atomicOperatorRunnerBytes.Length)\n"
+            "$atomicOperatorRunnerGzip.Close()\n"
+            "[System.Convert]::ToBase64String($atomicOperatorRunnerStream.ToArray())"
+        )
@@ -0,0 +1,550 @@
+"""Shares authenticated SSH transports and WinRM clients between executions."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import atexit
+import select
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from paramiko.agent import AgentRequestHandler
+from paramiko.channel import Channel
+from paramiko.channel import ChannelFile
+from paramiko.client import AutoAddPolicy
+from paramiko.client import SSHClient
+from paramiko.transport import Transport
+from pypsrp.client import Client
+from pypsrp.shell import WinRS
+
+from .base import Base
+from .credentials import CredentialCache
+from .health import HostHealth
+
+
+class RateLimiter:
+    """Token bucket limiting how many new connections are opened per second.
+
+    While a limiter is active on a thread, every SSH transport, WinRM client and WinRS shell opened
+    from that thread takes a token first. Connections reused from the pools do not.
+    """
+
+    _active = threading.local()
+
+    def __init__(self, rate: float, burst: Optional[int] = None) -> None:
+        """Limits calls to acquire to the provided rate.
+
+        Args:
+            rate (float): The number of acquisitions allowed per second. 0 disables the limit.
+            burst (int, optional): The number of acquisitions allowed at once. Defaults to the rate.
+        """
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Blocks until a token is available."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    @staticmethod
+    def current() -> Optional["RateLimiter"]:
+        """Returns the limiter active on the current thread or None."""
+        return getattr(RateLimiter._active, "limiter", None)
+
+    @contextmanager
+    def activate(self) -> Iterator["RateLimiter"]:
+        """Makes this the limiter of the connections opened by the current thread for the duration of the block."""
+        previous = RateLimiter.current()
+        RateLimiter._active.limiter = self
+        try:
+            yield self
+        finally:
+            RateLimiter._active.limiter = previous
+
+    @staticmethod
+    def throttle() -> None:
+        """Blocks until the limiter active on the current thread, if any, allows a new connection."""
+        limiter = RateLimiter.current()
+        if limiter is not None:
+            limiter.acquire()
+
+
+class Tunnel(Base):
+    """Forwards connections made to a local port through a bastion to a target host and port.
+
+    Used for protocols which open their own sockets (e.g. WinRM through requests). Every accepted
+    connection becomes a direct-tcpip channel on the shared bastion transport.
+    """
+
+    BUFFER_SIZE = 32768
+
+    def __init__(self, open_channel: Callable[[], Channel]) -> None:
+        """Starts listening on an ephemeral port of the loopback interface.
+
+        Args:
+            open_channel (Callable[[], Channel]): Opens a new channel to the target through the bastion.
+        """
+        self._open_channel = open_channel
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.bind(("127.0.0.1", 0))
+        self._server.listen(16)
+        self.port = self._server.getsockname()[1]
+        self._closed = False
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self) -> None:
+        """Accepts local connections until the tunnel is closed."""
+        while not self._closed:
+            try:
+                connection, _address = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._forward, args=(connection,), daemon=True).start()
+
+    def _forward(self, connection: socket.socket) -> None:
+        """Copies data between a local connection and a new channel until either side closes."""
+        try:
+            channel = self._open_channel()
+        except Exception as e:
+            self.__logger.warning(f"Unable to open a channel through the bastion. {e}")
+            connection.close()
+            return
+        try:
+            while True:
+                readable, _writable, _errored = select.select([connection, channel], [], [])
+                if connection in readable:
+                    data = connection.recv(self.BUFFER_SIZE)
+                    if not data:
+                        break
+                    channel.sendall(data)
+                if channel in readable:
+                    data = channel.recv(self.BUFFER_SIZE)
+                    if not data:
+                        break
+                    connection.sendall(data)
+        except OSError as e:
+            self.__logger.debug(f"Tunnel connection closed. {e}")
+        finally:
+            channel.close()
+            connection.close()
+
+    def close(self) -> None:
+        """Stops accepting connections."""
+        self._closed = True
+        self._server.close()
+
+
+class SSHConnectionPool(Base):
+    """Keeps one authenticated SSH transport per host and multiplexes executions over it as channels.
+
+    Every execution against a host opens its own channel on the shared transport, so concurrent
+    executions only pay for a single handshake. The number of channels open at once is limited by
+    Host.max_channels, which should not exceed the MaxSessions setting of the SSH server.
+
+    When a bastion is configured, a single authenticated connection to the bastion is shared by all
+    targets behind it. SSH targets are reached over a direct-tcpip channel of the bastion transport
+    and other protocols through a local Tunnel.
+    """
+
+    KEEPALIVE_INTERVAL = 30
+
+    _clients: Dict[Tuple[Any, ...], SSHClient] = {}
+    _tunnels: Dict[Tuple[Any, ...], Tunnel] = {}
+    _connect_locks: Dict[Tuple[Any, ...], threading.Lock] = {}
+    _channel_limits: Dict[Tuple[Any, ...], Tuple[int, threading.BoundedSemaphore]] = {}
+    _lock = threading.Lock()
+    _registered = False
+
+    def _key(self) -> Tuple[Any, ...]:
+        """Returns the pool key of the configured host."""
+        return Base.config.hostname, Base.config.ssh_port, Base.config.username, self._bastion_key()
+
+    def _bastion_key(self) -> Optional[Tuple[Any, ...]]:
+        """Returns the pool key of the configured bastion or None when there is no bastion."""
+        if not Base.config.bastion_hostname:
+            return None
+        return "bastion", Base.config.bastion_hostname, Base.config.bastion_port, self._bastion_username()
+
+    def _bastion_username(self) -> Optional[str]:
+        """The username for the bastion, which defaults to the username for the target."""
+        return Base.config.bastion_username or Base.config.username
+
+    def _connect(
+        self,
+        hostname: Optional[str],
+        port: int,
+        username: Optional[str],
+        password: Optional[str],
+        ssh_key_path: Optional[str],
+        private_key_string: Optional[str],
+        sock: Optional[Channel] = None,
+    ) -> SSHClient:
+        """Creates and authenticates a paramiko client.
+
+        Args:
+            hostname (str): The host to connect to.
+            port (int): The SSH port of the host.
+            username (str): The username to authenticate with.
+            password (str): The password to authenticate with.
+            ssh_key_path (str): A path to a private key to authenticate with.
+            private_key_string (str): A private key string to authenticate with.
+            sock (Channel, optional): An open channel to use instead of a new socket. Defaults to None.
+
+        Returns:
+            SSHClient: The connected client.
+        """
+        _client = SSHClient()
+        _client.set_missing_host_key_policy(AutoAddPolicy())
+        # keys are parsed once per process instead of on every connection
+        pkey = None
+        if ssh_key_path:
+            pkey = CredentialCache().load_key_file(ssh_key_path, passphrase=Base.config.ssh_key_passphrase)
+        elif private_key_string:
+            pkey = CredentialCache().load_key_string(private_key_string, passphrase=Base.config.ssh_key_passphrase)
+        if pkey or password or Base.config.allow_agent:
+            _client.connect(
+                hostname,
+                port=port,
+                username=username,
+                pkey=pkey,
+                password=None if pkey else password,
+                allow_agent=Base.config.allow_agent,
+                look_for_keys=pkey is None and Base.config.allow_agent,
+                timeout=Base.config.ssh_timeout,
+                sock=sock,
+            )
+        transport = _client.get_transport()
+        if transport is not None:
+            transport.set_keepalive(self.KEEPALIVE_INTERVAL)
+        return _client
+
+    @staticmethod
+    def _is_active(client: SSHClient) -> bool:
+        """Whether or not the transport of the provided client can still open channels."""
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def _get_pooled(self, key: Tuple[Any, ...], connect: Callable[[], SSHClient]) -> SSHClient:
+        """Returns the pooled client with the provided key, connecting when there is no usable transport."""
+        client = SSHConnectionPool._clients.get(key)
+        if client is not None and self._is_active(client):
+            return client
+        with SSHConnectionPool._lock:
+            connect_lock = SSHConnectionPool._connect_locks.setdefault(key, threading.Lock())
+            if not SSHConnectionPool._registered:
+                atexit.register(SSHConnectionPool.close_all)
+                SSHConnectionPool._registered = True
+        # only one thread performs the handshake, the others wait for and reuse its transport
+        with connect_lock:
+            client = SSHConnectionPool._clients.get(key)
+            if client is None or not self._is_active(client):
+                if client is not None:
+                    client.close()
+                RateLimiter.throttle()
+                client = connect()
+                SSHConnectionPool._clients[key] = client
+        return client
+
+    def get_bastion_transport(self) -> Transport:
+        """Returns the shared transport of the configured bastion.
+
+        Returns:
+            Transport: An authenticated paramiko transport.
+        """
+
+        def _connect_bastion() -> SSHClient:
+            self.__logger.debug(f"Opening SSH transport to bastion '{Base.config.bastion_hostname}'.")
+            if Base.config.bastion_password or Base.config.bastion_ssh_key_path:
+                credentials = (Base.config.bastion_password, Base.config.bastion_ssh_key_path, None)
+            else:
+                # without credentials of its own the bastion is authenticated like the target
+                credentials = (Base.config.password, Base.config.ssh_key_path, Base.config.private_key_string)
+            return self._connect(
+                Base.config.bastion_hostname, Base.config.bastion_port, self._bastion_username(), *credentials
+            )
+
+        return self._get_pooled(self._bastion_key(), _connect_bastion).get_transport()
+
+    def open_bastion_channel(self, port: int) -> Channel:
+        """Opens a direct-tcpip channel through the configured bastion to the configured host.
+
+        Args:
+            port (int): The port on the configured host.
+
+        Returns:
+            Channel: A channel connected to the port on the configured host.
+        """
+        return self.get_bastion_transport().open_channel(
+            "direct-tcpip", (Base.config.hostname, port), ("127.0.0.1", 0), timeout=Base.config.ssh_timeout
+        )
+
+    def get_tunnel_port(self, port: int) -> int:
+        """Returns a local port forwarded through the configured bastion to the configured host.
+
+        Args:
+            port (int): The port on the configured host.
+
+        Returns:
+            int: The port on 127.0.0.1 which reaches the port on the configured host.
+        """
+        key = ("tunnel", Base.config.hostname, port, self._bastion_key())
+        # connecting first lets authentication errors surface here instead of on the tunnel thread
+        self.get_bastion_transport()
+        with SSHConnectionPool._lock:
+            tunnel = SSHConnectionPool._tunnels.get(key)
+            if tunnel is None:
+                config = Base.config
+
+                def _open_channel() -> Channel:
+                    # connections are accepted on the tunnel thread, which has no execution context of its own
+                    with self.execution_context(config=config):
+                        return self.open_bastion_channel(port)
+
+                tunnel = Tunnel(open_channel=_open_channel)
+                SSHConnectionPool._tunnels[key] = tunnel
+                self.__logger.debug(
+                    f"Forwarding 127.0.0.1:{tunnel.port} to '{Base.config.hostname}:{port}' through the bastion."
+                )
+        return tunnel.port
+
+    def get_client(self) -> SSHClient:
+        """Returns the shared client of the configured host, connecting when there is no usable transport.
+
+        Returns:
+            SSHClient: An authenticated paramiko client.
+        """
+
+        def _connect_target() -> SSHClient:
+            self.__logger.debug(f"Opening SSH transport to '{Base.config.hostname}'.")
+            return self._connect(
+                hostname=Base.config.hostname,
+                port=Base.config.ssh_port,
+                username=Base.config.username,
+                password=Base.config.password,
+                ssh_key_path=Base.config.ssh_key_path,
+                private_key_string=Base.config.private_key_string,
+                sock=self.open_bastion_channel(Base.config.ssh_port) if Base.config.bastion_hostname else None,
+            )
+
+        return self._get_pooled(self._key(), _connect_target)
+
+    def exec_command(self, client: SSHClient, command: str) -> Tuple[ChannelFile, ChannelFile, ChannelFile]:
+        """Runs the provided command on a new channel of the provided client.
+
+        When Host.forward_agent is set, requests from the remote host to the SSH agent are
+        forwarded to the local agent for the lifetime of the channel.
+
+        Args:
+            client (SSHClient): The client to open the channel on.
+            command (str): The command string to run.
+
+        Returns:
+            Tuple[ChannelFile, ChannelFile, ChannelFile]: The stdin, stdout and stderr of the command.
+        """
+        if not Base.config.forward_agent:
+            return client.exec_command(command=command)
+        channel = client.get_transport().open_session(timeout=Base.config.ssh_timeout)
+        AgentRequestHandler(channel)
+        channel.exec_command(command)
+        return channel.makefile_stdin("wb"), channel.makefile("r"), channel.makefile_stderr("r")
+
+    @contextmanager
+    def session(self) -> Iterator[SSHClient]:
+        """Reserves one of the channels of the configured host.
+
+        Yields:
+            SSHClient: The shared client to open the channel on.
+        """
+        key = self._key()
+        size = max(1, Base.config.max_channels)
+        with SSHConnectionPool._lock:
+            current = SSHConnectionPool._channel_limits.get(key)
+            if current is None or current[0] != size:
+                # channels reserved under an earlier limit are released to the semaphore they were taken from
+                current = size, threading.BoundedSemaphore(size)
+                SSHConnectionPool._channel_limits[key] = current
+            limit = current[1]
+        with limit:
+            client = self.get_client()
+            try:
+                yield client
+            except Exception:
+                if not self._is_active(client):
+                    self.close(client=client)
+                raise
+
+    def close(self, client: Optional[SSHClient] = None) -> None:
+        """Closes the shared client of the configured host.
+
+        Args:
+            client (SSHClient, optional): Only close the pooled client when it is this client. Defaults to None.
+        """
+        key = self._key()
+        with SSHConnectionPool._lock:
+            pooled = SSHConnectionPool._clients.get(key)
+            if pooled is None or (client is not None and pooled is not client):
+                return
+            del SSHConnectionPool._clients[key]
+        pooled.close()
+
+    @staticmethod
+    def close_all() -> None:
+        """Closes every pooled client and tunnel."""
+        with SSHConnectionPool._lock:
+            clients = list(SSHConnectionPool._clients.values())
+            tunnels = list(SSHConnectionPool._tunnels.values())
+            SSHConnectionPool._clients.clear()
+            SSHConnectionPool._tunnels.clear()
+        for tunnel in tunnels:
+            tunnel.close()
+        # targets are closed before the bastions their channels run through
+        for client in reversed(clients):
+            client.close()
+
+
+class WinRMClientPool(Base):
+    """Keeps authenticated WinRM clients of each host for reuse.
+
+    A pypsrp client authenticates on its first request and keeps its connection open afterwards. Its
+    message encryption is not safe to share between concurrent requests, so each client is used by
+    one execution at a time and returned to the pool when the execution is done.
+    """
+
+    _idle: Dict[Tuple[Any, ...], List[Client]] = {}
+    _lock = threading.Lock()
+    _registered = False
+
+    def _key(self) -> Tuple[Any, ...]:
+        """Returns the pool key of the configured host."""
+        return (
+            Base.config.hostname,
+            Base.config.username,
+            Base.config.verify_ssl,
+            SSHConnectionPool()._bastion_key(),
+        )
+
+    @contextmanager
+    def session(self, connect: Callable[[], Client]) -> Iterator[Client]:
+        """Checks out an idle client of the configured host, creating one when none is idle.
+
+        Args:
+            connect (Callable[[], Client]): Creates a new client for the configured host.
+
+        Yields:
+            Client: A client used by no other execution.
+        """
+        key = self._key()
+        with WinRMClientPool._lock:
+            if not WinRMClientPool._registered:
+                atexit.register(WinRMClientPool.close_all)
+                WinRMClientPool._registered = True
+            idle = WinRMClientPool._idle.setdefault(key, [])
+            client = idle.pop() if idle else None
+        if client is None:
+            RateLimiter.throttle()
+            client = connect()
+        try:
+            yield client
+        except Exception:
+            # a client which raised may have lost its authenticated connection
+            client.wsman.close()
+            raise
+        with WinRMClientPool._lock:
+            WinRMClientPool._idle.setdefault(key, []).append(client)
+
+    @staticmethod
+    def close_all() -> None:
+        """Closes every idle client."""
+        with WinRMClientPool._lock:
+            clients = [client for idle in WinRMClientPool._idle.values() for client in idle]
+            WinRMClientPool._idle.clear()
+        for client in clients:
+            client.wsman.close()
+
+
+class WinRSShellPool(Base):
+    """Keeps open WinRS shells of each host for reuse by cmd commands.
+
+    Client.execute_cmd creates and deletes a shell for every command. A pooled shell is created once
+    and runs one command at a time, so a command only costs the command, receive and signal round
+    trips. Every shell has a client of its own, since the shell stays bound to the connection it was
+    created on. Opening a shell is retried on transient connection errors. Shells are deleted when the
+    process exits. A shell which raised is deleted right away, so a shell the host closed, e.g. after
+    its idle timeout, is replaced by the next session.
+    """
+
+    _idle: Dict[Tuple[Any, ...], List[WinRS]] = {}
+    _lock = threading.Lock()
+    _registered = False
+
+    @contextmanager
+    def session(self, connect: Callable[[], Client]) -> Iterator[WinRS]:
+        """Checks out an idle shell of the configured host, opening one when none is idle.
+
+        Args:
+            connect (Callable[[], Client]): Creates a new client for the configured host.
+
+        Yields:
+            WinRS: An open shell used by no other execution.
+        """
+        key = WinRMClientPool()._key()
+        with WinRSShellPool._lock:
+            if not WinRSShellPool._registered:
+                atexit.register(WinRSShellPool.close_all)
+                WinRSShellPool._registered = True
+            idle = WinRSShellPool._idle.setdefault(key, [])
+            shell = idle.pop() if idle else None
+        if shell is None:
+            RateLimiter.throttle()
+            shell = WinRS(connect().wsman)
+            try:
+                HostHealth().call(shell.open)
+            except Exception:
+                shell.wsman.close()
+                raise
+            self.__logger.debug(f"Opened WinRS shell '{shell.id}' on '{Base.config.hostname}'.")
+        try:
+            yield shell
+        except Exception:
+            self._close(shell)
+            raise
+        with WinRSShellPool._lock:
+            WinRSShellPool._idle.setdefault(key, []).append(shell)
+
+    @staticmethod
+    def _close(shell: WinRS) -> None:
+        """Deletes the provided shell and closes its connection."""
+        try:
+            shell.close()
+        except Exception as e:
+            Base().log(f"Unable to delete WinRS shell '{shell.id}'. {e}", level="debug")
+        shell.wsman.close()
+
+    @staticmethod
+    def close_all() -> None:
+        """Deletes every idle shell."""
+        with WinRSShellPool._lock:
+            shells = [shell for idle in WinRSShellPool._idle.values() for shell in idle]
+            WinRSShellPool._idle.clear()
+        for shell in shells:
+            WinRSShellPool._close(shell)
@@ -0,0 +1,121 @@
+"""Caches parsed private keys for SSH connections."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import hashlib
+import io
+import os
+import threading
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Type
+
+import paramiko
+from paramiko.pkey import PKey
+from paramiko.ssh_exception import PasswordRequiredException
+from paramiko.ssh_exception import SSHException
+
+from .base import Base
+
+
+class CredentialCache(Base):
+    """Reads, parses and decrypts each private key once per process.
+
+    Parsed keys are cached by a digest of their location and contents so that the key material
+    itself is never used as a dictionary key or logged. Key files are reloaded when they change.
+    """
+
+    KEY_CLASSES: List[Type[PKey]] = [
+        key_class
+        for key_class in (
+            paramiko.Ed25519Key,
+            paramiko.ECDSAKey,
+            paramiko.RSAKey,
+            getattr(paramiko, "DSSKey", None),
+        )
+        if key_class is not None
+    ]
+
+    _keys: Dict[str, PKey] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _digest(*parts: Optional[str]) -> str:
+        """Returns a digest identifying a key and the passphrase used to decrypt it."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update((part or "").encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _parse(self, data: str, passphrase: Optional[str]) -> PKey:
+        """Parses a private key of any supported type.
+
+        Args:
+            data (str): The private key in PEM or OpenSSH format.
+            passphrase (str, optional): The passphrase of an encrypted key.
+
+        Raises:
+            SSHException: Raised when the key is not a supported type or cannot be decrypted.
+
+        Returns:
+            PKey: The parsed key.
+        """
+        errors: List[str] = []
+        for key_class in self.KEY_CLASSES:
+            try:
+                return key_class.from_private_key(io.StringIO(data), password=passphrase)
+            except PasswordRequiredException:
+                raise
+            except (SSHException, ValueError) as e:
+                errors.append(f"{key_class.__name__}: {e}")
+        raise SSHException(f"Unable to parse private key. {'; '.join(errors)}")
+
+    def _get(self, digest: str, data: str, passphrase: Optional[str]) -> PKey:
+        """Returns the cached key with the provided digest, parsing it when it is not cached."""
+        key = CredentialCache._keys.get(digest)
+        if key is None:
+            with CredentialCache._lock:
+                key = CredentialCache._keys.get(digest)
+                if key is None:
+                    key = self._parse(data, passphrase)
+                    CredentialCache._keys[digest] = key
+                    self.__logger.debug(f"Cached {key.get_name()} private key.")
+        return key
+
+    def load_key_file(self, path: str, passphrase: Optional[str] = None) -> PKey:
+        """Returns the parsed private key stored in the provided file.
+
+        Args:
+            path (str): The path to the private key file.
+            passphrase (str, optional): The passphrase of an encrypted key. Defaults to None.
+
+        Returns:
+            PKey: The parsed key.
+        """
+        path = os.path.abspath(os.path.expanduser(path))
+        stat = os.stat(path)
+        digest = self._digest("file", path, str(stat.st_mtime_ns), str(stat.st_size), passphrase)
+        key = CredentialCache._keys.get(digest)
+        if key is not None:
+            return key
+        with open(path, encoding="utf-8") as f:
+            return self._get(digest, f.read(), passphrase)
+
+    def load_key_string(self, data: str, passphrase: Optional[str] = None) -> PKey:
+        """Returns the parsed private key in the provided string.
+
+        Args:
+            data (str): The private key in PEM or OpenSSH format.
+            passphrase (str, optional): The passphrase of an encrypted key. Defaults to None.
+
+        Returns:
+            PKey: The parsed key.
+        """
+        return self._get(self._digest("string", data, passphrase), data, passphrase)
+
+    @staticmethod
+    def clear() -> None:
+        """Drops every cached key."""
+        with CredentialCache._lock:
+            CredentialCache._keys.clear()
@@ -0,0 +1,464 @@
+"""Runs elevated commands over one persistent elevated session per host."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import atexit
+import os
+import select
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from paramiko.channel import Channel
+
+from .base import Base
+from .cancellation import CancellationToken
+from .cancellation import invoke_powershell
+from .capture import OutputCapture
+from .executors import EXECUTORS
+from .health import HostHealth
+from .models import OutputFile
+from .utils.exceptions import ElevationError
+
+
+class ChannelStream:
+    """Reads both output streams of an SSH channel without blocking on either of them."""
+
+    CHUNK_SIZE = 65536
+
+    def __init__(self, channel: Channel) -> None:
+        """Wraps the provided channel, on which the elevated shell command has been started."""
+        self.channel = channel
+
+    def wait(self, timeout: float) -> None:
+        """Waits until data arrives on stdout or stderr, or the timeout passes."""
+        select.select([self.channel], [], [], timeout)
+
+    def read(self) -> Tuple[bytes, bytes]:
+        """Returns the stdout and stderr data which is available right now."""
+        stdout = self.channel.recv(self.CHUNK_SIZE) if self.channel.recv_ready() else b""
+        stderr = self.channel.recv_stderr(self.CHUNK_SIZE) if self.channel.recv_stderr_ready() else b""
+        return stdout, stderr
+
+    def write(self, data: bytes) -> None:
+        """Writes the provided data to stdin."""
+        self.channel.sendall(data)
+
+    def alive(self) -> bool:
+        """Whether or not the shell on the channel is still running."""
+        return not (self.channel.closed or self.channel.exit_status_ready())
+
+    def close(self) -> None:
+        """Closes the channel, which ends the shell."""
+        self.channel.close()
+
+
+class ProcessStream:
+    """Reads both output streams of a local process without blocking on either of them."""
+
+    CHUNK_SIZE = 65536
+
+    def __init__(self, process: subprocess.Popen) -> None:
+        """Wraps the provided process, which runs the elevated shell command."""
+        self.process = process
+
+    def wait(self, timeout: float) -> None:
+        """Waits until data arrives on stdout or stderr, or the timeout passes."""
+        select.select([self.process.stdout, self.process.stderr], [], [], timeout)
+
+    def read(self) -> Tuple[bytes, bytes]:
+        """Returns the stdout and stderr data which is available right now."""
+        ready, _, _ = select.select([self.process.stdout, self.process.stderr], [], [], 0)
+        stdout = os.read(self.process.stdout.fileno(), self.CHUNK_SIZE) if self.process.stdout in ready else b""
+        stderr = os.read(self.process.stderr.fileno(), self.CHUNK_SIZE) if self.process.stderr in ready else b""
+        return stdout, stderr
+
+    def write(self, data: bytes) -> None:
+        """Writes the provided data to stdin."""
+        self.process.stdin.write(data)
+        self.process.stdin.flush()
+
+    def alive(self) -> bool:
+        """Whether or not the shell process is still running."""
+        return self.process.poll() is None
+
+    def close(self) -> None:
+        """Ends the shell process."""
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class ElevatedShell(Base):
+    """A root shell which stays open and runs one command at a time.
+
+    The shell is started with sudo -S so that the password is sent once, when sudo prompts for it,
+    instead of with every command. Each command runs in a subshell and is followed by a unique
+    marker on stdout and stderr, which carries the exit status and ends the output of the command.
+    """
+
+    def __init__(self, open_stream: Callable[[str], Any], password: Optional[str] = None) -> None:
+        """Starts an elevated shell and authenticates it.
+
+        Args:
+            open_stream (Callable[[str], Any]): Runs the provided shell command and returns a
+                ChannelStream or ProcessStream connected to it.
+            password (str, optional): The password sent when sudo prompts for one. Defaults to None.
+        """
+        self.prompt = f"atomic_operator_runner_prompt_{uuid.uuid4().hex}"
+        self.ready = f"atomic_operator_runner_ready_{uuid.uuid4().hex}"
+        shell = shlex.quote(f"echo {self.ready}; exec /bin/sh")
+        self.stream = open_stream(
+            f'if [ "$(id -u)" = 0 ]; then exec /bin/sh -c {shell}; '
+            f"else exec sudo -S -p {self.prompt} /bin/sh -c {shell}; fi"
+        )
+        try:
+            self._authenticate(password)
+        except Exception:
+            self.stream.close()
+            raise
+
+    def _read(self, deadline: Optional[float]) -> Tuple[bytes, bytes]:
+        """Waits for the next stdout or stderr data of the shell.
+
+        Raises:
+            EOFError: Raised when the shell exits.
+            TimeoutError: Raised when nothing arrives before the deadline.
+        """
+        while True:
+            stdout, stderr = self.stream.read()
+            if stdout or stderr:
+                return stdout, stderr
+            if not self.stream.alive():
+                raise EOFError("The elevated shell exited.")
+            timeout = 1.0
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+                if timeout <= 0:
+                    raise TimeoutError("Timed out waiting for the elevated shell.")
+            self.stream.wait(timeout)
+
+    def _authenticate(self, password: Optional[str]) -> None:
+        """Answers the sudo password prompt until the shell reports that it is ready."""
+        deadline = time.monotonic() + Base.config.elevation_timeout
+        prompt, ready = self.prompt.encode(), self.ready.encode()
+        stdout, stderr = b"", b""
+        answered = False
+        while ready not in stdout:
+            try:
+                data, errors = self._read(deadline)
+            except EOFError as e:
+                raise ElevationError(
+                    hostname=Base.config.hostname or "localhost",
+                    reason=stderr.decode("utf-8", "replace").strip() or str(e),
+                ) from e
+            stdout += data
+            stderr += errors
+            if prompt in stderr:
+                stderr = stderr.replace(prompt, b"", 1)
+                if answered or not password:
+                    raise ElevationError(
+                        hostname=Base.config.hostname or "localhost",
+                        reason="sudo rejected the password." if answered else "sudo requires a password.",
+                    )
+                self.stream.write(password.encode("utf-8") + b"\n")
+                answered = True
+        self.__logger.debug(f"Opened elevated shell on '{Base.config.hostname or 'localhost'}'.")
+
+    def run(
+        self,
+        command: str,
+        executor: str = "sh",
+        cwd: Optional[str] = None,
+        timeout: Optional[float] = None,
+        cancellation: Optional[CancellationToken] = None,
+    ) -> Tuple[Optional[int], Optional[str], Optional[OutputFile], str]:
+        """Runs the provided command in the elevated shell.
+
+        Args:
+            command (str): The command string to run.
+            executor (str, optional): The name of an executor which runs over SSH. Defaults to "sh".
+            cwd (str, optional): The directory the command runs in. Defaults to None.
+            timeout (float, optional): The number of seconds to wait for the command. Defaults to None.
+            cancellation (CancellationToken, optional): Ends the shell when cancelled. The output received
+                until then is returned without a return code and the shell cannot be used afterwards.
+                Defaults to None.
+
+        Raises:
+            ElevationError: Raised when the shell exits while the command runs.
+            TimeoutError: Raised when the command does not finish within the timeout. The shell
+                cannot be used afterwards.
+
+        Returns:
+            Tuple[Optional[int], Optional[str], Optional[OutputFile], str]: The return code, the output or a
+                reference to the spilled output file and the stderr of the command.
+        """
+        marker = f"atomic_operator_runner_end_{uuid.uuid4().hex}"
+        if executor == "sh":
+            run = f"eval {shlex.quote(command)}"
+        else:
+            run = EXECUTORS.shell_command(executor, command, platform=Base.config.platform, native=False)
+        if cwd:
+            run = f"cd {shlex.quote(cwd)} && {run}"
+        self.stream.write(
+            f"( {run}\n) </dev/null\nprintf '\\n%s %s\\n' {marker} $?\nprintf '%s\\n' {marker} >&2\n".encode("utf-8")
+        )
+        deadline = time.monotonic() + timeout if timeout else None
+        capture = OutputCapture(max_size=Base.config.max_output_size, encoding=Base.config.encoding)
+        end = f"\n{marker} ".encode()
+        pending, errors = b"", b""
+        return_code: Optional[int] = None
+        errors_done = False
+        with cancellation.on_cancel(self.close) if cancellation is not None else nullcontext():
+            while return_code is None or not errors_done:
+                try:
+                    stdout, stderr = self._read(deadline)
+                except EOFError as e:
+                    if cancellation is not None and cancellation.cancelled:
+                        capture.write(pending)
+                        break
+                    raise ElevationError(hostname=Base.config.hostname or "localhost", reason=str(e)) from e
+                if stdout and return_code is None:
+                    pending, return_code = self._scan_output(pending + stdout, end, capture)
+                if stderr and not errors_done:
+                    errors += stderr
+                    index = errors.find(marker.encode())
+                    if index != -1:
+                        errors = errors[:index]
+                        errors_done = True
+        output, output_file = capture.close()
+        return return_code, output, output_file, errors.decode("utf-8", "replace")
+
+    @staticmethod
+    def _scan_output(pending: bytes, end: bytes, capture: OutputCapture) -> Tuple[bytes, Optional[int]]:
+        """Writes the output in front of the end marker to the provided capture.
+
+        Returns:
+            Tuple[bytes, Optional[int]]: The bytes which may still be part of the end marker and the
+                return code once the complete end marker line has been received.
+        """
+        index = pending.find(end)
+        if index != -1:
+            newline = pending.find(b"\n", index + len(end))
+            if newline == -1:
+                return pending, None
+            capture.write(pending[:index])
+            return b"", int(pending[index + len(end) : newline])
+        # everything before a possible partial marker is output of the command
+        safe = len(pending) - len(end)
+        if safe > 0:
+            capture.write(pending[:safe])
+            pending = pending[safe:]
+        return pending, None
+
+    def close(self) -> None:
+        """Ends the elevated shell."""
+        self.stream.close()
+
+
+class ElevatedSession(Base):
+    """Keeps one elevated session per host and runs elevated commands on it.
+
+    Linux and macOS hosts get an ElevatedShell, either over a channel of the pooled SSH connection or
+    as a local process. Windows hosts get a PowerShell runspace pool using the elevated session
+    configuration named by Host.elevation_configuration. Elevated commands against one host run one
+    at a time on its session.
+    """
+
+    _shells: Dict[Tuple[Any, ...], ElevatedShell] = {}
+    _pools: Dict[Tuple[Any, ...], Any] = {}
+    _locks: Dict[Tuple[Any, ...], threading.Lock] = {}
+    _lock = threading.Lock()
+    _registered = False
+
+    def _key(self) -> Tuple[Any, ...]:
+        """Returns the key identifying the session of the configured host."""
+        return Base.config.run_type, Base.config.hostname, Base.config.ssh_port, Base.config.username
+
+    def _host_lock(self) -> threading.Lock:
+        """Returns the lock which serializes elevated commands on the configured host."""
+        with ElevatedSession._lock:
+            if not ElevatedSession._registered:
+                atexit.register(ElevatedSession.close_all)
+                ElevatedSession._registered = True
+            return ElevatedSession._locks.setdefault(self._key(), threading.Lock())
+
+    def _open_stream(self, command: str) -> Any:
+        """Starts the provided shell command on the configured host."""
+        if Base.config.run_type == "remote":
+            from .connections import SSHConnectionPool
+
+            channel = SSHConnectionPool().get_client().get_transport().open_session(timeout=Base.config.ssh_timeout)
+            channel.exec_command(command)
+            return ChannelStream(channel)
+        return ProcessStream(
+            subprocess.Popen(  # noqa: S603
+                ["/bin/sh", "-c", command], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        )
+
+    def _get_shell(self, key: Tuple[Any, ...]) -> ElevatedShell:
+        """Returns the elevated shell with the provided key, opening it when it is not running."""
+        shell = ElevatedSession._shells.get(key)
+        if shell is None or not shell.stream.alive():
+            shell = ElevatedShell(
+                open_stream=self._open_stream, password=Base.config.elevation_password or Base.config.password
+            )
+            ElevatedSession._shells[key] = shell
+        return shell
+
+    def _get_pool(self, key: Tuple[Any, ...]) -> Any:
+        """Returns the elevated runspace pool with the provided key, opening it when there is none."""
+        from pypsrp.powershell import RunspacePool
+
+        from .remote import RemoteRunner
+
+        pool = ElevatedSession._pools.get(key)
+        if pool is None:
+            pool = RunspacePool(
+                RemoteRunner()._get_pypsrp_client().wsman, configuration_name=Base.config.elevation_configuration
+            )
+            HostHealth().call(pool.open)
+            ElevatedSession._pools[key] = pool
+            self.__logger.debug(
+                f"Opened '{Base.config.elevation_configuration}' runspace pool on '{Base.config.hostname}'."
+            )
+        return pool
+
+    def open(self) -> None:
+        """Opens and authenticates the elevated session of the configured host, unless it is already open."""
+        key = self._key()
+        with self._host_lock():
+            if Base.config.platform == "windows":
+                self._get_pool(key)
+            else:
+                self._get_shell(key)
+
+    def run_posix(
+        self,
+        command: str,
+        executor: str = "sh",
+        cwd: Optional[str] = None,
+        timeout: Optional[float] = None,
+        cancellation: Optional[CancellationToken] = None,
+    ) -> Tuple[Optional[int], Optional[str], Optional[OutputFile], str]:
+        """Runs the provided command in the elevated shell of the configured host, opening it when needed.
+
+        Args:
+            command (str): The command string to run.
+            executor (str, optional): The name of an executor which runs over SSH. Defaults to "sh".
+            cwd (str, optional): The directory the command runs in. Defaults to None.
+            timeout (float, optional): The number of seconds to wait for the command. Defaults to None.
+            cancellation (CancellationToken, optional): Ends the shell, and with it the command, when
+                cancelled. The next elevated command opens a new shell. Defaults to None.
+
+        Returns:
+            Tuple[Optional[int], Optional[str], Optional[OutputFile], str]: The return code, the output or a
+                reference to the spilled output file and the stderr of the command.
+        """
+        key = self._key()
+        with self._host_lock():
+            shell = self._get_shell(key)
+            try:
+                return shell.run(command, executor=executor, cwd=cwd, timeout=timeout, cancellation=cancellation)
+            except Exception:
+                # a shell left in the middle of a command cannot be reused
+                ElevatedSession._shells.pop(key, None)
+                shell.close()
+                raise
+
+    def run_powershell(self, script: str, cancellation: Optional[CancellationToken] = None) -> Tuple[str, Any, bool]:
+        """Runs the provided script in the elevated runspace pool of the configured Windows host.
+
+        Args:
+            script (str): The PowerShell script to run.
+            cancellation (CancellationToken, optional): Stops the script when cancelled. Defaults to None.
+
+        Returns:
+            Tuple[str, Any, bool]: The output, the PowerShell streams and whether or not the script had errors.
+        """
+        output, streams, had_errors = self._invoke(script, cancellation=cancellation)
+        return "\n".join(str(item) for item in output), streams, had_errors
+
+    def run_cmd(self, command: str, cancellation: Optional[CancellationToken] = None) -> Tuple[str, str, int]:
+        """Runs the provided cmd command in the elevated runspace pool of the configured Windows host.
+
+        The command is passed to the script as an argument rather than written into it, so no content
+        of the command can end the string holding it. The output and the exit code of the command are
+        written as separate pipeline objects, so that output looking like a number is never read as
+        the exit code.
+
+        Args:
+            command (str): The command string to run with cmd.exe.
+            cancellation (CancellationToken, optional): Stops the command when cancelled. Defaults to None.
+
+        Returns:
+            Tuple[str, str, int]: The output with stderr merged in, any PowerShell errors and the return code,
+                which is -1 when the command was stopped or its exit code is not known.
+        """
+        output, streams, _had_errors = self._invoke(
+            "param($atomicOperatorRunnerCommand)\n"
+            "[string](cmd.exe /c $atomicOperatorRunnerCommand 2>&1 | Out-String)\n"
+            "$LASTEXITCODE",
+            arguments=[command],
+            cancellation=cancellation,
+        )
+        errors = "\n".join(str(error) for error in getattr(streams, "error", []))
+        text = str(output[0]) if output else ""
+        return_code = output[1] if len(output) == 2 else None
+        if isinstance(return_code, bool) or not isinstance(return_code, int):
+            # the script was stopped before it wrote the exit code or cmd.exe did not run
+            return text, errors, -1
+        return text, errors, return_code
+
+    def _invoke(
+        self, script: str, arguments: Sequence[Any] = (), cancellation: Optional[CancellationToken] = None
+    ) -> Tuple[List[Any], Any, bool]:
+        """Runs the provided script with the provided arguments in the elevated runspace pool and returns its output.
+
+        A pool which raised is closed and the next elevated command opens a new one.
+        """
+        from pypsrp.powershell import PowerShell
+
+        key = self._key()
+        with self._host_lock():
+            pool = self._get_pool(key)
+            try:
+                powershell = PowerShell(pool)
+                powershell.add_script(script)
+                for argument in arguments:
+                    powershell.add_argument(argument)
+                output: List[Any] = invoke_powershell(powershell, cancellation)
+            except Exception:
+                ElevatedSession._pools.pop(key, None)
+                try:
+                    pool.close()
+                except Exception as e:
+                    self.__logger.debug(f"Unable to close elevated runspace pool. {e}")
+                raise
+        return output, powershell.streams, powershell.had_errors
+
+    @staticmethod
+    def close_all() -> None:
+        """Closes every elevated session."""
+        with ElevatedSession._lock:
+            shells = list(ElevatedSession._shells.values())
+            pools = list(ElevatedSession._pools.values())
+            ElevatedSession._shells.clear()
+            ElevatedSession._pools.clear()
+        for shell in shells:
+            shell.close()
+        for pool in pools:
+            try:
+                pool.close()
+            except Exception as e:
+                Base().log(f"Unable to close elevated runspace pool. {e}", level="debug")
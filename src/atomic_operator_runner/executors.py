@@ -0,0 +1,314 @@
+"""Registry of the executors commands can be ran with."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import base64
+import shlex
+import uuid
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .models import Executor
+
+
+class ExecutorRegistry:
+    """Looks up executors by name.
+
+    Every executor declares its binary per platform, how the command is handed to it and which
+    transport runs it on remote hosts:
+
+    - input "stdin" writes the command to the standard input of the binary.
+    - input "argument" passes the command as the last argument.
+    - input "file" writes the command to a temporary script file and passes its path.
+    - file_arguments are placed before the path of a script file, when the executor runs a staged
+      script instead of its usual input. They default to the arguments of file input executors.
+    - transport "ssh", "powershell" or "winrs" selects SSH, PowerShell remoting or a WinRS shell.
+      transports overrides it per platform, e.g. pwsh runs over SSH on Linux and macOS and over
+      PowerShell remoting on Windows. PowerShell remoting and WinRS only reach Windows hosts, so on
+      other platforms these executors run their binary for that platform over SSH.
+    - native executors hand the command to the remote transport unchanged, e.g. sh to the login
+      shell of an SSH session or powershell to a PowerShell runspace. Other executors run their
+      binary from the transport.
+    - elevation is the wrapper of elevated commands ran through AWS. Remote hosts elevate through
+      the elevated session of their transport instead: sudo over SSH and an elevated runspace pool
+      on Windows.
+
+    How output streams follows from the transport rather than the executor: SSH and local commands
+    stream their output, PowerShell remoting and WinRS return it once the command completes.
+
+    Binary paths are resolved per platform when an executor is registered, so a lookup while a
+    command runs is a single dictionary read. command_map and elevation_map are kept up to date
+    in the format of Base.COMMAND_MAP and Base.ELEVATION_COMMAND_MAP. version changes whenever
+    executors are added or removed.
+    """
+
+    PLATFORMS = ["linux", "macos", "windows"]
+    INPUTS = ["stdin", "argument", "file"]
+    TRANSPORTS = ["ssh", "powershell", "winrs"]
+
+    def __init__(self) -> None:
+        """Creates an empty registry."""
+        self._executors: Dict[str, Executor] = {}
+        self._paths: Dict[Tuple[str, str], str] = {}
+        self.command_map: Dict[str, Dict[str, str]] = {}
+        self.elevation_map: Dict[str, str] = {}
+        self.version = 0
+
+    def register(self, executor: Executor) -> Executor:
+        """Adds the provided executor, replacing any executor with the same name.
+
+        Args:
+            executor (Executor): The executor to add.
+
+        Raises:
+            ValueError: Raised when the input or transport of the executor is unknown.
+
+        Returns:
+            Executor: The registered executor.
+        """
+        if executor.input not in self.INPUTS:
+            raise ValueError(f"Unknown input '{executor.input}' for executor '{executor.name}'.")
+        for transport in [executor.transport, *executor.transports.values()]:
+            if transport not in self.TRANSPORTS:
+                raise ValueError(f"Unknown transport '{transport}' for executor '{executor.name}'.")
+        self._executors[executor.name] = executor
+        self.command_map[executor.name] = dict(executor.paths)
+        for platform in self.PLATFORMS:
+            path = executor.paths.get(platform) or executor.paths.get("default")
+            if path:
+                self._paths[(executor.name, platform)] = path
+            else:
+                self._paths.pop((executor.name, platform), None)
+        if executor.elevation:
+            self.elevation_map[executor.name] = executor.elevation
+        else:
+            self.elevation_map.pop(executor.name, None)
+        self.version += 1
+        return executor
+
+    def unregister(self, name: str) -> None:
+        """Removes the executor with the provided name."""
+        self._executors.pop(name, None)
+        self.command_map.pop(name, None)
+        self.elevation_map.pop(name, None)
+        for platform in self.PLATFORMS:
+            self._paths.pop((name, platform), None)
+        self.version += 1
+
+    def get(self, name: str) -> Optional[Executor]:
+        """Returns the executor with the provided name or None when it is not registered."""
+        return self._executors.get(name)
+
+    def path(self, name: str, platform: Optional[str]) -> Optional[str]:
+        """Returns the binary of the named executor on the provided platform or None when it has none."""
+        return self._paths.get((name, platform or ""))
+
+    def transport(self, name: str, platform: Optional[str]) -> Optional[str]:
+        """Returns the transport which runs the named executor on hosts of the provided platform.
+
+        Args:
+            name (str): The name of the executor.
+            platform (str): The platform of the host.
+
+        Returns:
+            Optional[str]: The transport or None when the executor is not registered or cannot run on the platform.
+        """
+        executor = self._executors.get(name)
+        if executor is None:
+            return None
+        transport = executor.transports.get(platform or "", executor.transport)
+        if transport == "ssh" or platform == "windows":
+            return transport
+        return "ssh" if self.path(name, platform) else None
+
+    def names(self) -> List[str]:
+        """Returns the names of all registered executors."""
+        return list(self._executors)
+
+    def arguments(self, name: str, platform: Optional[str], command: str, script: Optional[str] = None) -> List[str]:
+        """Returns the argument list which runs the provided command with the named executor.
+
+        Args:
+            name (str): The name of the executor.
+            platform (str): The platform the command runs on.
+            command (str): The command string to run.
+            script (str, optional): The script file holding the command, for file input. Defaults to None.
+
+        Returns:
+            List[str]: The binary followed by its arguments.
+        """
+        executor = self._executors[name]
+        if executor.input == "file" and script:
+            return self.script_arguments(name, platform, script)
+        arguments = [self.path(name, platform) or name, *executor.arguments]
+        if executor.input == "argument":
+            arguments.append(command)
+        return arguments
+
+    def script_arguments(self, name: str, platform: Optional[str], script: str) -> List[str]:
+        """Returns the argument list which runs the provided script file with the named executor.
+
+        Args:
+            name (str): The name of the executor.
+            platform (str): The platform the script runs on.
+            script (str): The path of the script file.
+
+        Returns:
+            List[str]: The binary followed by its arguments.
+        """
+        executor = self._executors[name]
+        arguments = executor.file_arguments
+        if arguments is None:
+            arguments = executor.arguments if executor.input == "file" else []
+        return [self.path(name, platform) or name, *arguments, script]
+
+    def shell_command(self, name: str, command: str, platform: Optional[str], native: bool = True) -> str:
+        """Returns a POSIX shell command string which runs the provided command with the named executor.
+
+        Args:
+            name (str): The name of the executor.
+            command (str): The command string to run.
+            platform (str): The platform the command runs on.
+            native (bool, optional): Whether or not native executors get the command unchanged. Defaults to True.
+
+        Returns:
+            str: The shell command string.
+        """
+        executor = self._executors[name]
+        if native and executor.native:
+            return command
+        binary = " ".join(
+            shlex.quote(argument) for argument in [self.path(name, platform) or name, *executor.arguments]
+        )
+        if executor.input == "argument":
+            return f"{binary} {shlex.quote(command)}"
+        # a quoted here-document keeps the command from being expanded by the outer shell
+        delimiter = f"ATOMIC_OPERATOR_RUNNER_{uuid.uuid4().hex}"
+        if executor.input == "file":
+            return (
+                "atomic_operator_runner_script=$(mktemp) || exit 1\n"
+                f"cat > \"$atomic_operator_runner_script\" <<'{delimiter}'\n{command}\n{delimiter}\n"
+                f'{binary} "$atomic_operator_runner_script"\n'
+                "atomic_operator_runner_rc=$?\n"
+                'rm -f "$atomic_operator_runner_script"\n'
+                '(exit "$atomic_operator_runner_rc")'
+            )
+        return f"{binary} <<'{delimiter}'\n{command}\n{delimiter}"
+
+    def powershell_command(self, name: str, command: str, platform: Optional[str], native: bool = True) -> str:
+        """Returns a PowerShell command string which runs the provided command with the named executor.
+
+        The command is embedded base64 encoded, so no quoting or here-string of it can be broken by its content.
+
+        Args:
+            name (str): The name of the executor.
+            command (str): The command string to run.
+            platform (str): The platform the command runs on.
+            native (bool, optional): Whether or not native executors get the command unchanged. Defaults to True.
+
+        Returns:
+            str: The PowerShell command string.
+        """
+        executor = self._executors[name]
+        if native and executor.native:
+            return command
+        binary = " ".join(
+            self.powershell_quote(argument) for argument in [self.path(name, platform) or name, *executor.arguments]
+        )
+        encoded = base64.b64encode(command.encode("utf-8")).decode("ascii")
+        decode = (
+            "$atomic_operator_runner_command = "
+            f"[Text.Encoding]::UTF8.GetString([Convert]::FromBase64String('{encoded}'))\n"
+        )
+        # the transport reports failures through the error stream rather than an exit code
+        failed = 'if ($LASTEXITCODE) { Write-Error "Exited with code $LASTEXITCODE." }'
+        if executor.input == "argument":
+            return f"{decode}& {binary} $atomic_operator_runner_command\n{failed}"
+        if executor.input == "file":
+            return (
+                f"{decode}$atomic_operator_runner_script = Join-Path ([IO.Path]::GetTempPath()) "
+                f"([Guid]::NewGuid().ToString() + {self.powershell_quote(executor.file_extension or '')})\n"
+                "[IO.File]::WriteAllText($atomic_operator_runner_script, $atomic_operator_runner_command)\n"
+                f"try {{ & {binary} $atomic_operator_runner_script }}\n"
+                "finally { Remove-Item -Force $atomic_operator_runner_script }\n"
+                f"{failed}"
+            )
+        return f"{decode}$atomic_operator_runner_command | & {binary}\n{failed}"
+
+    @staticmethod
+    def powershell_quote(value: str) -> str:
+        """Returns the provided value as a single quoted PowerShell string."""
+        return "'{}'".format(value.replace("'", "''"))
+
+
+EXECUTORS = ExecutorRegistry()
+for _executor in (
+    Executor(
+        name="command_prompt",
+        paths={
+            "windows": "C:\\Windows\\System32\\cmd.exe",
+            "linux": "/bin/sh",
+            "macos": "/bin/sh",
+            "default": "/bin/sh",
+        },
+        transport="winrs",
+        native=True,
+        elevation="cmd.exe /c",
+    ),
+    Executor(
+        name="cmd",
+        paths={"windows": "C:\\Windows\\System32\\cmd.exe"},
+        transport="winrs",
+        native=True,
+        elevation="cmd.exe /c",
+    ),
+    Executor(
+        name="powershell",
+        paths={"windows": "C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe"},
+        file_extension=".ps1",
+        file_arguments=["-NoProfile", "-NonInteractive", "-ExecutionPolicy", "Bypass", "-File"],
+        transport="powershell",
+        native=True,
+        elevation="Start-Process PowerShell -Verb RunAs;",
+    ),
+    Executor(
+        name="sh",
+        paths={"linux": "/bin/sh", "macos": "/bin/sh"},
+        native=True,
+        elevation="sudo",
+    ),
+    Executor(
+        name="bash",
+        paths={"linux": "/bin/bash", "macos": "/bin/bash"},
+        native=True,
+        elevation="sudo",
+    ),
+    Executor(
+        name="zsh",
+        paths={"linux": "/usr/bin/zsh", "macos": "/bin/zsh"},
+        elevation="sudo",
+    ),
+    Executor(
+        name="pwsh",
+        paths={
+            "linux": "/usr/bin/pwsh",
+            "macos": "/usr/local/bin/pwsh",
+            "windows": "C:\\Program Files\\PowerShell\\7\\pwsh.exe",
+        },
+        arguments=["-NoProfile", "-NonInteractive", "-Command", "-"],
+        file_extension=".ps1",
+        file_arguments=["-NoProfile", "-NonInteractive", "-File"],
+        transports={"windows": "powershell"},
+        elevation="sudo",
+    ),
+    Executor(
+        name="python",
+        paths={"linux": "/usr/bin/python3", "macos": "/usr/bin/python3"},
+        arguments=["-"],
+        file_extension=".py",
+        file_arguments=[],
+        elevation="sudo",
+    ),
+):
+    EXECUTORS.register(_executor)
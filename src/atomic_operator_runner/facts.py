@@ -0,0 +1,227 @@
+"""Discovers and caches facts about target hosts."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import os
+import platform
+import shlex
+import shutil
+import subprocess
+import threading
+from datetime import datetime
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from .base import Base
+from .executors import EXECUTORS
+from .models import HostFacts
+
+
+class FactCache(Base):
+    """Runs one discovery probe per host and keeps the results for Host.facts_ttl seconds.
+
+    Facts are discovered when Host.discover_facts is set or when discover is called explicitly.
+    Whether the local user can elevate with sudo is only checked once an elevated command is
+    about to run, since a sudo attempt may be logged or alerted on.
+    """
+
+    POSIX_PROBE = (
+        'echo "os:$(uname -sr)"; '
+        'echo "user:$(id -un)"; '
+        "if sudo -n true >/dev/null 2>&1; then echo elevate:true; else echo elevate:false; fi; "
+        "if command -v pwsh >/dev/null 2>&1; then "
+        "echo \"powershell:$(pwsh -NoProfile -Command '$PSVersionTable.PSVersion.ToString()')\"; fi"
+    )
+    WINDOWS_PROBE = (
+        '"os:" + [System.Environment]::OSVersion.VersionString\n'
+        '"user:" + [System.Environment]::UserName\n'
+        '"powershell:" + $PSVersionTable.PSVersion.ToString()\n'
+        '"elevate:" + ([Security.Principal.WindowsPrincipal][Security.Principal.WindowsIdentity]::GetCurrent()).'
+        "IsInRole([Security.Principal.WindowsBuiltInRole]::Administrator)"
+    )
+
+    _facts: Dict[Tuple[Optional[str], Optional[str]], HostFacts] = {}
+    _versions: Dict[Tuple[Optional[str], Optional[str]], int] = {}
+    _locks: Dict[Tuple[Optional[str], Optional[str]], threading.Lock] = {}
+    _lock = threading.Lock()
+    _local_username: Optional[str] = None
+
+    def _key(self) -> Tuple[Optional[str], Optional[str]]:
+        """Returns the cache key of the configured host."""
+        return Base.config.hostname, Base.config.username
+
+    def get(self, discover: Optional[bool] = None) -> Optional[HostFacts]:
+        """Returns the facts of the configured host.
+
+        Args:
+            discover (bool, optional): Whether or not to run the discovery probe when there are no
+                current facts. Defaults to None, which discovers when Host.discover_facts is set.
+
+        Returns:
+            Optional[HostFacts]: The facts or None when they are not known and were not discovered.
+        """
+        facts = FactCache._facts.get(self._key())
+        if facts is not None and not self._expired(facts, self._key()):
+            return facts
+        if discover is None:
+            discover = Base.config.discover_facts
+        return self.discover() if discover else None
+
+    def _expired(self, facts: HostFacts, key: Tuple[Optional[str], Optional[str]]) -> bool:
+        """Whether or not the provided facts are older than the configured time to live or the executor registry."""
+        if FactCache._versions.get(key, EXECUTORS.version) != EXECUTORS.version:
+            return True
+        return (datetime.now() - facts.discovered_at).total_seconds() > Base.config.facts_ttl
+
+    def discover(self, refresh: bool = False) -> HostFacts:
+        """Runs the discovery probe against the configured host, unless current facts are cached.
+
+        Args:
+            refresh (bool, optional): Whether or not to probe even when current facts are cached. Defaults to False.
+
+        Returns:
+            HostFacts: The facts of the configured host.
+        """
+        key = self._key()
+        with FactCache._lock:
+            lock = FactCache._locks.setdefault(key, threading.Lock())
+        # concurrent executions against one host wait for a single probe
+        with lock:
+            facts = FactCache._facts.get(key)
+            if facts is None or refresh or self._expired(facts, key):
+                if Base.config.run_type == "remote":
+                    facts = self._discover_remote()
+                else:
+                    facts = self._discover_local()
+                self.__logger.debug(f"Discovered facts for '{facts.hostname}': {facts.json()}")
+                FactCache._facts[key] = facts
+                FactCache._versions[key] = EXECUTORS.version
+        return facts
+
+    def can_elevate(self, facts: HostFacts) -> Optional[bool]:
+        """Returns whether or not commands on the configured host can be elevated without a password.
+
+        When the local facts do not tell, sudo is asked once and the answer is kept with the facts.
+
+        Args:
+            facts (HostFacts): The facts of the configured host.
+
+        Returns:
+            Optional[bool]: Whether or not elevation is possible or None when it is not known.
+        """
+        if facts.can_elevate is None and Base.config.run_type != "remote":
+            facts.can_elevate = self._can_sudo_locally()
+        return facts.can_elevate
+
+    def clear(self) -> None:
+        """Forgets the facts of the configured host."""
+        with FactCache._lock:
+            FactCache._facts.pop(self._key(), None)
+
+    def _posix_probe(self) -> str:
+        """Returns the probe command, extended by a check for the binary of every executor which runs over SSH."""
+        checks = []
+        for name in EXECUTORS.names():
+            path = EXECUTORS.path(name, Base.config.platform)
+            if path and EXECUTORS.transport(name, Base.config.platform) == "ssh":
+                checks.append(f"[ -x {shlex.quote(path)} ] && echo executor:{name}; ")
+        return self.POSIX_PROBE + "; " + "".join(checks)
+
+    def get_local_username(self) -> str:
+        """Attempts to determine the current logged in user name, which is only looked up once."""
+        if FactCache._local_username is None:
+            FactCache._local_username = self._get_local_username()
+        return FactCache._local_username
+
+    def _get_local_username(self) -> str:
+        """Attempts to determine the current logged in user name."""
+        try:
+            import getpass
+
+            return getpass.getuser()
+        except Exception as e:
+            self.__logger.debug(f"Unable to retrieve username from getpass.getuser method. {e}")
+        try:
+            return os.getlogin()
+        except Exception as e:
+            self.__logger.debug(f"Unable to retrieve username from os.getlogin method. {e}")
+        return "Unknown"
+
+    def _can_elevate_locally(self, local_platform: str) -> Optional[bool]:
+        """Whether or not commands on the local system can be elevated, or None when only sudo can tell."""
+        if local_platform == "windows":
+            import ctypes
+
+            return bool(ctypes.windll.shell32.IsUserAnAdmin())  # type: ignore[attr-defined]
+        if hasattr(os, "geteuid") and os.geteuid() == 0:
+            return True
+        return None if shutil.which("sudo") else False
+
+    def _can_sudo_locally(self) -> bool:
+        """Whether or not sudo runs commands on the local system without a password prompt."""
+        sudo = shutil.which("sudo")
+        if not sudo:
+            return False
+        try:
+            return subprocess.run([sudo, "-n", "true"], capture_output=True, timeout=5).returncode == 0  # noqa: S603
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+
+    def _discover_local(self) -> HostFacts:
+        """Collects facts about the local system without running a shell."""
+        local_platform = self.get_local_system_platform()
+        executors = []
+        for name in EXECUTORS.names():
+            path = EXECUTORS.path(name, local_platform)
+            if path and os.path.exists(path):
+                executors.append(name)
+        return HostFacts(
+            hostname=platform.node(),
+            platform=local_platform,
+            os_version=platform.platform(),
+            user=self.get_local_username(),
+            executors=executors,
+            can_elevate=self._can_elevate_locally(local_platform),
+            discovered_at=datetime.now(),
+        )
+
+    def _parse_probe(self, output: str, facts: HostFacts) -> HostFacts:
+        """Reads the key:value lines written by a discovery probe into the provided facts."""
+        for line in output.splitlines():
+            name, _, value = line.strip().partition(":")
+            value = value.strip()
+            if name == "os":
+                facts.os_version = value
+            elif name == "user":
+                facts.user = value
+            elif name == "executor":
+                facts.executors.append(value)
+            elif name == "elevate":
+                facts.can_elevate = value.lower() == "true"
+            elif name == "powershell" and value:
+                facts.powershell_version = value
+        return facts
+
+    def _discover_remote(self) -> HostFacts:
+        """Runs a single probe command on the configured remote host."""
+        from .remote import RemoteRunner
+
+        facts = HostFacts(
+            hostname=Base.config.hostname,
+            platform=Base.config.platform,
+            user=Base.config.username,
+            discovered_at=datetime.now(),
+        )
+        if Base.config.platform == "windows":
+            with RemoteRunner()._pypsrp_session() as client:
+                output, _streams, _had_errors = client.execute_ps(self.WINDOWS_PROBE)
+            facts.executors = ["powershell", "cmd", "command_prompt"]
+            return self._parse_probe(output, facts)
+        from .connections import SSHConnectionPool
+
+        with SSHConnectionPool().session() as client:
+            stdin, stdout, _stderr = SSHConnectionPool().exec_command(client, self._posix_probe())
+            stdin.close()
+            output = stdout.read().decode("utf-8", "replace")
+            stdout.channel.recv_exit_status()
+        return self._parse_probe(output, facts)
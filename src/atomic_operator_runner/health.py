@@ -0,0 +1,158 @@
+"""Tracks the connection health of remote hosts."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import random
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Set
+
+from paramiko.ssh_exception import NoValidConnectionsError
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from .base import Base
+from .models import HostStatus
+from .utils.exceptions import HostUnavailableError
+
+
+class HostHealth(Base):
+    """Retries transient connection errors and fails fast for hosts that are known to be down.
+
+    Each host has a circuit breaker. It is closed while the host is healthy, opens after
+    Host.failure_threshold consecutive connection failures and half-opens once
+    Host.recovery_timeout seconds have passed so that a single execution can probe the host again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    MAX_BACKOFF = 30.0
+    TRANSIENT_ERRORS = (
+        NoValidConnectionsError,
+        ConnectionRefusedError,
+        socket.timeout,
+        RequestsConnectionError,
+    )
+
+    _statuses: Dict[str, HostStatus] = {}
+    _probing: Set[str] = set()
+    _lock = threading.Lock()
+
+    def status(self, hostname: str) -> HostStatus:
+        """Returns the current connection health of the provided host.
+
+        Args:
+            hostname (str): The hostname to look up.
+
+        Returns:
+            HostStatus: The current status of the host.
+        """
+        with self._lock:
+            return self._statuses.setdefault(hostname, HostStatus(hostname=hostname)).copy()
+
+    def reset(self, hostname: str) -> None:
+        """Forgets any recorded failures for the provided host.
+
+        Args:
+            hostname (str): The hostname to reset.
+        """
+        with self._lock:
+            self._statuses.pop(hostname, None)
+            self._probing.discard(hostname)
+
+    def is_transient(self, exception: Exception) -> bool:
+        """Whether or not the provided exception is a connection error worth retrying."""
+        return isinstance(exception, self.TRANSIENT_ERRORS)
+
+    def _acquire(self, hostname: str) -> None:
+        """Checks the circuit breaker before an attempt is made against the provided host.
+
+        Args:
+            hostname (str): The hostname about to be contacted.
+
+        Raises:
+            HostUnavailableError: Raised when the circuit is open or a recovery probe is already running.
+        """
+        with self._lock:
+            status = self._statuses.setdefault(hostname, HostStatus(hostname=hostname))
+            if status.state == self.CLOSED:
+                return
+            if status.state == self.OPEN:
+                if (datetime.now() - status.opened_at).total_seconds() < Base.config.recovery_timeout:
+                    raise HostUnavailableError(hostname=hostname)
+                status.state = self.HALF_OPEN
+            if hostname in self._probing:
+                raise HostUnavailableError(hostname=hostname)
+            self._probing.add(hostname)
+            self.__logger.info(f"Probing host '{hostname}' for recovery.")
+
+    def _record_success(self, hostname: str) -> None:
+        """Closes the circuit for the provided host."""
+        with self._lock:
+            self._statuses[hostname] = HostStatus(hostname=hostname)
+            self._probing.discard(hostname)
+
+    def _record_failure(self, hostname: str, exception: Exception) -> HostStatus:
+        """Counts a connection failure and opens the circuit once the threshold is reached."""
+        with self._lock:
+            status = self._statuses.setdefault(hostname, HostStatus(hostname=hostname))
+            status.consecutive_failures += 1
+            status.last_error = f"{type(exception).__name__}: {exception}"
+            if status.state == self.HALF_OPEN or status.consecutive_failures >= Base.config.failure_threshold:
+                if status.state != self.OPEN:
+                    self.__logger.warning(f"Host '{hostname}' marked as unavailable: {status.last_error}")
+                status.state = self.OPEN
+                status.opened_at = datetime.now()
+            self._probing.discard(hostname)
+            return status.copy()
+
+    def _release(self, hostname: str) -> None:
+        """Ends a recovery probe without changing the state of the circuit."""
+        with self._lock:
+            self._probing.discard(hostname)
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with jitter so that a fleet of workers does not retry in lockstep."""
+        delay = min(self.MAX_BACKOFF, Base.config.retry_backoff * (2**attempt))
+        return delay * random.uniform(0.5, 1.0)  # noqa: S311
+
+    def call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Calls the provided function against the configured host with retries and circuit breaking.
+
+        Args:
+            func (Callable[..., Any]): The function which connects to and executes on the configured host.
+            args (Any): Positional arguments passed to func.
+            kwargs (Any): Keyword arguments passed to func.
+
+        Returns:
+            Any: The return value of func.
+
+        Raises:
+            Exception: Re-raises the last error once retries are exhausted or the error is not transient.
+        """
+        hostname = Base.config.hostname
+        attempt = 0
+        while True:
+            self._acquire(hostname)
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not self.is_transient(e):
+                    self._release(hostname)
+                    raise
+                status = self._record_failure(hostname, e)
+                if attempt >= Base.config.retries or status.state == self.OPEN:
+                    raise
+                delay = self._backoff(attempt)
+                self.__logger.info(
+                    f"Connection to '{hostname}' failed ({status.last_error}). Retrying in {delay:.1f} seconds."
+                )
+                time.sleep(delay)
+                attempt += 1
+            else:
+                self._record_success(hostname)
+                return result
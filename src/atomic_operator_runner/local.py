@@ -1,12 +1,22 @@
 """Runs a command on a local system."""
 # Copyright: (c) 2022, Swimlane <info@swimlane.com>
 # MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import os
 import subprocess
+import tempfile
+import threading
 from typing import Dict
+from typing import List
 from typing import Optional
 
 from .base import Base
+from .cancellation import CancellationToken
+from .cancellation import kill_process_tree
+from .capture import OutputCapture
+from .capture import get_console_encoding
+from .executors import EXECUTORS
 from .processor import Processor
+from .staging import ScriptStager
 from .utils.exceptions import IncorrectExecutorError
 from .utils.exceptions import IncorrectPlatformError
 
@@ -14,6 +24,9 @@ from .utils.exceptions import IncorrectPlatformError
 class LocalRunner(Base):
     """Used to run commands on a local system."""
 
+    # seconds to wait for the output of a timed out command, whose children may keep its output open
+    READER_TIMEOUT = 5
+
     def run(
         self,
         executor: str,
@@ -22,10 +35,12 @@ class LocalRunner(Base):
         shell: bool = False,
         env: Optional[Dict[str, str]] = None,
         cwd: Optional[str] = None,
+        elevation_required: bool = False,
+        cancellation: Optional[CancellationToken] = None,
     ) -> None:
         """Runs the provided command string using the provided executor.
 
-        There are several executors that can be used: sh, bash, powershell and cmd
+        Any executor in the executor registry with a binary on the local platform can be used.
 
         Args:
             executor (str): The executor to use when executing the provided command string.
@@ -34,40 +49,192 @@ class LocalRunner(Base):
             shell (bool, optional): Whether to spawn a new shell or not. Defaults to False.
             env (dict, optional): Environment to use including environmental variables.. Defaults to os.environ.
             cwd (str, optional): The current working directory. Defaults to None.
+            elevation_required (bool, optional): Whether or not to run the command in the elevated session
+                of the local system. Only supported on Linux and macOS. On Windows the command runs
+                unelevated, with a warning, and the response records that elevation was not applied.
+                Defaults to False.
+            cancellation (CancellationToken, optional): Kills the command and the processes it started when
+                cancelled. Defaults to None.
 
         Raises:
             IncorrectExecutorError: Raises when an incorrect executor is provided
             IncorrectPlatformError: Raised when an incorrect platform is provided
         """
-        if not self.COMMAND_MAP.get(executor):
+        spec = EXECUTORS.get(executor)
+        if spec is None:
             raise IncorrectExecutorError(provided_executor=executor)
-        if not self.COMMAND_MAP.get(executor).get(Base.config.platform):
+        _executor = EXECUTORS.path(executor, Base.config.platform)
+        if not _executor:
             raise IncorrectPlatformError(provided_platform=Base.config.platform)
-        _executor = self.COMMAND_MAP[executor][Base.config.platform]
+        staged = ScriptStager().stage(executor, command)
+        if elevation_required and Base.config.platform == "windows":
+            self.__logger.warning(
+                "Elevation is not supported on the local Windows system. Running the command unelevated."
+            )
+            if Base.response is not None:
+                Base.response.elevation_required = False
+        elif elevation_required:
+            self._run_elevated(
+                executor=executor, command=command, timeout=timeout, cwd=cwd, staged=staged, cancellation=cancellation
+            )
+            return
+        script = None
+        if spec.input == "file" and not staged:
+            fd, script = tempfile.mkstemp(suffix=spec.file_extension or "")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(command)
+        if staged:
+            arguments = EXECUTORS.script_arguments(executor, Base.config.platform, staged)
+        else:
+            arguments = EXECUTORS.arguments(executor, Base.config.platform, command=command, script=script)
+        try:
+            self._run(
+                executor=_executor,
+                arguments=arguments,
+                command=command,
+                write_command=spec.input == "stdin" and not staged,
+                timeout=timeout,
+                shell=shell,
+                env=env,
+                cwd=cwd,
+                cancellation=cancellation,
+            )
+        finally:
+            if script:
+                os.remove(script)
+
+    def _run(
+        self,
+        executor: str,
+        arguments: List[str],
+        command: str,
+        write_command: bool,
+        timeout: int,
+        shell: bool,
+        env: Optional[Dict[str, str]],
+        cwd: Optional[str],
+        cancellation: Optional[CancellationToken] = None,
+        platform: Optional[str] = None,
+    ) -> None:
+        """Starts the executor process and records its result.
+
+        Args:
+            executor (str): The path of the executor binary.
+            arguments (List[str]): The binary followed by its arguments.
+            command (str): The command string to run.
+            write_command (bool): Whether or not the command is written to the standard input of the executor.
+            timeout (int): Timeout when running a command.
+            shell (bool): Whether to spawn a new shell or not.
+            env (dict, optional): Environment to use including environmental variables.
+            cwd (str, optional): The current working directory.
+            cancellation (CancellationToken, optional): Kills the process tree when cancelled. Defaults to None.
+            platform (str, optional): The platform the executor runs on. Defaults to the configured platform.
+        """
         self.__logger.debug("Starting a subprocess on the local system.")
         process = subprocess.Popen(
-            _executor,
+            arguments if len(arguments) > 1 else executor,
             shell=shell,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             env=env,
             cwd=cwd,
+            # a session of its own lets a cancellation kill the whole process group
+            start_new_session=cancellation is not None and os.name != "nt",
+        )
+        capture = OutputCapture(
+            max_size=Base.config.max_output_size,
+            encoding=Base.config.encoding,
+            fallback_encoding=get_console_encoding(platform or Base.config.platform, executor),
         )
+        reader = threading.Thread(target=capture.consume, args=(process.stdout,), daemon=True)
+        reader.start()
         try:
             self.__logger.info("Running command now.")
-            outs, errs = process.communicate(bytes(command, "utf-8") + b"\n", timeout=timeout)
+            try:
+                if write_command:
+                    process.stdin.write(bytes(command, "utf-8") + b"\n")
+                process.stdin.close()
+            except BrokenPipeError:
+                self.__logger.debug("Executor closed its input before the full command was written.")
+            if cancellation is None:
+                process.wait(timeout=timeout)
+            else:
+                with cancellation.on_cancel(lambda: kill_process_tree(process)):
+                    process.wait(timeout=timeout)
+            reader.join()
+            output, output_file = capture.close()
             # Adding details to our object response object
             Processor(
-                command=command, executor=_executor, return_code=process.returncode, output=str(outs), errors=str(errs)
+                command=command,
+                executor=executor,
+                return_code=process.returncode,
+                output=output,
+                errors=None,
+                output_file=output_file,
             )
-        except subprocess.TimeoutExpired as e:
-            if e.output:
-                self.__logger.warning(e.output)
-            if e.stdout:
-                self.__logger.warning(e.stdout)
-            if e.stderr:
-                self.__logger.warning(e.stderr)
-            self.__logger.warning("Command timed out!")
+        except subprocess.TimeoutExpired:
+            self._timed_out(process, reader, capture, kill_tree=cancellation is not None)
 
+    def _timed_out(
+        self, process: subprocess.Popen, reader: threading.Thread, capture: OutputCapture, kill_tree: bool
+    ) -> None:
+        """Kills a timed out command and keeps the output it wrote so far on the response."""
+        if kill_tree:
+            kill_process_tree(process)
+        else:
             process.kill()
+        reader.join(timeout=self.READER_TIMEOUT)
+        if reader.is_alive():
+            self.__logger.debug("Output of the timed out command is still open. Keeping the output read so far.")
+        output, output_file = capture.close()
+        if output:
+            self.__logger.warning(output)
+        elif output_file:
+            self.__logger.warning(f"Partial output written to {output_file.path}")
+        if Base.response is not None:
+            # the caller owns the spilled output, like that of any other response
+            Base.response.output = output
+            Base.response.output_file = output_file
+        elif output_file:
+            output_file.remove()
+        self.__logger.warning("Command timed out!")
+
+    def _run_elevated(
+        self,
+        executor: str,
+        command: str,
+        timeout: int,
+        cwd: Optional[str],
+        staged: Optional[str] = None,
+        cancellation: Optional[CancellationToken] = None,
+    ) -> None:
+        """Runs the provided command, or the staged script of it, in the elevated shell of the local system."""
+        from .elevation import ElevatedSession
+
+        self.__logger.info("Running command now in the elevated session.")
+        try:
+            if staged:
+                run = ElevatedSession().run_posix(
+                    ScriptStager().shell_command(executor, staged),
+                    executor="sh",
+                    cwd=cwd,
+                    timeout=timeout,
+                    cancellation=cancellation,
+                )
+            else:
+                run = ElevatedSession().run_posix(
+                    command, executor=executor, cwd=cwd, timeout=timeout, cancellation=cancellation
+                )
+            return_code, output, output_file, errors = run
+        except TimeoutError:
+            self.__logger.warning("Command timed out!")
+            return
+        Processor(
+            command=command,
+            executor=EXECUTORS.path(executor, Base.config.platform),
+            return_code=return_code,
+            output=output,
+            errors=errors or None,
+            output_file=output_file,
+        )
@@ -1,6 +1,10 @@
 """Models to standardize output from this package."""
+import codecs
+import os
 from datetime import datetime
+from typing import Any
 from typing import Dict
+from typing import Iterator
 from typing import List
 from typing import Optional
 
@@ -17,12 +21,98 @@ class Host(BaseModel):
     verify_ssl: bool = False
     ssh_key_path: Optional[str]
     private_key_string: Optional[str]
+    ssh_key_passphrase: Optional[str]
+    allow_agent: bool = True
+    forward_agent: bool = False
     ssh_port: int = 22
     ssh_timeout: int = 5
+    max_channels: int = 10
+    elevation_password: Optional[str]
+    elevation_configuration: str = "Microsoft.PowerShell"
+    elevation_timeout: int = 30
+    bastion_hostname: Optional[str]
+    bastion_port: int = 22
+    bastion_username: Optional[str]
+    bastion_password: Optional[str]
+    bastion_ssh_key_path: Optional[str]
+    max_output_size: int = 10485760
+    encoding: Optional[str]
+    compression: str = "off"
+    compression_threshold: int = 1048576
+    staging_threshold: int = 0
+    profile: str = "off"
+    profile_directory: Optional[str]
+    process_workers: int = 0
+    discover_facts: bool = False
+    facts_ttl: int = 3600
+    retries: int = 2
+    retry_backoff: float = 1.0
+    failure_threshold: int = 3
+    recovery_timeout: float = 60.0
+    aws_profile: Optional[str]
+    aws_region: Optional[str]
+    aws_endpoint_url: Optional[str]
     platform: Optional[str]
     run_type: Optional[str]
 
 
+class Executor(BaseModel):
+    """How commands are ran by an executor."""
+
+    name: str
+    paths: Dict[str, str] = {}
+    arguments: List[str] = []
+    input: str = "stdin"
+    file_extension: Optional[str]
+    file_arguments: Optional[List[str]]
+    transport: str = "ssh"
+    transports: Dict[str, str] = {}
+    native: bool = False
+    elevation: Optional[str]
+
+
+class HostFacts(BaseModel):
+    """Facts discovered about a host."""
+
+    hostname: Optional[str]
+    platform: Optional[str]
+    os_version: Optional[str]
+    user: Optional[str]
+    executors: List[str] = []
+    can_elevate: Optional[bool]
+    powershell_version: Optional[str]
+    discovered_at: datetime
+
+
+class AWSAction(BaseModel):
+    """An AWS API call made through botocore."""
+
+    service: str
+    operation: str
+    parameters: Dict[str, Any] = {}
+
+
+class HostStatus(BaseModel):
+    """Connection health of a remote host."""
+
+    hostname: str
+    state: str = "closed"
+    consecutive_failures: int = 0
+    opened_at: Optional[datetime]
+    last_error: Optional[str]
+
+
+class WarmupResult(BaseModel):
+    """Connection latency of a host whose sessions were opened ahead of time."""
+
+    hostname: Optional[str]
+    platform: Optional[str]
+    connected: bool = False
+    connect_latency: Optional[float]
+    elevation_latency: Optional[float]
+    error: Optional[str]
+
+
 class BaseRecord(BaseModel):
     """Base record model used by Remote communications."""
 
@@ -34,6 +124,103 @@ class BaseRecord(BaseModel):
     native_thread_id: Optional[int] = Field(alias="native-thread-id")
     managed_thread_id: Optional[int] = Field(alias="managed-thread-id")
     extra: Optional[Dict[str, str]]
+    count: int = 1
+
+
+class OutputFile(BaseModel):
+    """Reference to command output that exceeded the in-memory limit and was written to disk.
+
+    The file belongs to the caller and is not removed automatically. Call remove once the output
+    is no longer needed.
+    """
+
+    path: str
+    size: int = 0
+    encoding: str = "utf-8"
+    head: Optional[str]
+    tail: Optional[str]
+
+    def read(self, size: int = -1, offset: int = 0) -> bytes:
+        """Reads raw bytes from the spilled output file.
+
+        Args:
+            size (int, optional): The number of bytes to read. Defaults to -1 (everything).
+            offset (int, optional): The byte offset to start reading from. Defaults to 0.
+
+        Returns:
+            bytes: The requested bytes of the output.
+        """
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+    def remove(self) -> None:
+        """Deletes the spilled output file, unless it has already been deleted."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def iter_chunks(self, chunk_size: int = 65536) -> Iterator[bytes]:
+        """Lazily iterates over the spilled output file in chunks.
+
+        Args:
+            chunk_size (int, optional): The size of each chunk in bytes. Defaults to 65536.
+
+        Yields:
+            bytes: The next chunk of output.
+        """
+        with open(self.path, "rb") as f:
+            chunk = f.read(chunk_size)
+            while chunk:
+                yield chunk
+                chunk = f.read(chunk_size)
+
+    def iter_text(self, chunk_size: int = 65536) -> Iterator[str]:
+        """Lazily decodes the spilled output file in chunks.
+
+        Multi-byte characters split across chunk boundaries are decoded correctly.
+
+        Args:
+            chunk_size (int, optional): The number of bytes read per chunk. Defaults to 65536.
+
+        Yields:
+            str: The next chunk of decoded output.
+        """
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        for chunk in self.iter_chunks(chunk_size=chunk_size):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+
+class PhaseProfile(BaseModel):
+    """Time and memory used by one phase of an execution."""
+
+    phase: str
+    duration: Optional[float]
+    rss_before: Optional[int]
+    rss_after: Optional[int]
+    peak_rss: Optional[int]
+    allocated_blocks: Optional[int]
+    collections: Optional[int]
+    traced_memory: Optional[int]
+    peak_traced_memory: Optional[int]
+    top_allocations: List[str] = []
+    cpu_report: Optional[str]
+    reports: List[str] = []
+
+
+class PatternMatch(BaseModel):
+    """A match of a watched pattern in command output."""
+
+    pattern: str
+    text: str
+    line: str
+    offset: int
 
 
 class TargetEnvironment(BaseModel):
@@ -44,6 +231,30 @@ class TargetEnvironment(BaseModel):
     user: Optional[str]
 
 
+class Prerequisite(BaseModel):
+    """A check command and the command which installs what the check looks for."""
+
+    name: str
+    check_command: str
+    install_command: Optional[str]
+    executor: Optional[str]
+    depends_on: List[str] = []
+
+
+class PrerequisiteResult(BaseModel):
+    """The outcome of checking and, when needed, installing a prerequisite."""
+
+    name: str
+    satisfied: bool = False
+    installed: bool = False
+    skipped: bool = False
+    check_return_code: Optional[int]
+    check_output: Optional[str]
+    install_return_code: Optional[int]
+    install_output: Optional[str]
+    recheck_return_code: Optional[int]
+
+
 class RunnerResponse(BaseModel):
     """Model representing common output data."""
 
@@ -51,8 +262,70 @@ class RunnerResponse(BaseModel):
     command: Optional[str]
     executor: Optional[str]
     elevation_required: Optional[bool]
+    cancelled: bool = False
     start_timestamp: Optional[datetime]
     end_timestamp: Optional[datetime]
     return_code: Optional[int] = Field(alias="return-code")
     output: Optional[str]
+    output_file: Optional[OutputFile]
     records: Optional[List[BaseRecord]] = []
+    dropped_records: Optional[Dict[str, int]] = {}
+    prerequisites: Optional[List[PrerequisiteResult]] = []
+    profile: List[PhaseProfile] = []
+    matches: List[PatternMatch] = []
+    stopped_on_match: bool = False
+
+
+class Job(BaseModel):
+    """A command scheduled to run against a host."""
+
+    command: str
+    executor: str
+    host: Optional[Host]
+    cwd: Optional[str]
+    elevation_required: bool = False
+    priority: int = 0
+
+
+class SchedulerMetrics(BaseModel):
+    """Progress and throughput of a scheduler."""
+
+    queued: int = 0
+    running: int = 0
+    completed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+    throughput: float = 0.0
+    queue_depth: Dict[str, int] = {}
+
+
+class StoredResult(BaseModel):
+    """Summary of a response kept in a result store."""
+
+    id: int
+    run: str
+    hostname: Optional[str]
+    command: Optional[str]
+    command_hash: Optional[str]
+    executor: Optional[str]
+    return_code: Optional[int]
+    start_timestamp: Optional[datetime]
+    end_timestamp: Optional[datetime]
+    output_hash: Optional[str]
+    output_size: Optional[int]
+    record_count: int = 0
+
+
+class ResultDiff(BaseModel):
+    """A difference between the same execution in two stored runs."""
+
+    change: str
+    hostname: Optional[str]
+    command: Optional[str]
+    executor: Optional[str]
+    before_return_code: Optional[int]
+    after_return_code: Optional[int]
+    output_changed: bool = False
+    before_id: Optional[int]
+    after_id: Optional[int]
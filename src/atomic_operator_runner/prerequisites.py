@@ -0,0 +1,168 @@
+"""Checks and installs prerequisites before an execution."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import TYPE_CHECKING
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from .base import Base
+from .models import Host
+from .models import Prerequisite
+from .models import PrerequisiteResult
+from .models import RunnerResponse
+from .utils.exceptions import PrerequisiteDependencyError
+
+
+if TYPE_CHECKING:
+    from .runner import Runner
+
+
+class PrerequisiteRunner(Base):
+    """Runs the check commands of all prerequisites at once and installs only what is missing.
+
+    Installs run in dependency order. Prerequisites whose dependencies are satisfied at the same
+    time are installed concurrently, and a prerequisite is skipped when one of its dependencies
+    could not be satisfied.
+    """
+
+    def __init__(
+        self,
+        runner: "Runner",
+        executor: str,
+        cwd: Optional[str] = None,
+        elevation_required: bool = False,
+        max_workers: int = 4,
+    ) -> None:
+        """Runs prerequisites using the provided runner.
+
+        Args:
+            runner (Runner): The runner used to execute check and install commands.
+            executor (str): The executor used for prerequisites which do not declare their own.
+            cwd (str, optional): The current working directory. Defaults to None.
+            elevation_required (bool, optional): Whether or not elevation is required. Defaults to False.
+            max_workers (int, optional): The maximum number of commands running at once. Defaults to 4.
+        """
+        self.runner = runner
+        self.executor = executor
+        self.cwd = cwd
+        self.elevation_required = elevation_required
+        self.max_workers = max_workers
+
+    def _order(self, prerequisites: List[Prerequisite]) -> List[List[Prerequisite]]:
+        """Groups prerequisites into levels which only depend on earlier levels.
+
+        Args:
+            prerequisites (List[Prerequisite]): The prerequisites to order.
+
+        Raises:
+            PrerequisiteDependencyError: Raised when a name is repeated, a dependency is unknown or
+                dependencies form a cycle.
+
+        Returns:
+            List[List[Prerequisite]]: The prerequisites grouped by dependency level.
+        """
+        by_name = {prerequisite.name: prerequisite for prerequisite in prerequisites}
+        if len(by_name) != len(prerequisites):
+            raise PrerequisiteDependencyError(reason="Prerequisite names must be unique.")
+        for prerequisite in prerequisites:
+            unknown = [name for name in prerequisite.depends_on if name not in by_name]
+            if unknown:
+                raise PrerequisiteDependencyError(
+                    reason=f"'{prerequisite.name}' depends on unknown prerequisites: {', '.join(unknown)}."
+                )
+        levels: List[List[Prerequisite]] = []
+        remaining = list(prerequisites)
+        ordered: set = set()
+        while remaining:
+            level = [p for p in remaining if all(name in ordered for name in p.depends_on)]
+            if not level:
+                raise PrerequisiteDependencyError(
+                    reason=f"Circular dependency between: {', '.join(p.name for p in remaining)}."
+                )
+            levels.append(level)
+            ordered.update(p.name for p in level)
+            remaining = [p for p in remaining if p.name not in ordered]
+        return levels
+
+    def _execute(self, config: Host, command: str, executor: Optional[str]) -> Optional[RunnerResponse]:
+        """Runs a single command in its own execution context, returning None when it could not be ran."""
+        with self.execution_context(config=config):
+            try:
+                return self.runner._execute(
+                    command=command,
+                    executor=executor or self.executor,
+                    cwd=self.cwd,
+                    elevation_required=self.elevation_required,
+                )
+            except Exception as e:
+                self.__logger.warning(f"Unable to run prerequisite command '{command}'. {e}")
+                return None
+
+    def _check(self, config: Host, prerequisite: Prerequisite) -> PrerequisiteResult:
+        """Runs the check command of the provided prerequisite."""
+        response = self._execute(config, prerequisite.check_command, prerequisite.executor)
+        return_code = response.return_code if response else None
+        return PrerequisiteResult(
+            name=prerequisite.name,
+            satisfied=return_code == 0,
+            check_return_code=return_code,
+            check_output=response.output if response else None,
+        )
+
+    def _install(self, config: Host, prerequisite: Prerequisite, result: PrerequisiteResult) -> None:
+        """Runs the install command of the provided prerequisite and checks it again."""
+        response = self._execute(config, prerequisite.install_command, prerequisite.executor)
+        result.installed = True
+        result.install_return_code = response.return_code if response else None
+        result.install_output = response.output if response else None
+        recheck = self._execute(config, prerequisite.check_command, prerequisite.executor)
+        result.recheck_return_code = recheck.return_code if recheck else None
+        result.satisfied = result.recheck_return_code == 0
+
+    def run(self, prerequisites: List[Prerequisite]) -> RunnerResponse:
+        """Checks all prerequisites and installs the ones which are not satisfied.
+
+        Args:
+            prerequisites (List[Prerequisite]): The prerequisites to check.
+
+        Returns:
+            RunnerResponse: A response with a result for each prerequisite, in the order they were provided.
+                Its return code is 0 when every prerequisite is satisfied and 1 otherwise.
+        """
+        levels = self._order(prerequisites)
+        response = self.runner._new_response()
+        response.command = ", ".join(prerequisite.name for prerequisite in prerequisites)
+        response.executor = self.executor
+        response.elevation_required = self.elevation_required
+        # the config of the calling thread is read here, since worker threads only see the shared config
+        config = Base.config
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results: Dict[str, PrerequisiteResult] = {
+                result.name: result for result in pool.map(partial(self._check, config), prerequisites)
+            }
+            for level in levels:
+                installs = []
+                for prerequisite in level:
+                    result = results[prerequisite.name]
+                    if result.satisfied:
+                        continue
+                    unsatisfied = [name for name in prerequisite.depends_on if not results[name].satisfied]
+                    if unsatisfied or not prerequisite.install_command:
+                        result.skipped = True
+                        if unsatisfied:
+                            self.__logger.warning(
+                                f"Skipping install of '{prerequisite.name}'. Unsatisfied dependencies: "
+                                f"{', '.join(unsatisfied)}."
+                            )
+                        continue
+                    installs.append(pool.submit(self._install, config, prerequisite, result))
+                for install in installs:
+                    install.result()
+        response.prerequisites = [results[prerequisite.name] for prerequisite in prerequisites]
+        response.return_code = 0 if all(result.satisfied for result in response.prerequisites) else 1
+        response.end_timestamp = datetime.now()
+        return response
@@ -1,20 +1,88 @@
 """Processes output and save response objects for an execution."""
+import logging
+import multiprocessing
 import re
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from typing import Any
+from typing import Dict
 from typing import List
+from typing import Optional
+from typing import Tuple
 from typing import Union
 
 from pypsrp.powershell import PSDataStreams
 
 from .base import Base
 from .models import BaseRecord
+from .models import OutputFile
+from .models import RunnerResponse
+from .profiling import Profiler
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Returns the process pool shared by all executions, creating it on first use.
+
+    Worker processes are spawned rather than forked because the parent process runs many threads.
+    When a different number of workers is asked for, the pool is replaced. The old pool finishes
+    the work already submitted to it.
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is not None and _pool_size != max_workers:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+            _pool_size = max_workers
+        return _pool
+
+
+def _process_in_worker(
+    response: RunnerResponse, errors: Any, include_output: bool
+) -> Tuple[List[BaseRecord], Dict[str, int], List[Tuple[str, str]]]:
+    """Builds the records and log messages of a response in a worker process.
+
+    Args:
+        response (RunnerResponse): The response, holding only a preview of the output.
+        errors (Any): Errors that may have occurred.
+        include_output (bool): Whether or not a log message for the output is wanted.
+
+    Returns:
+        Tuple[List[BaseRecord], Dict[str, int], List[Tuple[str, str]]]: The records, the number of dropped
+            records per type and the (level, message) pairs to log.
+    """
+    with Base.execution_context(response=response):
+        processor = Processor.__new__(Processor)
+        processor._capture_base_records(data=errors)
+        return response.records, response.dropped_records, processor._log_messages(include_output=include_output)
 
 
 class Processor(Base):
     """Process the provided data and displays information as needed."""
 
-    def __init__(self, command: str, executor: str, return_code: int, output: str, errors: Any) -> None:
+    MAX_RECORDS_PER_TYPE = 1000
+    MAX_MESSAGE_SIZE = 65536
+    MAX_EXTRA_VALUE_SIZE = 4096
+    MAX_LOG_OUTPUT_SIZE = 8192
+    MAX_LOGGED_RECORDS = 20
+
+    def __init__(
+        self,
+        command: str,
+        executor: str,
+        return_code: int,
+        output: Optional[str],
+        errors: Any,
+        output_file: Optional[OutputFile] = None,
+    ) -> None:
         """Processes and displays output from a command execution.
 
         Args:
@@ -23,80 +91,172 @@ class Processor(Base):
             return_code (int): The return code (if available).
             output (str): The output string.
             errors (Any): Errors that may have occurred. Can be a string or dict or PSDataStreams type.
+            output_file (OutputFile, optional): The spilled output when it exceeded the in-memory limit.
+                Defaults to None.
         """
         self.response.command = command
         self.response.executor = executor
         self.response.end_timestamp = datetime.now()
         self.response.output = output
+        self.response.output_file = output_file
         self.response.return_code = return_code
 
         if isinstance(errors, bytes):
             errors = errors.decode("utf-8", "ignore")
 
-        self._capture_base_records(data=errors)
-        self._print()
+        with Profiler().phase("process"):
+            if Base.config is not None and Base.config.process_workers > 0:
+                self._process_in_pool(errors=errors)
+            else:
+                self._capture_base_records(data=errors)
+                self._print()
+
+    def _process_in_pool(self, errors: Any) -> None:
+        """Builds records and log messages in the shared process pool, off the thread running the command.
+
+        Only a preview of the output is sent to the worker. Errors which cannot be sent to another
+        process are processed on the current thread instead.
+
+        Args:
+            errors (Any): Errors that may have occurred.
+        """
+        preview = self.response.copy(
+            update={"output": self._log_preview(self.response.output) if self.response.output else None}
+        )
+        try:
+            records, dropped_records, messages = (
+                _get_pool(Base.config.process_workers)
+                .submit(_process_in_worker, preview, errors, self.__logger.isEnabledFor(logging.INFO))
+                .result()
+            )
+        except Exception as e:
+            self.__logger.debug(f"Unable to process output in a worker process. Processing it here. {e}")
+            self._capture_base_records(data=errors)
+            self._print()
+            return
+        self.response.records = records
+        self.response.dropped_records = dropped_records
+        for level, message in messages:
+            getattr(self.__logger, level)(message)
 
     def _capture_base_records(self, data: Any) -> None:
-        """Builds and captures a BaseRecord object and returns it.
+        """Builds and captures BaseRecord objects on the response.
+
+        Repeated messages are stored once with a count and at most MAX_RECORDS_PER_TYPE records are
+        kept for each record type. The number of records dropped is stored per type on the response.
 
         Args:
             data (Any): Data to build a BaseRecord from.
         """
-        record: Union[BaseRecord, List[BaseRecord]] = None
+        records: List[BaseRecord] = []
         if isinstance(data, dict):
             try:
                 record = BaseRecord(**data)
             except Exception as e:
                 self.__logger.warning("Unable to save error data as BaseRecord object. Will manually create it.")
                 record = BaseRecord()
-                record.extra = data
+                record.extra = {key: self._truncate(str(val), self.MAX_EXTRA_VALUE_SIZE) for key, val in data.items()}
                 self.__logger.debug(e)
+            key = (record.type, record.message_data)
+            if self._track_record(*key):
+                record.message_data = self._truncate(record.message_data, self.MAX_MESSAGE_SIZE)
+                records.append(self._index_record(record, key=key))
         elif isinstance(data, str) and data:
-            record = BaseRecord()
-            record.type = "error"
-            record.message_data = data
+            if self._track_record("error", data):
+                record = BaseRecord()
+                record.type = "error"
+                record.message_data = self._truncate(data, self.MAX_MESSAGE_SIZE)
+                records.append(self._index_record(record, key=("error", data)))
         elif isinstance(data, PSDataStreams):
-            record = self._handle_windows_streams(stream=data)
+            records = self._handle_windows_streams(stream=data)
 
-        if not isinstance(record, list):
-            record = [record]
         if not self.response.records:
-            self.response.records = record
+            self.response.records = records
         else:
-            self.response.records.extend(record)
+            self.response.records.extend(records)
+
+    def _record_index(self) -> Dict[Tuple[Optional[str], Optional[str]], BaseRecord]:
+        """Returns the records of the current response indexed by type and message."""
+        if getattr(self, "_index", None) is None or self._indexed_response is not self.response:
+            self._indexed_response = self.response
+            self._index = {(r.type, r.message_data): r for r in self.response.records or [] if r is not None}
+            self._type_counts = Counter(r.type for r in self.response.records or [] if r is not None)
+            if self.response.dropped_records is None:
+                self.response.dropped_records = {}
+        return self._index
+
+    def _track_record(self, record_type: Optional[str], message: Optional[str]) -> bool:
+        """Checks whether a new record should be created for the provided type and message.
+
+        Args:
+            record_type (str): The type of record.
+            message (str): The message of the record.
+
+        Returns:
+            bool: True when a new record should be created. False when the record duplicates an earlier one
+                (its count is incremented) or the limit for the record type has been reached.
+        """
+        index = self._record_index()
+        existing = index.get((record_type, message))
+        if existing is not None:
+            existing.count += 1
+            return False
+        if self._type_counts[record_type] >= self.MAX_RECORDS_PER_TYPE:
+            key = record_type or "unknown"
+            self.response.dropped_records[key] = self.response.dropped_records.get(key, 0) + 1
+            return False
+        self._type_counts[record_type] += 1
+        return True
+
+    def _index_record(self, record: BaseRecord, key: Tuple[Optional[str], Optional[str]]) -> BaseRecord:
+        """Remembers a newly created record so later duplicates are counted against it."""
+        self._record_index()[key] = record
+        return record
+
+    def _truncate(self, value: Optional[str], size: int) -> Optional[str]:
+        """Truncates the provided string to the provided size."""
+        if value is None or len(value) <= size:
+            return value
+        return f"{value[:size]}... [truncated {len(value) - size} characters]"
 
     def _parse_data_record(self, data: Any, record_type: str) -> BaseRecord:
         """Parses the InformationRecord data out of the response stream."""
         extra_dict = {}
         for i in dir(data):
             if not i.startswith("_"):
-                extra_dict[i] = str(getattr(data, i))
-        if hasattr(data, "message_data"):
-            message = data.message_data
-        else:
-            message = data.message
+                extra_dict[i] = self._truncate(str(getattr(data, i)), self.MAX_EXTRA_VALUE_SIZE)
         data_dict = {
-            "type": record_type,
-            "message-data": message,
+            "record-type": record_type,
+            "message": self._truncate(self._get_message(data), self.MAX_MESSAGE_SIZE),
             "source": data.source if hasattr(data, "source") else None,
-            "time_generated": data.time_generated if hasattr(data, "time_generated") else None,
-            "user": data.user if hasattr(data, "user") else None,
-            "computer": data.computer if hasattr(data, "computer") else None,
-            "pid": data.pid if hasattr(data, "pid") else None,
-            "native_thread_id": data.native_thread_id if hasattr(data, "native_thread_id") else None,
-            "managed_thread_id": data.managed_thread_id if hasattr(data, "managed_thread_id") else None,
+            "time-generated": data.time_generated if hasattr(data, "time_generated") else None,
+            "process-id": data.pid if hasattr(data, "pid") else None,
+            "native-thread-id": data.native_thread_id if hasattr(data, "native_thread_id") else None,
+            "managed-thread-id": data.managed_thread_id if hasattr(data, "managed_thread_id") else None,
             "extra": extra_dict,
         }
         return BaseRecord(**data_dict)
 
+    def _get_message(self, data: Any) -> Optional[str]:
+        """Returns the message of a PowerShell stream record."""
+        if hasattr(data, "message_data"):
+            return data.message_data
+        return getattr(data, "message", None)
+
     def _handle_windows_streams(self, stream: PSDataStreams) -> List[BaseRecord]:
-        """Handles processing of all types of message strings from windows systems."""
+        """Handles processing of all types of message strings from windows systems.
+
+        Duplicates and records over the per type limit are counted before they are parsed.
+        """
         return_list = []
         for item in ["error", "debug", "information", "verbose", "warning"]:
             if hasattr(stream, item) and getattr(stream, item):
                 for i in getattr(stream, item):
                     if i and i is not None:
-                        return_list.append(self._parse_data_record(i, item))
+                        message = self._get_message(i)
+                        if self._track_record(item, message):
+                            record = self._parse_data_record(i, item)
+                            return_list.append(self._index_record(record, key=(item, message)))
         return return_list
 
     def _clean_output(self, data: Union[str, bytes]) -> str:
@@ -117,24 +277,77 @@ class Processor(Base):
         return_data = re.sub(r"(\r?\n)*[A-Z]\:.+?\>", "", str(return_data))
         return str(return_data)
 
-    def _print(self) -> None:
-        """Displays and logs data regarding the results of the execution."""
-        self.__logger.debug("Processing command output.")
+    def _log_preview(self, data: str) -> str:
+        """Shortens large output to its head and tail before it is cleaned and logged."""
+        if len(data) <= self.MAX_LOG_OUTPUT_SIZE:
+            return data
+        half = self.MAX_LOG_OUTPUT_SIZE // 2
+        return f"{data[:half]}\n... [{len(data) - self.MAX_LOG_OUTPUT_SIZE} characters not shown] ...\n{data[-half:]}"
+
+    def _log_messages(self, include_output: bool = True) -> List[Tuple[str, str]]:
+        """Builds the messages which describe the results of the execution.
+
+        Args:
+            include_output (bool, optional): Whether or not to include a preview of the output. Defaults to True.
+
+        Returns:
+            List[Tuple[str, str]]: The log level and message of each message.
+        """
+        messages: List[Tuple[str, str]] = []
+        if self.response.dropped_records:
+            messages.append(
+                (
+                    "warning",
+                    "Records were dropped after reaching the limit of "
+                    f"{self.MAX_RECORDS_PER_TYPE} per type: {self.response.dropped_records}",
+                )
+            )
         if self.response.output:
-            self.__logger.info(f"\n\nOutput: {self._clean_output(self.response.output)}")
+            if include_output:
+                messages.append(("info", f"\n\nOutput: {self._clean_output(self._log_preview(self.response.output))}"))
+        elif self.response.output_file:
+            messages.append(
+                (
+                    "info",
+                    f"\n\nOutput ({self.response.output_file.size} bytes) written to {self.response.output_file.path}"
+                    f"\n\nHead: {self._clean_output(self.response.output_file.head)}"
+                    f"\n...\nTail: {self._clean_output(self.response.output_file.tail)}",
+                )
+            )
         elif self.response.records:
-            self.__logger.warning(
-                f"\n\nCommand: {self.response.command} returned exit code {self.response.return_code}"
+            messages.append(
+                (
+                    "warning",
+                    f"\n\nCommand: {self.response.command} returned exit code {self.response.return_code}",
+                )
             )
-            for item in self.response.records:
+            for item in self.response.records[: self.MAX_LOGGED_RECORDS]:
                 if item.extra and item.extra.get("exception"):
-                    self.__logger.warning(f"\n{self._clean_output(item.extra['exception'])}")
+                    messages.append(("warning", f"\n{self._clean_output(self._log_preview(item.extra['exception']))}"))
                 elif item.message_data:
-                    self.__logger.warning(f"\n{self._clean_output(item.message_data)}")
+                    messages.append(("warning", f"\n{self._clean_output(self._log_preview(item.message_data))}"))
                 else:
-                    self.__logger.warning(
-                        "\nAn error occurred but we are unable to display it correctly. "
-                        "Please see the full response output for more details."
+                    messages.append(
+                        (
+                            "warning",
+                            "\nAn error occurred but we are unable to display it correctly. "
+                            "Please see the full response output for more details.",
+                        )
+                    )
+            if len(self.response.records) > self.MAX_LOGGED_RECORDS:
+                messages.append(
+                    (
+                        "warning",
+                        f"\n{len(self.response.records) - self.MAX_LOGGED_RECORDS} more records not shown. "
+                        "Please see the full response output for more details.",
                     )
+                )
         else:
-            self.__logger.info("(No output found)")
+            messages.append(("info", "(No output found)"))
+        return messages
+
+    def _print(self) -> None:
+        """Displays and logs data regarding the results of the execution."""
+        self.__logger.debug("Processing command output.")
+        for level, message in self._log_messages(include_output=self.__logger.isEnabledFor(logging.INFO)):
+            getattr(self.__logger, level)(message)
@@ -0,0 +1,209 @@
+"""Measures the time and memory used by each phase of an execution."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import cProfile
+import gc
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+from .base import Base
+from .models import PhaseProfile
+
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None  # type: ignore[assignment]
+
+
+class Profiler(Base):
+    """Records a PhaseProfile on the current response for every phase ran while profiling is enabled.
+
+    Host.profile is one of:
+
+    - "off" records nothing.
+    - "basic" records the duration, resident memory, allocated memory blocks and garbage collections.
+    - "memory" additionally traces Python allocations with tracemalloc and records the largest
+      allocations of the execution.
+    - "cpu" additionally profiles the execution with cProfile.
+    - "full" records everything.
+
+    Phases are nested: "execute" covers a whole call of Runner._execute, "run" the command being
+    ran by the local or remote runner and "process" the Processor handling its result. Allocation
+    tracing and cProfile only cover the "execute" phase, whose reports include the nested phases.
+
+    Memory figures are taken from the whole process, so executions running at the same time are
+    included in each others measurements. cProfile only profiles the thread running the execution.
+    When Host.profile_directory is set, the cProfile statistics and tracemalloc snapshots of every
+    execution are written there for offline analysis with pstats or tracemalloc.
+    """
+
+    OFF = "off"
+    BASIC = "basic"
+    MEMORY = "memory"
+    CPU = "cpu"
+    FULL = "full"
+    MODES = [OFF, BASIC, MEMORY, CPU, FULL]
+    OUTER_PHASE = "execute"
+    TOP_ALLOCATIONS = 10
+    TOP_FUNCTIONS = 25
+
+    _hooks: List[Callable[[str, PhaseProfile], None]] = []
+    _lock = threading.Lock()
+
+    @staticmethod
+    def add_hook(hook: Callable[[str, PhaseProfile], None]) -> None:
+        """Adds a callable which is called with "start" or "end" and the profile of the phase around every phase.
+
+        Args:
+            hook (Callable[[str, PhaseProfile], None]): The callable. The profile passed on "start"
+                only holds the phase and the values measured before it.
+        """
+        with Profiler._lock:
+            Profiler._hooks.append(hook)
+
+    @staticmethod
+    def remove_hook(hook: Callable[[str, PhaseProfile], None]) -> None:
+        """Removes a callable added with add_hook."""
+        with Profiler._lock:
+            if hook in Profiler._hooks:
+                Profiler._hooks.remove(hook)
+
+    def enabled(self) -> bool:
+        """Whether or not profiling is enabled for the configured host."""
+        return Base.config is not None and Base.config.profile != self.OFF
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[Optional[PhaseProfile]]:
+        """Measures the enclosed block as a phase of the current execution.
+
+        Args:
+            name (str): The name of the phase.
+
+        Yields:
+            Optional[PhaseProfile]: The profile being recorded or None when profiling is disabled.
+        """
+        if not self.enabled():
+            yield None
+            return
+        mode = Base.config.profile
+        outer = name == self.OUTER_PHASE
+        trace = outer and mode in (self.MEMORY, self.FULL)
+        if trace and not tracemalloc.is_tracing():
+            # tracing stays on once started, since stopping it discards the traces of other executions
+            tracemalloc.start()
+        profile = PhaseProfile(
+            phase=name,
+            rss_before=self._rss(),
+            allocated_blocks=sys.getallocatedblocks(),
+            traced_memory=tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+        )
+        if Base.response is not None:
+            Base.response.profile.append(profile)
+        self._call_hooks("start", profile)
+        collections = self._collections()
+        snapshot = tracemalloc.take_snapshot() if trace else None
+        profiler = self._start_cpu_profile() if outer and mode in (self.CPU, self.FULL) else None
+        start = time.perf_counter()
+        try:
+            yield profile
+        finally:
+            profile.duration = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            profile.rss_after = self._rss()
+            profile.peak_rss = self._peak_rss()
+            profile.allocated_blocks = sys.getallocatedblocks() - profile.allocated_blocks
+            profile.collections = self._collections() - collections
+            if tracemalloc.is_tracing() and profile.traced_memory is not None:
+                current, peak = tracemalloc.get_traced_memory()
+                profile.traced_memory = current - profile.traced_memory
+                profile.peak_traced_memory = peak
+            if snapshot is not None:
+                self._record_allocations(profile, snapshot)
+            if profiler is not None:
+                self._record_cpu_profile(profile, profiler)
+            self._call_hooks("end", profile)
+
+    def _call_hooks(self, event: str, profile: PhaseProfile) -> None:
+        """Calls every hook, logging instead of raising errors so that profiling never fails an execution."""
+        with Profiler._lock:
+            hooks = list(Profiler._hooks)
+        for hook in hooks:
+            try:
+                hook(event, profile)
+            except Exception as e:
+                self.__logger.warning(f"Profiling hook {hook!r} failed on {event} of phase '{profile.phase}'. {e}")
+
+    def _start_cpu_profile(self) -> Optional[cProfile.Profile]:
+        """Starts a cProfile profiler on the current thread or returns None when another profiler is active."""
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            self.__logger.debug(f"Unable to start cProfile. {e}")
+            return None
+        return profiler
+
+    def _collections(self) -> int:
+        """Returns the number of garbage collections ran so far over all generations."""
+        return sum(generation["collections"] for generation in gc.get_stats())
+
+    def _rss(self) -> Optional[int]:
+        """Returns the resident memory of the process in bytes or None when it cannot be read."""
+        try:
+            with open("/proc/self/statm", "rb") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError, AttributeError):
+            return None
+
+    def _peak_rss(self) -> Optional[int]:
+        """Returns the peak resident memory of the process in bytes or None when it is not available."""
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    def _record_allocations(self, profile: PhaseProfile, before: tracemalloc.Snapshot) -> None:
+        """Stores the lines which allocated the most memory since the provided snapshot."""
+        after = tracemalloc.take_snapshot()
+        profile.top_allocations = [
+            str(statistic) for statistic in after.compare_to(before, "lineno")[: self.TOP_ALLOCATIONS]
+        ]
+        path = self._report_path("tracemalloc")
+        if path:
+            after.dump(path)
+            profile.reports.append(path)
+
+    def _record_cpu_profile(self, profile: PhaseProfile, profiler: cProfile.Profile) -> None:
+        """Stores the functions which took the most time or writes the statistics to the profile directory."""
+        path = self._report_path("prof")
+        if path:
+            profiler.dump_stats(path)
+            profile.reports.append(path)
+            return
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(self.TOP_FUNCTIONS)
+        profile.cpu_report = stream.getvalue()
+
+    def _report_path(self, extension: str) -> Optional[str]:
+        """Returns a unique path in the profile directory for a report of the current execution."""
+        if not Base.config.profile_directory:
+            return None
+        os.makedirs(Base.config.profile_directory, exist_ok=True)
+        hostname = re.sub(r"[^\w.-]", "_", Base.config.hostname or "localhost")
+        name = f"{datetime.now():%Y%m%d%H%M%S%f}-{hostname}-{threading.get_ident()}.{extension}"
+        return os.path.join(Base.config.profile_directory, name)
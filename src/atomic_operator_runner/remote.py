@@ -1,16 +1,45 @@
 """Used to run commands remotely."""
 # Copyright: (c) 2022, Swimlane <info@swimlane.com>
 # MIT License (see LICENSE or https://opensource.org/licenses/MIT)
-import atexit
+import base64
+import binascii
 import os
+import shlex
+import threading
+import uuid
+from contextlib import contextmanager
+from contextlib import nullcontext
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
 
-from paramiko.client import AutoAddPolicy
 from paramiko.client import SSHClient
-from paramiko.pkey import PKey
 from pypsrp.client import Client
+from pypsrp.exceptions import WSManFaultError
+from pypsrp.powershell import PowerShell
+from pypsrp.powershell import PSDataStreams
+from pypsrp.powershell import RunspacePool
+from pypsrp.shell import Process
+from pypsrp.shell import SignalCode
 
 from .base import Base
+from .cancellation import CancellationToken
+from .cancellation import invoke_powershell
+from .cancellation import invoke_process
+from .capture import OutputCapture
+from .capture import get_console_encoding
+from .compression import Compression
+from .connections import SSHConnectionPool
+from .connections import WinRMClientPool
+from .connections import WinRSShellPool
+from .elevation import ElevatedSession
+from .executors import EXECUTORS
+from .health import HostHealth
+from .models import OutputFile
 from .processor import Processor
+from .staging import ScriptStager
+from .utils.exceptions import HostUnavailableError
 from .utils.exceptions import IncorrectExecutorError
 from .utils.exceptions import RemoteRunnerExecutionError
 
@@ -18,6 +47,9 @@ from .utils.exceptions import RemoteRunnerExecutionError
 class RemoteRunner(Base):
     """Used to run command remotely."""
 
+    WINRM_HTTP_PORT = 5985
+    WINRM_HTTPS_PORT = 5986
+
     def _copy_file_to_windows(
         self, source: str, desintation: str, executor: str, elevation_required: bool = False
     ) -> bool:
@@ -36,13 +68,16 @@ class RemoteRunner(Base):
             if executor == "powershell":
                 command = f"New-Item -Path {os.path.dirname(desintation)} -ItemType Directory"
                 if elevation_required:
-                    command = f"Start-Process PowerShell -Verb RunAs; {command}"
-                output, streams, had_errors = self._get_pypsrp_client().execute_ps(command)
+                    output, streams, had_errors = ElevatedSession().run_powershell(command)
+                else:
+                    with self._pypsrp_session() as client:
+                        output, streams, had_errors = client.execute_ps(command)
                 # saving the output from the execution to our RunnerResponse object
                 if isinstance(had_errors, bool):
                     had_errors = 0 if had_errors is False else 1
                 Processor(command=command, executor=executor, return_code=had_errors, output=output, errors=streams)
-                self._get_pypsrp_client().copy(source, desintation)
+                with self._pypsrp_session() as client:
+                    client.copy(source, desintation)
                 return True
         except Exception as e:
             self.__logger.warning(f"Unable to execute copy of supporting file {source}")
@@ -60,52 +95,92 @@ class RemoteRunner(Base):
         Returns:
             bool: Returns True if successful and False is not.
         """
-        atexit.register(self._close_paramiko_client)
         file = destination.rsplit("/", 1)
         try:
-            command = "sh -c '" + f'file="{destination}"' + ' && mkdir -p "${file%/*}" && cat > "${file}"' + "'"
             if elevation_required:
-                command = f"sudo {command}"
-            ssh_stdin, ssh_stdout, ssh_stderr = self._get_paramiko_client().exec_command(command)
-            ssh_stdin.write(open(f"{source}").read())
+                return self._copy_file_to_nix_elevated(source=source, destination=destination)
+            command = "sh -c '" + f'file="{destination}"' + ' && mkdir -p "${file%/*}" && cat > "${file}"' + "'"
+            with SSHConnectionPool().session() as client:
+                ssh_stdin, ssh_stdout, ssh_stderr = SSHConnectionPool().exec_command(client, command)
+                ssh_stdin.write(open(f"{source}").read())
+                # closing stdin lets cat finish writing the file while the shared transport stays open
+                ssh_stdin.close()
+                ssh_stdout.channel.recv_exit_status()
             return True
         except Exception as e:
             self.__logger.warning(f"Unable to execute copy of supporting file {file[-1]}")
             self.__logger.warning(f"STDIN: {ssh_stdin}/nSTDOUT: {ssh_stdout}/nSTDERR: {ssh_stderr}. {e}")
         return False
 
+    def _copy_file_to_nix_elevated(self, source: str, destination: str) -> bool:
+        """Writes the provided file through the elevated shell of the configured host as a here-document.
+
+        Args:
+            source (str): The source file to copy to the remote host.
+            destination (str): The destination location on the remote host to copy the file.
+
+        Returns:
+            bool: Returns True if the file was written.
+        """
+        with open(source) as f:
+            content = f.read()
+        delimiter = f"ATOMIC_OPERATOR_RUNNER_EOF_{uuid.uuid4().hex}"
+        if not content.endswith("\n"):
+            content += "\n"
+        command = (
+            f"file={shlex.quote(destination)}\n"
+            'mkdir -p "${file%/*}" && cat > "${file}" <<' + f"'{delimiter}'\n{content}{delimiter}"
+        )
+        return_code, _output, _output_file, errors = ElevatedSession().run_posix(command)
+        if return_code != 0:
+            self.__logger.warning(f"Elevated copy to {destination} failed with return code {return_code}. {errors}")
+        return return_code == 0
+
+    def _capture(self, output: str, compressed: bool = False) -> Tuple[Optional[str], Optional[OutputFile]]:
+        """Applies the configured output size limit to output that was returned in one piece.
+
+        Args:
+            output (str): The output returned from the remote host.
+            compressed (bool, optional): Whether or not the output is base64 encoded gzip data. Defaults to False.
+
+        Returns:
+            Tuple[Optional[str], Optional[OutputFile]]: The output string or a reference to the spilled output file.
+        """
+        capture = OutputCapture(max_size=Base.config.max_output_size)
+        if compressed and output:
+            try:
+                capture.write_compressed(base64.b64decode(output.strip(), validate=True))
+                return capture.close()
+            except (binascii.Error, ValueError) as e:
+                self.__logger.debug(f"Output was not compressed as expected. {e}")
+                capture = OutputCapture(max_size=Base.config.max_output_size)
+        capture.write(output)
+        return capture.close()
+
     def _get_paramiko_client(self) -> SSHClient:
-        """Creates a paramiko client object."""
-        _client = SSHClient()
-        _client.set_missing_host_key_policy(AutoAddPolicy())
-        if Base.config.ssh_key_path:
-            _client.connect(
-                Base.config.hostname,
-                port=Base.config.ssh_port,
-                username=Base.config.username,
-                key_filename=Base.config.ssh_key_path,
-                timeout=Base.config.ssh_timeout,
-            )
-        elif Base.config.private_key_string:
-            _client.connect(
-                Base.config.hostname,
-                port=Base.config.ssh_port,
-                username=Base.config.username,
-                pkey=PKey(data=Base.config.private_key_string),
-                timeout=Base.config.ssh_timeout,
+        """Returns the shared paramiko client of the configured host."""
+        return SSHConnectionPool().get_client()
+
+    def _get_pypsrp_client(self) -> Client:
+        """Creates a client for the defined platform operating system.
+
+        With a bastion configured, WinRM traffic goes through a local port forwarded over the shared
+        bastion connection. Certificates are still validated against the hostname of the host.
+        """
+        if Base.config.bastion_hostname:
+            port = SSHConnectionPool().get_tunnel_port(
+                port=self.WINRM_HTTPS_PORT if Base.config.verify_ssl else self.WINRM_HTTP_PORT
             )
-        elif Base.config.password:
-            _client.connect(
-                Base.config.hostname,
-                port=Base.config.ssh_port,
+            client = Client(
+                "127.0.0.1",
+                port=port,
                 username=Base.config.username,
                 password=Base.config.password,
-                timeout=Base.config.ssh_timeout,
+                ssl=Base.config.verify_ssl,
             )
-        return _client
-
-    def _get_pypsrp_client(self) -> Client:
-        """Creates a client for the defined platform operating system."""
+            if Base.config.verify_ssl:
+                self._validate_hostname(client)
+            return client
         return Client(
             Base.config.hostname,
             username=Base.config.username,
@@ -113,51 +188,280 @@ class RemoteRunner(Base):
             ssl=Base.config.verify_ssl,
         )
 
-    def run(self, executor: str, command: str) -> None:
+    def _validate_hostname(self, client: Client) -> None:
+        """Makes the provided tunnelled client validate certificates against the configured hostname.
+
+        The client connects to 127.0.0.1, which the certificate of the host does not name. The
+        configured hostname is sent as the TLS server name and checked against the certificate instead.
+        """
+        transport = client.wsman.transport
+        if transport.session is None:
+            transport.session = transport._build_session()
+        transport.session.get_adapter("https://").poolmanager.connection_pool_kw.update(
+            server_hostname=Base.config.hostname, assert_hostname=Base.config.hostname
+        )
+
+    @contextmanager
+    def _pypsrp_session(self) -> Iterator[Client]:
+        """Checks out an authenticated client of the configured host from the shared pool."""
+        with WinRMClientPool().session(connect=self._get_pypsrp_client) as client:
+            yield client
+
+    def connect(self) -> None:
+        """Opens and authenticates the connection to the configured host, unless it is already open.
+
+        SSH hosts get their shared transport. Windows hosts run an empty script, which authenticates
+        a pooled WinRM client and the PowerShell remoting endpoint used by later commands.
+        """
+        if Base.config.platform == "windows":
+            with self._pypsrp_session() as client:
+                client.execute_ps("$null")
+        else:
+            SSHConnectionPool().get_client()
+
+    def run(
+        self,
+        executor: str,
+        command: str,
+        elevation_required: bool = False,
+        cancellation: Optional[CancellationToken] = None,
+    ) -> None:
         """Runs the provided command remotely using the provided executor.
 
-        There are several executors that can be used: sh, bash, powershell and cmd
+        The transport of the executor in the executor registry decides how the command runs, e.g.
+        powershell over PowerShell remoting, cmd over WinRS and sh, bash or python over SSH.
+
+        Transient errors opening the SSH transport, the runspace pool or the WinRS shell of the host are
+        retried with an exponential backoff and hosts which keep failing are skipped until
+        Host.recovery_timeout has passed. Errors raised once the command has been sent are not retried,
+        so that a command never runs twice.
 
         Args:
             executor (str): The name of the executor to use.
             command (str): The command string to run.
+            elevation_required (bool, optional): Whether or not to run the command in the elevated session
+                of the host. Defaults to False.
+            cancellation (CancellationToken, optional): Closes the SSH channel of the command, stops its
+                PowerShell pipeline or terminates its WinRS process when cancelled. Defaults to None.
 
         Raises:
-            IncorrectExecutorError: Raised when the provided executor is unknown.
+            HostUnavailableError: Raised when the host is known to be unreachable.
             RemoteRunnerExecutionError: Raised when an error occurs running command remotely.
         """
         try:
-            if executor == "powershell":
-                # Creating a pypsrp client and executing powershell command remotely.
-                output, streams, had_errors = self._get_pypsrp_client().execute_ps(command)
-                # saving the output from the execution to our RunnerResponse object
-                if isinstance(had_errors, bool):
-                    had_errors = 0 if had_errors is False else 1
-                Processor(command=command, executor=executor, return_code=had_errors, output=output, errors=streams)
-            elif executor == "cmd":
-                stdout, stderr, rc = self._get_pypsrp_client().execute_cmd(command)
-                Processor(command=command, executor=executor, return_code=rc, output=stdout, errors=stderr)
-            elif executor == "sh" or executor == "bash":
-                atexit.register(self._close_paramiko_client)
-                client = self._get_paramiko_client()
-                stdin, stdout, stderr = client.exec_command(command=command)
-                Processor(
-                    command=command,
-                    executor=executor,
-                    return_code=stdout.channel.recv_exit_status(),
-                    output=stdout.read(),
-                    errors=stderr.read(),
-                )
-                stdin.flush()
-                self._close_paramiko_client(client=client)
-            else:
-                raise IncorrectExecutorError(
-                    f"The provided executor of '{executor}' is not one of sh, bash, powershell or cmd"
-                )
+            self._run(
+                executor=executor, command=command, elevation_required=elevation_required, cancellation=cancellation
+            )
+        except HostUnavailableError:
+            raise
         except Exception as e:
             raise RemoteRunnerExecutionError(exception=e) from e
 
-    def _close_paramiko_client(self, client: SSHClient) -> None:
-        """Closes the paramiko client."""
-        client.close()
-        atexit.unregister(self._close_paramiko_client)
+    def _run(
+        self,
+        executor: str,
+        command: str,
+        elevation_required: bool = False,
+        cancellation: Optional[CancellationToken] = None,
+    ) -> None:
+        """Runs the provided command remotely using the provided executor.
+
+        Elevated commands run on the single elevated session of the host, which is opened by the first
+        of them, so credentials are only sent once per host. Commands of at least Host.staging_threshold
+        bytes are uploaded once as script files and ran by path.
+
+        Args:
+            executor (str): The name of the executor to use.
+            command (str): The command string to run.
+            elevation_required (bool, optional): Whether or not elevation is required. Defaults to False.
+            cancellation (CancellationToken, optional): Interrupts the command when cancelled. Defaults to None.
+
+        Raises:
+            IncorrectExecutorError: Raised when the provided executor is not registered or cannot run on the
+                platform of the configured host.
+        """
+        transport = EXECUTORS.transport(executor, Base.config.platform)
+        if transport is None:
+            raise IncorrectExecutorError(provided_executor=executor)
+        if transport == "ssh":
+            # the shared transport is opened before anything is sent, so only connecting is retried
+            HostHealth().call(SSHConnectionPool().get_client)
+        staged = ScriptStager().stage(executor, command)
+        if transport == "powershell":
+            self._run_powershell(
+                executor, command, staged=staged, elevation_required=elevation_required, cancellation=cancellation
+            )
+        elif transport == "winrs":
+            self._run_winrs(executor, command, elevation_required=elevation_required, cancellation=cancellation)
+        elif elevation_required:
+            if staged:
+                run = ElevatedSession().run_posix(
+                    ScriptStager().shell_command(executor, staged), executor="sh", cancellation=cancellation
+                )
+            else:
+                run = ElevatedSession().run_posix(command, executor=executor, cancellation=cancellation)
+            return_code, output, output_file, errors = run
+            Processor(
+                command=command,
+                executor=executor,
+                return_code=return_code,
+                output=output,
+                errors=errors,
+                output_file=output_file,
+            )
+        else:
+            self._run_ssh(executor, command, staged=staged, cancellation=cancellation)
+
+    def _execute_ps(
+        self, client: Client, script: str, cancellation: Optional[CancellationToken] = None
+    ) -> Tuple[str, PSDataStreams, bool]:
+        """Runs the provided script like Client.execute_ps, stopping it when the token is cancelled.
+
+        Opening the runspace pool is retried on transient connection errors. The script itself is not.
+        """
+        pool = RunspacePool(client.wsman)
+        HostHealth().call(pool.open)
+        try:
+            powershell = PowerShell(pool)
+            powershell.add_cmdlet("Invoke-Expression").add_parameter("Command", script)
+            powershell.add_cmdlet("Out-String").add_parameter("Stream")
+            output = invoke_powershell(powershell, cancellation)
+        finally:
+            pool.close()
+        return "\n".join(output), powershell.streams, powershell.had_errors
+
+    def _execute_cmd(self, command: str, cancellation: Optional[CancellationToken] = None) -> Tuple[bytes, bytes, int]:
+        """Runs the provided command in a pooled WinRS shell of the configured host.
+
+        A shell which the host has closed fails before the command is started. It is then replaced by
+        a new shell and the command is started once more.
+
+        Args:
+            command (str): The command string to run with cmd.exe.
+            cancellation (CancellationToken, optional): Terminates the command when cancelled. Defaults to None.
+
+        Returns:
+            Tuple[bytes, bytes, int]: The stdout, the stderr and the return code of the command.
+        """
+        retries = 1
+        while True:
+            process = None
+            try:
+                with WinRSShellPool().session(connect=self._get_pypsrp_client) as shell:
+                    process = Process(shell, command)
+                    invoke_process(process, cancellation)
+                    if cancellation is None or not cancellation.cancelled:
+                        # like Client.execute_cmd, which lets the host release the finished command
+                        process.signal(SignalCode.CTRL_C)
+                return process.stdout, process.stderr, process.rc if process.rc is not None else -1
+            except WSManFaultError as e:
+                # a command with an id was started and must not run twice
+                if not retries or (process is not None and process.id is not None):
+                    raise
+                retries -= 1
+                self.__logger.debug(f"WinRS shell on '{Base.config.hostname}' is gone. Opening a new one. {e}")
+
+    def _run_powershell(
+        self,
+        executor: str,
+        command: str,
+        staged: Optional[str],
+        elevation_required: bool,
+        cancellation: Optional[CancellationToken] = None,
+    ) -> None:
+        """Runs the provided command, or its staged script, over PowerShell remoting."""
+        compression = Compression()
+        compressed = compression.enabled()
+        if staged:
+            script = ScriptStager().shell_command(executor, staged)
+        else:
+            script = EXECUTORS.powershell_command(executor, command, platform=Base.config.platform)
+        if compressed:
+            script = compression.wrap_powershell(script)
+        if elevation_required:
+            output, streams, had_errors = ElevatedSession().run_powershell(script, cancellation=cancellation)
+        else:
+            with self._pypsrp_session() as client:
+                output, streams, had_errors = self._execute_ps(client, script, cancellation=cancellation)
+        # saving the output from the execution to our RunnerResponse object
+        if isinstance(had_errors, bool):
+            had_errors = 0 if had_errors is False else 1
+        output, output_file = self._capture(output, compressed=compressed)
+        Processor(
+            command=command,
+            executor=executor,
+            return_code=had_errors,
+            output=output,
+            errors=streams,
+            output_file=output_file,
+        )
+
+    def _run_winrs(
+        self,
+        executor: str,
+        command: str,
+        elevation_required: bool,
+        cancellation: Optional[CancellationToken] = None,
+    ) -> None:
+        """Runs the provided command in a pooled WinRS shell or, when elevated, in the elevated runspace pool."""
+        if elevation_required:
+            stdout, stderr, rc = ElevatedSession().run_cmd(command, cancellation=cancellation)
+            output, output_file = self._capture(stdout)
+        else:
+            raw_stdout, raw_stderr, rc = self._execute_cmd(command, cancellation=cancellation)
+            encoding = get_console_encoding(Base.config.platform, executor)
+            capture = OutputCapture(
+                max_size=Base.config.max_output_size, encoding=Base.config.encoding, fallback_encoding=encoding
+            )
+            capture.write(raw_stdout)
+            output, output_file = capture.close()
+            stderr = raw_stderr.decode(Base.config.encoding or encoding, "replace")
+        Processor(
+            command=command,
+            executor=executor,
+            return_code=rc,
+            output=output,
+            errors=stderr,
+            output_file=output_file,
+        )
+
+    def _run_ssh(
+        self, executor: str, command: str, staged: Optional[str], cancellation: Optional[CancellationToken] = None
+    ) -> None:
+        """Runs the provided command, or its staged script, on a channel of the shared SSH transport.
+
+        Closing the channel on cancellation ends the command and the wait for its output and exit status.
+        """
+        compression = Compression()
+        compressed = compression.enabled()
+        if staged:
+            remote_command = ScriptStager().shell_command(executor, staged)
+        else:
+            remote_command = EXECUTORS.shell_command(executor, command, platform=Base.config.platform)
+        # the command runs on its own channel of the shared transport, which stays open for other commands
+        with SSHConnectionPool().session() as client:
+            stdin, stdout, stderr = SSHConnectionPool().exec_command(
+                client, compression.wrap_posix(remote_command) if compressed else remote_command
+            )
+            stdin.close()
+            with cancellation.on_cancel(stdout.channel.close) if cancellation is not None else nullcontext():
+                # stdout and stderr are drained at the same time, so that neither fills up its channel window
+                # while the other is read, before waiting on the exit status
+                errors: List[bytes] = []
+                stderr_reader = threading.Thread(target=lambda: errors.append(stderr.read()), daemon=True)
+                stderr_reader.start()
+                capture = OutputCapture(max_size=Base.config.max_output_size, encoding=Base.config.encoding)
+                capture.consume(stdout, compressed=compressed)
+                compression.record(capture.transfer_size, capture.transfer_time)
+                output, output_file = capture.close()
+                return_code = stdout.channel.recv_exit_status()
+                stderr_reader.join()
+            stdout.channel.close()
+        Processor(
+            command=command,
+            executor=executor,
+            return_code=return_code,
+            output=output,
+            errors=b"".join(errors),
+            output_file=output_file,
+        )
@@ -4,17 +4,32 @@
 import atexit
 import os
 import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List
 from typing import Optional
 
 from .base import Base
+from .cancellation import CancellationToken
+from .checkpoint import CheckpointStore
+from .compression import Compression
+from .facts import FactCache
+from .models import AWSAction
 from .models import Host
+from .models import HostFacts
+from .models import Prerequisite
 from .models import RunnerResponse
 from .models import TargetEnvironment
+from .models import WarmupResult
+from .profiling import Profiler
+from .utils.exceptions import IncorrectCompressionError
+from .utils.exceptions import IncorrectExecutorError
 from .utils.exceptions import IncorrectPlatformError
+from .utils.exceptions import IncorrectProfileError
 from .utils.exceptions import SourceFileNotFoundError
 from .utils.exceptions import SourceFileNotSupportedError
+from .watch import OutputWatch
 
 
 class Runner(Base):
@@ -31,9 +46,38 @@ class Runner(Base):
         password: Optional[str] = None,
         ssh_key_path: Optional[str] = None,
         private_key_string: Optional[str] = None,
+        ssh_key_passphrase: Optional[str] = None,
+        allow_agent: bool = True,
+        forward_agent: bool = False,
         verify_ssl: bool = False,
         ssh_port: int = 22,
         ssh_timeout: int = 5,
+        max_channels: int = 10,
+        elevation_password: Optional[str] = None,
+        elevation_configuration: str = "Microsoft.PowerShell",
+        elevation_timeout: int = 30,
+        bastion_hostname: Optional[str] = None,
+        bastion_port: int = 22,
+        bastion_username: Optional[str] = None,
+        bastion_password: Optional[str] = None,
+        bastion_ssh_key_path: Optional[str] = None,
+        max_output_size: int = 10485760,
+        encoding: Optional[str] = None,
+        compression: str = "off",
+        compression_threshold: int = 1048576,
+        staging_threshold: int = 0,
+        profile: str = "off",
+        profile_directory: Optional[str] = None,
+        process_workers: int = 0,
+        discover_facts: bool = False,
+        facts_ttl: int = 3600,
+        retries: int = 2,
+        retry_backoff: float = 1.0,
+        failure_threshold: int = 3,
+        recovery_timeout: float = 60.0,
+        aws_profile: Optional[str] = None,
+        aws_region: Optional[str] = None,
+        aws_endpoint_url: Optional[str] = None,
     ) -> None:
         """Used to run commands either locally or remotely.
 
@@ -47,14 +91,77 @@ class Runner(Base):
             verify_ssl (bool, optional): Whether or not to verify SSL/TLS. Defaults to False.
             ssh_key_path (str, optional): A string path to an ssh key. Defaults to None.
             private_key_string (str, optional): The private key string value for ssh connection. Defaults to None.
+            ssh_key_passphrase (str, optional): The passphrase of an encrypted ssh key. Defaults to None.
+            allow_agent (bool, optional): Whether or not keys from a running ssh-agent and the default key
+                files in ~/.ssh are tried when no key is provided. Defaults to True.
+            forward_agent (bool, optional): Whether or not the local ssh-agent is forwarded to commands
+                ran over SSH. Defaults to False.
             ssh_port (int, optional): The port used for SSH connections. Defaults to 22.
             ssh_timeout (int, optional): The timeout for SSH connections. Defaults to 5.
+            max_channels (int, optional): The maximum number of commands running at once over the single
+                SSH connection to a host. Defaults to 10.
+            elevation_password (str, optional): The password sent to sudo when elevated commands run on
+                Linux or macOS. Defaults to None, which uses the password.
+            elevation_configuration (str, optional): The PowerShell session configuration used for elevated
+                commands on Windows. Defaults to "Microsoft.PowerShell".
+            elevation_timeout (int, optional): The number of seconds to wait for an elevated session to
+                open. Defaults to 30.
+            bastion_hostname (str, optional): A jump host through which the remote host is reached over
+                SSH or WinRM. Defaults to None.
+            bastion_port (int, optional): The SSH port of the jump host. Defaults to 22.
+            bastion_username (str, optional): The username for the jump host. Defaults to the username.
+            bastion_password (str, optional): The password for the jump host. Defaults to None.
+            bastion_ssh_key_path (str, optional): A string path to an ssh key for the jump host. Defaults to None.
+                When neither a jump host password nor key is provided, the credentials of the remote
+                host are used.
+            max_output_size (int, optional): The number of output bytes kept in memory before
+                output is written to a temporary file. Defaults to 10485760 (10MB).
+            encoding (str, optional): The encoding of command output. Defaults to None, which decodes UTF-8 and
+                falls back to the console code page on Windows.
+            compression (str, optional): Whether output of remote sh, bash and powershell commands is gzip
+                compressed on the remote host before it is transferred. One of off, gzip or auto. Auto compresses
+                once SSH transfers from a host are measured slower than compression_threshold. Defaults to "off".
+            compression_threshold (int, optional): The transfer rate in bytes per second below which auto
+                compression is used. Defaults to 1048576 (1MB/s).
+            staging_threshold (int, optional): The size in bytes from which commands are uploaded to the target
+                as script files, named by a hash of their content, and ran by path instead of being sent inline.
+                A staged script is uploaded once per host and removed when the process exits. Defaults to 0,
+                which never stages commands.
+            profile (str, optional): Measures the time and memory used by each phase of an execution and adds
+                them to the profile of its response. One of off, basic, memory, cpu or full. Memory traces
+                allocations with tracemalloc and cpu profiles executions with cProfile. Defaults to "off".
+            profile_directory (str, optional): A directory the cProfile statistics and tracemalloc snapshots
+                of every profiled execution are written to. Defaults to None, which only adds a summary to
+                the response.
+            process_workers (int, optional): The number of worker processes used to build records and log
+                messages from command results, so that post-processing is not limited by the GIL when many
+                commands run concurrently. Defaults to 0 (post-process on the thread running the command).
+            discover_facts (bool, optional): Whether or not the host is probed for facts before the first
+                command runs against it. Defaults to False.
+            facts_ttl (int, optional): The number of seconds discovered host facts are kept. Defaults to 3600.
+            retries (int, optional): The number of times a failed connection to a remote host is retried. Defaults to 2.
+            retry_backoff (float, optional): The initial delay in seconds between connection retries,
+                doubled on every retry. Defaults to 1.0.
+            failure_threshold (int, optional): The number of consecutive connection failures after which
+                a remote host is considered unavailable. Defaults to 3.
+            recovery_timeout (float, optional): The number of seconds an unavailable remote host is skipped
+                before it is probed again. Defaults to 60.0.
+            aws_profile (str, optional): The AWS CLI profile used for the aws platform. Defaults to None.
+            aws_region (str, optional): The AWS region used for the aws platform. Defaults to None.
+            aws_endpoint_url (str, optional): A custom endpoint for AWS API actions, e.g. a local
+                moto server. Defaults to None.
 
         Raises:
             IncorrectPlatformError: Raised when the provided platform is not a correct option.
+            IncorrectCompressionError: Raised when the provided compression is not a correct option.
+            IncorrectProfileError: Raised when the provided profile is not a correct option.
         """
         if platform.lower() not in self.SUPPORTED_PLATFORMS:
             raise IncorrectPlatformError(provided_platform=platform)
+        if compression.lower() not in Compression.MODES:
+            raise IncorrectCompressionError(provided_compression=compression)
+        if profile.lower() not in Profiler.MODES:
+            raise IncorrectProfileError(provided_profile=profile)
         Base.config = Host(
             hostname=hostname,
             username=username,
@@ -62,8 +169,37 @@ class Runner(Base):
             verify_ssl=verify_ssl,
             ssh_key_path=ssh_key_path,
             private_key_string=private_key_string,
+            ssh_key_passphrase=ssh_key_passphrase,
+            allow_agent=allow_agent,
+            forward_agent=forward_agent,
             ssh_port=ssh_port,
             ssh_timeout=ssh_timeout,
+            max_channels=max_channels,
+            elevation_password=elevation_password,
+            elevation_configuration=elevation_configuration,
+            elevation_timeout=elevation_timeout,
+            bastion_hostname=bastion_hostname,
+            bastion_port=bastion_port,
+            bastion_username=bastion_username,
+            bastion_password=bastion_password,
+            bastion_ssh_key_path=bastion_ssh_key_path,
+            max_output_size=max_output_size,
+            encoding=encoding,
+            compression=compression.lower(),
+            compression_threshold=compression_threshold,
+            staging_threshold=staging_threshold,
+            profile=profile.lower(),
+            profile_directory=profile_directory,
+            process_workers=process_workers,
+            discover_facts=discover_facts,
+            facts_ttl=facts_ttl,
+            retries=retries,
+            retry_backoff=retry_backoff,
+            failure_threshold=failure_threshold,
+            recovery_timeout=recovery_timeout,
+            aws_profile=aws_profile,
+            aws_region=aws_region,
+            aws_endpoint_url=aws_endpoint_url,
             platform=platform.lower(),
             run_type="remote" if hostname else "local",
         )
@@ -73,26 +209,14 @@ class Runner(Base):
         """Returns JSON of the RunnerResponse class object."""
         print(self.response.json())
 
-    def _get_username(self) -> str:
-        """Attempts to determine the current logged in user name.
-
-        Returns:
-            str: A username string.
-        """
-        try:
-            import getpass
-
-            return getpass.getuser()
-        except Exception as e:
-            self.__logger.debug(f"Unable to retrieve username from getpass.getuser method. {e}")
-        try:
-            return os.getlogin()
-        except Exception as e:
-            self.__logger.debug(f"Unable to retrieve username from os.getlogin method. {e}")
-        return "Unknown"
-
     def run(
-        self, command: str, executor: str, cwd: Optional[str] = None, elevation_required: bool = False
+        self,
+        command: str,
+        executor: str,
+        cwd: Optional[str] = None,
+        elevation_required: bool = False,
+        cancellation: Optional[CancellationToken] = None,
+        watch: Optional[OutputWatch] = None,
     ) -> List[str]:
         """Runs the provided command either locally or remotely based on the provided configuration information.
 
@@ -101,32 +225,364 @@ class Runner(Base):
             executor (str): The executor to use when running the provided command.
             cwd (str, optional): The current working directory. Defaults to None.
             elevation_required (bool, optional): Whether or not elevation is required. Defaults to False.
+            cancellation (CancellationToken, optional): Interrupts the command when cancelled from another
+                thread. The response then holds the output received so far. Defaults to None.
+            watch (OutputWatch, optional): Patterns looked for in the output while it streams. Matches are
+                added to the response and the command is stopped on the first match when the watch says
+                so. Defaults to None.
 
         Returns:
             List[str]: Returns a list of dictionaries of the command results, including any errors.
         """
-        Base.response = RunnerResponse(
+        self._execute(
+            command=command,
+            executor=executor,
+            cwd=cwd,
+            elevation_required=elevation_required,
+            cancellation=cancellation,
+            watch=watch,
+        )
+        atexit.unregister(self._return_response)
+        self.responses.append(self.response)
+        return [x.json() for x in self.responses]
+
+    def run_many(
+        self,
+        commands: List[str],
+        executor: str,
+        cwd: Optional[str] = None,
+        elevation_required: bool = False,
+        max_workers: int = 4,
+        checkpoint: Optional[CheckpointStore] = None,
+        cancellation: Optional[CancellationToken] = None,
+        watch: Optional[OutputWatch] = None,
+    ) -> List[RunnerResponse]:
+        """Runs the provided commands concurrently using a bounded pool of worker threads.
+
+        Commands against a remote host over SSH share a single connection, each running on its own channel.
+
+        When a checkpoint is provided, commands it already recorded as completed are not run again
+        and every newly completed command is recorded, so an interrupted sweep can be resumed.
+
+        Args:
+            commands (List[str]): The command strings to run.
+            executor (str): The executor to use when running the provided commands.
+            cwd (str, optional): The current working directory. Defaults to None.
+            elevation_required (bool, optional): Whether or not elevation is required. Defaults to False.
+            max_workers (int, optional): The maximum number of commands running at once. Defaults to 4.
+            checkpoint (CheckpointStore, optional): Records completed commands. Defaults to None.
+            cancellation (CancellationToken, optional): Interrupts the running commands and skips the
+                remaining ones when cancelled. Defaults to None.
+            watch (OutputWatch, optional): Patterns looked for in the output of every command. Defaults to None.
+
+        Returns:
+            List[RunnerResponse]: A response for each command, in the order the commands were provided.
+        """
+        config = Base.config
+
+        def _run_one(command: str) -> RunnerResponse:
+            key = CheckpointStore.key(hostname=config.hostname, command=command, executor=executor)
+            if checkpoint is not None and key in checkpoint:
+                self.log(val=f"Command '{command}' already completed. Skipping.", level="debug")
+                return checkpoint.get(key)
+            with self.execution_context(config=config) as response:
+                try:
+                    response = self._execute(
+                        command=command,
+                        executor=executor,
+                        cwd=cwd,
+                        elevation_required=elevation_required,
+                        cancellation=cancellation,
+                        watch=watch,
+                    )
+                except Exception as e:
+                    self.log(val=f"Unable to run command '{command}'. {e}", level="warning")
+                    return Base.response or response
+            if checkpoint is not None and response.return_code is not None and not response.cancelled:
+                checkpoint.add(key, response)
+            return response
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            responses = list(pool.map(_run_one, commands))
+        atexit.unregister(self._return_response)
+        self.responses.extend(responses)
+        return responses
+
+    def check_prerequisites(
+        self,
+        prerequisites: List[Prerequisite],
+        executor: str,
+        cwd: Optional[str] = None,
+        elevation_required: bool = False,
+        max_workers: int = 4,
+    ) -> RunnerResponse:
+        """Runs all prerequisite checks concurrently, then installs the prerequisites that are missing.
+
+        Installs run in the order declared by Prerequisite.depends_on and every installed
+        prerequisite is checked again afterwards.
+
+        Args:
+            prerequisites (List[Prerequisite]): The prerequisites to check.
+            executor (str): The executor used for prerequisites which do not declare their own.
+            cwd (str, optional): The current working directory. Defaults to None.
+            elevation_required (bool, optional): Whether or not elevation is required. Defaults to False.
+            max_workers (int, optional): The maximum number of commands running at once. Defaults to 4.
+
+        Returns:
+            RunnerResponse: A response with the result of each prerequisite. Its return code is 0 when
+                every prerequisite is satisfied.
+        """
+        from .prerequisites import PrerequisiteRunner
+
+        response = PrerequisiteRunner(
+            runner=self, executor=executor, cwd=cwd, elevation_required=elevation_required, max_workers=max_workers
+        ).run(prerequisites=prerequisites)
+        atexit.unregister(self._return_response)
+        self.responses.append(response)
+        return response
+
+    def run_aws_actions(self, actions: List[AWSAction], max_workers: int = 4) -> List[RunnerResponse]:
+        """Runs AWS API actions through a shared botocore session instead of the AWS CLI.
+
+        Args:
+            actions (List[AWSAction]): The AWS API actions to run.
+            max_workers (int, optional): The maximum number of actions running at once. Defaults to 4.
+
+        Returns:
+            List[RunnerResponse]: A response for each action, in the order the actions were provided.
+        """
+        from .aws_api import AWSAPIRunner
+
+        config = Base.config
+
+        def _run_one(action: AWSAction) -> RunnerResponse:
+            with self.execution_context(config=config, response=self._new_response()) as response:
+                AWSAPIRunner().run(action=action)
+                return response
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            responses = list(pool.map(_run_one, actions))
+        atexit.unregister(self._return_response)
+        self.responses.extend(responses)
+        return responses
+
+    def warm(
+        self, hosts: Optional[List[Host]] = None, elevation_required: bool = False, max_workers: int = 8
+    ) -> List[WarmupResult]:
+        """Opens and authenticates the connections of the provided hosts before commands are ran against them.
+
+        Connections are opened concurrently and kept in the shared pools, so that connection setup is
+        not part of the execution time of the first command against each host. Facts are discovered
+        afterwards when Host.discover_facts is set.
+
+        Args:
+            hosts (List[Host], optional): The hosts to connect to. Defaults to None, which uses the
+                configured host.
+            elevation_required (bool, optional): Whether or not the elevated session of each host is
+                opened as well. Defaults to False.
+            max_workers (int, optional): The maximum number of hosts connected to at once. Defaults to 8.
+
+        Returns:
+            List[WarmupResult]: A result with the connect latency of each host, in the order the hosts were provided.
+        """
+
+        def _warm_one(host: Host) -> WarmupResult:
+            with self.execution_context(config=host):
+                return self._warm(elevation_required=elevation_required)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(_warm_one, hosts or [Base.config]))
+
+    def _warm(self, elevation_required: bool) -> WarmupResult:
+        """Opens the connection and, when required, the elevated session of the configured host."""
+        result = WarmupResult(hostname=Base.config.hostname or platform.node(), platform=Base.config.platform)
+        try:
+            start = time.monotonic()
+            if Base.config.run_type == "remote" and Base.config.platform != "aws":
+                from .health import HostHealth
+                from .remote import RemoteRunner
+
+                HostHealth().call(RemoteRunner().connect)
+            result.connect_latency = time.monotonic() - start
+            if elevation_required and Base.config.platform != "aws":
+                from .elevation import ElevatedSession
+
+                start = time.monotonic()
+                ElevatedSession().open()
+                result.elevation_latency = time.monotonic() - start
+            FactCache().get()
+            result.connected = True
+            self.log(val=f"Connected to '{result.hostname}' in {result.connect_latency:.3f} seconds.", level="debug")
+        except Exception as e:
+            result.error = str(e) or type(e).__name__
+            self.log(val=f"Unable to connect to '{result.hostname}'. {result.error}", level="warning")
+        return result
+
+    def discover_facts(self, refresh: bool = False) -> HostFacts:
+        """Discovers the OS version, available executors and elevation ability of the configured host.
+
+        Facts are cached per host for Host.facts_ttl seconds. While facts are cached, executors which
+        are not available on the host and elevation which is not possible are reported before a command runs.
+
+        Args:
+            refresh (bool, optional): Whether or not to probe the host even when facts are cached. Defaults to False.
+
+        Returns:
+            HostFacts: The facts of the configured host.
+        """
+        return FactCache().discover(refresh=refresh)
+
+    def _new_response(self) -> RunnerResponse:
+        """Creates the response object for a new execution against the configured target."""
+        facts = FactCache().get()
+        return RunnerResponse(
             start_timestamp=datetime.now(),
             environment=TargetEnvironment(
                 platform=Base.config.platform,
-                hostname=Base.config.hostname if Base.config.hostname else platform.node(),
-                user=Base.config.username if Base.config.username else self._get_username(),
+                hostname=Base.config.hostname or (facts.hostname if facts else platform.node()),
+                user=Base.config.username or (facts.user if facts else FactCache().get_local_username()),
             ),
         )
-        if elevation_required:
-            command = f"{self.ELEVATION_COMMAND_MAP.get(executor)} {command}"
-        Base.response.elevation_required = elevation_required
-        if Base.config.run_type == "local":
+
+    def _execute(
+        self,
+        command: str,
+        executor: str,
+        cwd: Optional[str],
+        elevation_required: bool,
+        cancellation: Optional[CancellationToken] = None,
+        watch: Optional[OutputWatch] = None,
+    ) -> RunnerResponse:
+        """Runs a single command against the configured target and returns its response.
+
+        Errors raised while a cancelled command is interrupted are not raised. The response of a
+        cancelled command is marked as cancelled instead.
+
+        Args:
+            command (str): The command string to run.
+            executor (str): The executor to use when running the provided command.
+            cwd (str, optional): The current working directory.
+            elevation_required (bool): Whether or not elevation is required.
+            cancellation (CancellationToken, optional): Interrupts the command when cancelled. Defaults to None.
+            watch (OutputWatch, optional): Patterns looked for in the output of the command. Defaults to None.
+
+        Raises:
+            IncorrectExecutorError: Raised when the executor is known to be unavailable on the configured host.
+
+        Returns:
+            RunnerResponse: The response of the execution.
+        """
+        Base.response = self._new_response()
+        if cancellation is not None and cancellation.cancelled:
+            return self._cancelled(command=command, executor=executor)
+        with Profiler().phase("execute"):
+            facts = FactCache().get()
+            if facts is not None and Base.config.platform != "aws":
+                if facts.executors and executor not in facts.executors:
+                    raise IncorrectExecutorError(provided_executor=executor)
+                if elevation_required and FactCache().can_elevate(facts) is False:
+                    self.log(
+                        val=f"User '{facts.user}' on '{facts.hostname}' cannot elevate without a password.",
+                        level="warning",
+                    )
+            Base.response.elevation_required = elevation_required
+            with Profiler().phase("run"):
+                if watch is None:
+                    self._interruptible(command, executor, cwd, elevation_required, cancellation)
+                else:
+                    self._watched(command, executor, cwd, elevation_required, cancellation, watch)
+        if cancellation is not None and cancellation.cancelled:
+            return self._cancelled(command=command, executor=executor)
+        return Base.response
+
+    def _watched(
+        self,
+        command: str,
+        executor: str,
+        cwd: Optional[str],
+        elevation_required: bool,
+        cancellation: Optional[CancellationToken],
+        watch: OutputWatch,
+    ) -> None:
+        """Runs a single command while its output is scanned for the patterns of the provided watch."""
+        scanner = watch.scanner(cancellation)
+        with scanner.activate():
+            self._interruptible(command, executor, cwd, elevation_required, scanner.cancellation)
+        scanner.close()
+        Base.response.matches = scanner.matches
+        Base.response.stopped_on_match = scanner.stopped
+
+    def _interruptible(
+        self,
+        command: str,
+        executor: str,
+        cwd: Optional[str],
+        elevation_required: bool,
+        cancellation: Optional[CancellationToken],
+    ) -> None:
+        """Runs a single command, ignoring errors raised while it is interrupted by the provided token."""
+        try:
+            self._dispatch(
+                command=command,
+                executor=executor,
+                cwd=cwd,
+                elevation_required=elevation_required,
+                cancellation=cancellation,
+            )
+        except Exception as e:
+            if cancellation is None or not cancellation.cancelled:
+                raise
+            self.log(val=f"Error while interrupting command '{command}'. {e}", level="debug")
+
+    def _cancelled(self, command: str, executor: str) -> RunnerResponse:
+        """Marks the current response as cancelled, keeping whatever the command returned before it stopped."""
+        Base.response.cancelled = True
+        Base.response.command = Base.response.command or command
+        Base.response.executor = Base.response.executor or executor
+        Base.response.end_timestamp = Base.response.end_timestamp or datetime.now()
+        self.log(val=f"Command '{command}' was cancelled.", level="info")
+        return Base.response
+
+    def _dispatch(
+        self,
+        command: str,
+        executor: str,
+        cwd: Optional[str],
+        elevation_required: bool,
+        cancellation: Optional[CancellationToken] = None,
+    ) -> None:
+        """Runs a single command with the runner of the configured target.
+
+        Args:
+            command (str): The command string to run.
+            executor (str): The executor to use when running the provided command.
+            cwd (str, optional): The current working directory.
+            elevation_required (bool): Whether or not elevation is required.
+            cancellation (CancellationToken, optional): Interrupts the command when cancelled. AWS
+                commands are not interrupted once sent. Defaults to None.
+        """
+        if Base.config.platform == "aws":
+            from .aws import AWSRunner
+
+            if elevation_required:
+                command = f"{self.ELEVATION_COMMAND_MAP.get(executor)} {command}"
+            AWSRunner().run(executor=executor, command=command, cwd=cwd)
+        elif Base.config.run_type == "local":
             from .local import LocalRunner
 
-            LocalRunner().run(executor=executor, command=command, cwd=cwd)
+            LocalRunner().run(
+                executor=executor,
+                command=command,
+                cwd=cwd,
+                elevation_required=elevation_required,
+                cancellation=cancellation,
+            )
         else:
             from .remote import RemoteRunner
 
-            RemoteRunner().run(executor=executor, command=command)
-        atexit.unregister(self._return_response)
-        self.responses.append(self.response)
-        return [x.json() for x in self.responses]
+            RemoteRunner().run(
+                executor=executor, command=command, elevation_required=elevation_required, cancellation=cancellation
+            )
 
     def copy_file(
         self, source_file: str, destination_replacement_path: str, executor: str, elevation_required: bool = False
@@ -151,14 +607,7 @@ class Runner(Base):
             from .remote import RemoteRunner
 
             self.log(val=f"Attempting to copy file '{source_file}' to remote host.")
-            Base.response = RunnerResponse(
-                start_timestamp=datetime.now(),
-                environment=TargetEnvironment(
-                    platform=Base.config.platform,
-                    hostname=Base.config.hostname if Base.config.hostname else platform.node(),
-                    user=Base.config.username if Base.config.username else self._get_username(),
-                ),
-            )
+            Base.response = self._new_response()
             if self.config.platform == "windows":
                 response = RemoteRunner()._copy_file_to_windows(
                     source=source_file,
@@ -0,0 +1,218 @@
+"""Schedules many executions across hosts."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import atexit
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .base import Base
+from .cancellation import CancellationToken
+from .checkpoint import CheckpointStore
+from .connections import RateLimiter
+from .models import Host
+from .models import Job
+from .models import RunnerResponse
+from .models import SchedulerMetrics
+from .runner import Runner
+
+
+class Scheduler(Base):
+    """Runs queued jobs across many hosts with per host and global concurrency limits.
+
+    Jobs are taken in priority order (lower values first). Hosts take turns so that a host with many
+    queued jobs does not starve the others.
+    """
+
+    def __init__(
+        self,
+        runner: Runner,
+        per_host_limit: int = 2,
+        max_sessions: int = 16,
+        connections_per_second: float = 10.0,
+        checkpoint: Optional[CheckpointStore] = None,
+        cancellation: Optional[CancellationToken] = None,
+    ) -> None:
+        """Schedules jobs using the provided runner.
+
+        Args:
+            runner (Runner): The runner used to execute jobs. Its configuration is used for jobs without a host.
+            per_host_limit (int, optional): The maximum number of concurrent executions per host. Defaults to 2.
+            max_sessions (int, optional): The maximum number of concurrent executions overall. Defaults to 16.
+            connections_per_second (float, optional): The maximum number of new remote connections opened
+                per second by the jobs. Connections reused from the connection pools are not limited. 0
+                disables the limit. Defaults to 10.0.
+            checkpoint (CheckpointStore, optional): Records completed jobs. Jobs already recorded are not
+                run again and their recorded response is returned instead. Defaults to None.
+            cancellation (CancellationToken, optional): Interrupts the running jobs when cancelled. Jobs
+                which have not started yet return a cancelled response without running. Defaults to None.
+        """
+        self.runner = runner
+        self.per_host_limit = per_host_limit
+        self.max_sessions = max_sessions
+        self.rate_limiter = RateLimiter(rate=connections_per_second)
+        self.checkpoint = checkpoint
+        self.cancellation = cancellation
+        self._queues: Dict[str, List[Tuple[int, int, Job]]] = defaultdict(list)
+        self._turns: Deque[str] = deque()
+        self._running: Dict[str, int] = defaultdict(int)
+        self._responses: Dict[int, RunnerResponse] = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._completed = 0
+        self._failed = 0
+        self._skipped = 0
+        self._started: Optional[float] = None
+
+    def _host_key(self, host: Host) -> str:
+        """Returns the key jobs are grouped by for the provided host."""
+        return host.hostname or "localhost"
+
+    def submit(self, job: Job) -> int:
+        """Adds a job to the queue.
+
+        Args:
+            job (Job): The job to run.
+
+        Returns:
+            int: The job id, which is also the position of its response in the list returned by run.
+        """
+        if job.host is None:
+            job = job.copy(update={"host": self.runner.config})
+        elif job.host.run_type is None:
+            job = job.copy(
+                update={"host": job.host.copy(update={"run_type": "remote" if job.host.hostname else "local"})}
+            )
+        key = self._host_key(job.host)
+        with self._condition:
+            job_id = next(self._counter)
+            if self.checkpoint is not None:
+                response = self.checkpoint.get(self._checkpoint_key(job))
+                if response is not None:
+                    self.__logger.debug(f"Job {job_id} already completed against '{key}'. Skipping.")
+                    self._responses[job_id] = response
+                    self._skipped += 1
+                    return job_id
+            heapq.heappush(self._queues[key], (job.priority, job_id, job))
+            if key not in self._turns:
+                self._turns.append(key)
+            self._condition.notify_all()
+        return job_id
+
+    def _checkpoint_key(self, job: Job) -> str:
+        """Returns the checkpoint key of the provided job."""
+        return CheckpointStore.key(hostname=job.host.hostname, command=job.command, executor=job.executor)
+
+    def _next_job(self) -> Optional[Tuple[int, Job]]:
+        """Takes the next job which is allowed to run, visiting hosts in turn. Must hold the condition."""
+        if sum(self._running.values()) >= self.max_sessions:
+            return None
+        best: Optional[str] = None
+        for key in self._turns:
+            if self._queues[key] and self._running[key] < self.per_host_limit:
+                if best is None or self._queues[key][0][0] < self._queues[best][0][0]:
+                    best = key
+        if best is None:
+            return None
+        _priority, job_id, job = heapq.heappop(self._queues[best])
+        # the host just served goes to the back of the line
+        self._turns.remove(best)
+        if self._queues[best]:
+            self._turns.append(best)
+        self._running[best] += 1
+        return job_id, job
+
+    def _run_job(self, job_id: int, job: Job) -> None:
+        """Runs a single job in its own execution context."""
+        key = self._host_key(job.host)
+        failed = True
+        response = RunnerResponse(command=job.command, executor=job.executor)
+        try:
+            with self.execution_context(config=job.host), self.rate_limiter.activate():
+                try:
+                    self.runner._execute(
+                        command=job.command,
+                        executor=job.executor,
+                        cwd=job.cwd,
+                        elevation_required=job.elevation_required,
+                        cancellation=self.cancellation,
+                    )
+                    failed = False
+                except Exception as e:
+                    self.__logger.warning(f"Job {job_id} against '{key}' failed. {e}")
+                response = Base.response
+            if self.checkpoint is not None and not failed and response.return_code is not None:
+                if not response.cancelled:
+                    self._record(job_id, job, response)
+        finally:
+            # the job is always accounted for, or run would wait on it forever
+            with self._condition:
+                self._responses[job_id] = response
+                self._running[key] -= 1
+                self._completed += 1
+                self._failed += int(failed)
+                self._condition.notify_all()
+
+    def _record(self, job_id: int, job: Job, response: RunnerResponse) -> None:
+        """Records the provided job as completed, logging instead of raising when the checkpoint cannot be written."""
+        try:
+            self.checkpoint.add(self._checkpoint_key(job), response)
+        except Exception as e:
+            self.__logger.warning(f"Unable to checkpoint job {job_id} against '{self._host_key(job.host)}'. {e}")
+
+    def metrics(self) -> SchedulerMetrics:
+        """Returns the current queue depth and throughput.
+
+        Returns:
+            SchedulerMetrics: A snapshot of the scheduler metrics.
+        """
+        with self._condition:
+            elapsed = time.monotonic() - self._started if self._started else 0.0
+            return SchedulerMetrics(
+                queued=sum(len(queue) for queue in self._queues.values()),
+                running=sum(self._running.values()),
+                completed=self._completed,
+                failed=self._failed,
+                skipped=self._skipped,
+                elapsed=elapsed,
+                throughput=self._completed / elapsed if elapsed else 0.0,
+                queue_depth={key: len(queue) for key, queue in self._queues.items() if queue},
+            )
+
+    def run(self) -> List[RunnerResponse]:
+        """Runs all queued jobs and waits for them to finish.
+
+        Returns:
+            List[RunnerResponse]: The responses of all jobs, ordered by job id.
+        """
+        self._started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.max_sessions) as pool:
+            while True:
+                with self._condition:
+                    next_job = self._next_job()
+                    while next_job is None:
+                        if not any(self._queues.values()) and not any(self._running.values()):
+                            break
+                        self._condition.wait()
+                        next_job = self._next_job()
+                if next_job is None:
+                    break
+                pool.submit(self._run_job, *next_job)
+        metrics = self.metrics()
+        self.__logger.info(
+            f"Completed {metrics.completed} jobs ({metrics.failed} failed, {metrics.skipped} skipped) in "
+            f"{metrics.elapsed:.2f} seconds ({metrics.throughput:.2f} jobs/second)."
+        )
+        responses = [self._responses[job_id] for job_id in sorted(self._responses)]
+        atexit.unregister(self.runner._return_response)
+        self.runner.responses.extend(responses)
+        return responses
@@ -0,0 +1,237 @@
+"""Stages large commands on the target as script files."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import atexit
+import hashlib
+import ntpath
+import os
+import posixpath
+import shlex
+import shutil
+import tempfile
+import threading
+import uuid
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from .base import Base
+from .executors import EXECUTORS
+from .models import Host
+
+
+class ScriptStager(Base):
+    """Uploads commands larger than Host.staging_threshold once as script files and runs them by path.
+
+    Scripts are named by a hash of their executor and content, so running the same command again
+    against a host reuses the uploaded file. Staged files are kept for the lifetime of the process
+    and removed when it exits or when cleanup is called. Every process stages its scripts in a
+    directory of its own, so that cleanup by one process never removes the scripts of another.
+
+    Scripts are written to a temporary directory on the local system, to a directory in
+    ~/.atomic-operator-runner over SFTP on Linux and macOS hosts and to a directory in the temporary
+    directory of the user over PowerShell remoting on Windows hosts. Commands of executors using
+    WinRS are not staged, since cmd parses batch files differently from command lines. Staged
+    PowerShell scripts are ran with the call operator, so the execution policy of the host has to
+    allow local scripts.
+    """
+
+    PREFIX = "atomic-operator-runner-"
+    POSIX_DIRECTORY = ".atomic-operator-runner"
+
+    _staged: Dict[Tuple[Any, ...], Dict[str, str]] = {}
+    _directories: Dict[Tuple[Any, ...], str] = {}
+    _configs: Dict[Tuple[Any, ...], Host] = {}
+    _locks: Dict[Tuple[Any, ...], threading.Lock] = {}
+    _lock = threading.Lock()
+    _registered = False
+
+    def _key(self) -> Tuple[Any, ...]:
+        """Returns the key of the staged scripts of the configured host."""
+        return Base.config.run_type, Base.config.hostname, Base.config.username, Base.config.platform
+
+    def _host_lock(self, key: Tuple[Any, ...]) -> threading.Lock:
+        """Returns the lock which serializes uploads to the host with the provided key."""
+        with ScriptStager._lock:
+            if not ScriptStager._registered:
+                atexit.register(ScriptStager.close_all)
+                ScriptStager._registered = True
+            return ScriptStager._locks.setdefault(key, threading.Lock())
+
+    def should_stage(self, executor: str, command: str) -> bool:
+        """Whether or not the provided command is staged as a script file.
+
+        Args:
+            executor (str): The name of the executor running the command.
+            command (str): The command string.
+
+        Returns:
+            bool: True when staging is enabled and the command is at least Host.staging_threshold bytes.
+        """
+        transport = EXECUTORS.transport(executor, Base.config.platform)
+        return (
+            Base.config.staging_threshold > 0
+            and transport is not None
+            and transport != "winrs"
+            and len(command.encode("utf-8")) >= Base.config.staging_threshold
+        )
+
+    def stage(self, executor: str, command: str) -> Optional[str]:
+        """Returns the path of the staged script of the provided command, uploading it when needed.
+
+        Args:
+            executor (str): The name of the executor running the command.
+            command (str): The command string.
+
+        Returns:
+            Optional[str]: The path of the script on the configured host or None when the command is not staged.
+        """
+        if not self.should_stage(executor, command):
+            return None
+        spec = EXECUTORS.get(executor)
+        digest = hashlib.sha256(f"{executor}\0{command}".encode("utf-8")).hexdigest()[:32]
+        key = self._key()
+        with self._host_lock(key):
+            staged = ScriptStager._staged.setdefault(key, {})
+            path = staged.get(digest)
+            if path is None:
+                directory = ScriptStager._directories.get(key)
+                if directory is None:
+                    directory = self._make_directory()
+                    ScriptStager._directories[key] = directory
+                    ScriptStager._configs[key] = Base.config
+                path = self._join(directory, f"{self.PREFIX}{digest}{spec.file_extension or ''}")
+                self._upload(path, command)
+                staged[digest] = path
+                self.__logger.debug(f"Staged {len(command)} character command as '{path}'.")
+        return path
+
+    def shell_command(self, executor: str, path: str) -> str:
+        """Returns a command string which runs the staged script at the provided path.
+
+        Args:
+            executor (str): The name of the executor running the script.
+            path (str): The path of the staged script.
+
+        Returns:
+            str: A PowerShell command for executors using PowerShell remoting and a POSIX shell command otherwise.
+        """
+        arguments = EXECUTORS.script_arguments(executor, Base.config.platform, path)
+        if EXECUTORS.transport(executor, Base.config.platform) == "powershell":
+            if EXECUTORS.get(executor).native:
+                arguments = [path]
+            return "& " + " ".join(EXECUTORS.powershell_quote(argument) for argument in arguments)
+        return " ".join(shlex.quote(argument) for argument in arguments)
+
+    def _join(self, directory: str, name: str) -> str:
+        """Joins the provided directory and file name using the path format of the configured host."""
+        if Base.config.run_type != "remote":
+            return os.path.join(directory, name)
+        if Base.config.platform == "windows":
+            return ntpath.join(directory, name)
+        return posixpath.join(directory, name)
+
+    def _make_directory(self) -> str:
+        """Creates the directory of this process which scripts are staged in on the configured host."""
+        if Base.config.run_type != "remote":
+            return tempfile.mkdtemp(prefix=self.PREFIX)
+        name = f"{self.PREFIX}{uuid.uuid4().hex}"
+        if Base.config.platform == "windows":
+            from .remote import RemoteRunner
+
+            with RemoteRunner()._pypsrp_session() as client:
+                output, _streams, _had_errors = client.execute_ps(
+                    "(New-Item -ItemType Directory -Path "
+                    f"(Join-Path ([System.IO.Path]::GetTempPath()) '{name}')).FullName"
+                )
+            return output.strip()
+        from .connections import SSHConnectionPool
+
+        with SSHConnectionPool().session() as client:
+            sftp = client.open_sftp()
+            try:
+                parent = posixpath.join(sftp.normalize("."), self.POSIX_DIRECTORY)
+                try:
+                    sftp.mkdir(parent, mode=0o700)
+                except IOError:
+                    # the directory was created by another process
+                    sftp.chmod(parent, 0o700)
+                directory = posixpath.join(parent, name)
+                sftp.mkdir(directory, mode=0o700)
+            finally:
+                sftp.close()
+        return directory
+
+    def _upload(self, path: str, command: str) -> None:
+        """Writes the provided command to the provided path on the configured host."""
+        if Base.config.run_type != "remote":
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(command)
+        elif Base.config.platform == "windows":
+            from .remote import RemoteRunner
+
+            fd, source = tempfile.mkstemp()
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(command)
+                with RemoteRunner()._pypsrp_session() as client:
+                    client.copy(source, path)
+            finally:
+                os.remove(source)
+        else:
+            from .connections import SSHConnectionPool
+
+            with SSHConnectionPool().session() as client:
+                sftp = client.open_sftp()
+                try:
+                    with sftp.open(path, "w") as f:
+                        f.write(command.encode("utf-8"))
+                finally:
+                    sftp.close()
+
+    def cleanup(self) -> None:
+        """Removes the scripts staged on the configured host."""
+        key = self._key()
+        with self._host_lock(key):
+            staged = ScriptStager._staged.pop(key, {})
+            directory = ScriptStager._directories.pop(key, None)
+            ScriptStager._configs.pop(key, None)
+            if directory is None:
+                return
+            try:
+                self._remove(directory, list(staged.values()))
+            except Exception as e:
+                self.__logger.debug(f"Unable to remove staged scripts from '{directory}'. {e}")
+
+    def _remove(self, directory: str, paths: List[str]) -> None:
+        """Removes the provided staged scripts and the directory of this process from the configured host."""
+        if Base.config.run_type != "remote":
+            shutil.rmtree(directory, ignore_errors=True)
+        elif Base.config.platform == "windows":
+            from .remote import RemoteRunner
+
+            quoted = "'{}'".format(directory.replace("'", "''"))
+            with RemoteRunner()._pypsrp_session() as client:
+                client.execute_ps(f"Remove-Item -LiteralPath {quoted} -Recurse -Force -ErrorAction SilentlyContinue")
+        else:
+            from .connections import SSHConnectionPool
+
+            with SSHConnectionPool().session() as client:
+                sftp = client.open_sftp()
+                try:
+                    for path in paths:
+                        sftp.remove(path)
+                    sftp.rmdir(directory)
+                finally:
+                    sftp.close()
+
+    @staticmethod
+    def close_all() -> None:
+        """Removes the scripts staged on every host."""
+        with ScriptStager._lock:
+            configs = list(ScriptStager._configs.values())
+        for config in configs:
+            with ScriptStager.execution_context(config=config):
+                ScriptStager().cleanup()
@@ -0,0 +1,274 @@
+"""Stores responses of past runs for querying and comparison."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import hashlib
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+from .base import Base
+from .models import ResultDiff
+from .models import RunnerResponse
+from .models import StoredResult
+
+
+class ResultStore(Base):
+    """A SQLite database of RunnerResponse and BaseRecord data grouped into named runs.
+
+    The columns used for filtering (host, command hash, executor, return code and timestamps) are
+    indexed and an output hash is stored with every response, so queries and diffs between runs are
+    answered by SQLite without deserializing the stored responses.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS runs (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        created TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS responses (
+        id INTEGER PRIMARY KEY,
+        run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+        hostname TEXT,
+        platform TEXT,
+        user TEXT,
+        command TEXT,
+        command_hash TEXT,
+        executor TEXT,
+        elevation_required INTEGER,
+        return_code INTEGER,
+        start_timestamp TEXT,
+        end_timestamp TEXT,
+        output_hash TEXT,
+        output_size INTEGER,
+        record_count INTEGER,
+        response TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS records (
+        response_id INTEGER NOT NULL REFERENCES responses(id) ON DELETE CASCADE,
+        type TEXT,
+        source TEXT,
+        message TEXT,
+        time_generated TEXT,
+        count INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS responses_run ON responses(run_id, hostname, command_hash, executor);
+    CREATE INDEX IF NOT EXISTS responses_hostname ON responses(hostname);
+    CREATE INDEX IF NOT EXISTS responses_command_hash ON responses(command_hash);
+    CREATE INDEX IF NOT EXISTS responses_executor ON responses(executor);
+    CREATE INDEX IF NOT EXISTS responses_return_code ON responses(return_code);
+    CREATE INDEX IF NOT EXISTS responses_start_timestamp ON responses(start_timestamp);
+    CREATE INDEX IF NOT EXISTS records_response ON records(response_id, type);
+    """
+    COLUMNS = (
+        "responses.id, runs.name, hostname, command, command_hash, executor, return_code, "
+        "start_timestamp, end_timestamp, output_hash, output_size, record_count"
+    )
+
+    def __init__(self, path: str) -> None:
+        """Opens or creates the provided database.
+
+        Args:
+            path (str): The path to the SQLite database file.
+        """
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA foreign_keys=ON")
+        self._connection.executescript(self.SCHEMA)
+
+    def close(self) -> None:
+        """Closes the database connection."""
+        self._connection.close()
+
+    @staticmethod
+    def hash_command(command: Optional[str]) -> Optional[str]:
+        """Returns the sha256 hex digest of a command string."""
+        return hashlib.sha256(command.encode("utf-8")).hexdigest() if command is not None else None
+
+    def _hash_output(self, response: RunnerResponse) -> Optional[str]:
+        """Hashes the output of a response, reading spilled output files in chunks."""
+        digest = hashlib.sha256()
+        if response.output_file is not None and os.path.exists(response.output_file.path):
+            for chunk in response.output_file.iter_chunks():
+                digest.update(chunk)
+        elif response.output is not None:
+            digest.update(response.output.encode("utf-8"))
+        else:
+            return None
+        return digest.hexdigest()
+
+    @staticmethod
+    def _timestamp(value: Optional[datetime]) -> Optional[str]:
+        """Formats a timestamp so that it sorts correctly as text."""
+        return value.isoformat() if value else None
+
+    def add(self, responses: Iterable[RunnerResponse], run: str) -> List[int]:
+        """Stores the provided responses as part of the named run.
+
+        Args:
+            responses (Iterable[RunnerResponse]): The responses to store.
+            run (str): The name of the run, e.g. a date. The run is created when it does not exist.
+
+        Returns:
+            List[int]: The ids of the stored responses.
+        """
+        ids = []
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO runs (name, created) VALUES (?, ?)", (run, datetime.now().isoformat())
+            )
+            run_id = self._connection.execute("SELECT id FROM runs WHERE name = ?", (run,)).fetchone()[0]
+            for response in responses:
+                environment = response.environment
+                output_size = response.output_file.size if response.output_file else len(response.output or "")
+                cursor = self._connection.execute(
+                    "INSERT INTO responses (run_id, hostname, platform, user, command, command_hash, executor, "
+                    "elevation_required, return_code, start_timestamp, end_timestamp, output_hash, output_size, "
+                    "record_count, response) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        run_id,
+                        environment.hostname if environment else None,
+                        environment.platform if environment else None,
+                        environment.user if environment else None,
+                        response.command,
+                        self.hash_command(response.command),
+                        response.executor,
+                        response.elevation_required,
+                        response.return_code,
+                        self._timestamp(response.start_timestamp),
+                        self._timestamp(response.end_timestamp),
+                        self._hash_output(response),
+                        output_size,
+                        len(response.records or []),
+                        response.json(by_alias=True),
+                    ),
+                )
+                self._connection.executemany(
+                    "INSERT INTO records (response_id, type, source, message, time_generated, count) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (
+                            cursor.lastrowid,
+                            record.type,
+                            record.source,
+                            record.message_data,
+                            self._timestamp(record.time_generated),
+                            record.count,
+                        )
+                        for record in response.records or []
+                    ],
+                )
+                ids.append(cursor.lastrowid)
+        self.__logger.debug(f"Stored {len(ids)} responses in run '{run}'.")
+        return ids
+
+    def runs(self) -> List[str]:
+        """Returns the names of all stored runs, oldest first."""
+        with self._lock:
+            return [row[0] for row in self._connection.execute("SELECT name FROM runs ORDER BY id")]
+
+    def query(
+        self,
+        run: Optional[str] = None,
+        hostname: Optional[str] = None,
+        command: Optional[str] = None,
+        executor: Optional[str] = None,
+        return_code: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None,
+    ) -> List[StoredResult]:
+        """Returns a summary of the stored responses matching all provided filters.
+
+        Args:
+            run (str, optional): The name of the run. Defaults to None.
+            hostname (str, optional): The host the command ran on. Defaults to None.
+            command (str, optional): The exact command string. Defaults to None.
+            executor (str, optional): The executor used. Defaults to None.
+            return_code (int, optional): The return code of the command. Defaults to None.
+            since (datetime, optional): The earliest start timestamp. Defaults to None.
+            until (datetime, optional): The latest start timestamp. Defaults to None.
+            limit (int, optional): The maximum number of results. Defaults to None (no limit).
+
+        Returns:
+            List[StoredResult]: The matching results, most recent first.
+        """
+        filters = {
+            "runs.name = ?": run,
+            "hostname = ?": hostname,
+            "command_hash = ?": self.hash_command(command),
+            "executor = ?": executor,
+            "return_code = ?": return_code,
+            "start_timestamp >= ?": self._timestamp(since),
+            "start_timestamp <= ?": self._timestamp(until),
+        }
+        clauses = [clause for clause, value in filters.items() if value is not None]
+        params: List[Any] = [value for value in filters.values() if value is not None]
+        sql = f"SELECT {self.COLUMNS} FROM responses JOIN runs ON runs.id = responses.run_id"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY start_timestamp DESC, responses.id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [StoredResult(**dict(zip(StoredResult.__fields__, row))) for row in rows]
+
+    def get(self, result_id: int) -> Optional[RunnerResponse]:
+        """Loads the full response of a stored result.
+
+        Args:
+            result_id (int): The id of the stored result.
+
+        Returns:
+            Optional[RunnerResponse]: The stored response or None when it does not exist.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT response FROM responses WHERE id = ?", (result_id,)).fetchone()
+        return RunnerResponse.parse_raw(row[0]) if row else None
+
+    def diff(self, before: str, after: str) -> List[ResultDiff]:
+        """Compares two runs by host, command and executor.
+
+        When a run holds several executions of a command on a host, its latest one is compared.
+
+        Args:
+            before (str): The name of the earlier run.
+            after (str): The name of the later run.
+
+        Returns:
+            List[ResultDiff]: The executions that were added, removed or whose return code or output changed.
+        """
+        # sqlite has no full outer join, so the removed executions are selected separately
+        sql = """
+        WITH latest AS (
+                SELECT MAX(responses.id) AS id, runs.name AS run FROM responses JOIN runs ON runs.id = run_id
+                WHERE runs.name IN (?, ?) GROUP BY run_id, hostname, command_hash, executor
+             ),
+             a AS (SELECT responses.* FROM responses JOIN latest USING (id) WHERE latest.run = ?),
+             b AS (SELECT responses.* FROM responses JOIN latest USING (id) WHERE latest.run = ?)
+        SELECT CASE WHEN a.id IS NULL THEN 'added' ELSE 'changed' END,
+               b.hostname, b.command, b.executor, a.return_code, b.return_code,
+               a.output_hash IS NOT b.output_hash, a.id, b.id
+        FROM b LEFT JOIN a
+          ON a.hostname IS b.hostname AND a.command_hash IS b.command_hash AND a.executor IS b.executor
+        WHERE a.id IS NULL OR a.return_code IS NOT b.return_code OR a.output_hash IS NOT b.output_hash
+        UNION ALL
+        SELECT 'removed', a.hostname, a.command, a.executor, a.return_code, NULL, 0, a.id, NULL
+        FROM a
+        WHERE NOT EXISTS (
+            SELECT 1 FROM b
+            WHERE a.hostname IS b.hostname AND a.command_hash IS b.command_hash AND a.executor IS b.executor
+        )
+        """
+        with self._lock:
+            rows = self._connection.execute(sql, (before, after, before, after)).fetchall()
+        return [ResultDiff(**dict(zip(ResultDiff.__fields__, row))) for row in rows]
@@ -41,6 +41,32 @@ class IncorrectPlatformError(Exception):
         )
 
 
+class IncorrectCompressionError(Exception):
+    """Raised when an unknown compression mode is provided."""
+
+    def __init__(self, provided_compression: str) -> None:
+        """Raises when the provided compression mode is not correct."""
+        from ..base import Base
+
+        Base().log(
+            f"The provided compression of '{provided_compression}' is not one of off, gzip or auto",
+            level="critical",
+        )
+
+
+class IncorrectProfileError(Exception):
+    """Raised when an unknown profiling mode is provided."""
+
+    def __init__(self, provided_profile: str) -> None:
+        """Raises when the provided profiling mode is not correct."""
+        from ..base import Base
+
+        Base().log(
+            f"The provided profile of '{provided_profile}' is not one of off, basic, memory, cpu or full",
+            level="critical",
+        )
+
+
 class SourceFileNotSupportedError(Exception):
     """Raised when the provided source file is not a supported type."""
 
@@ -120,3 +146,65 @@ class RemoteRunnerExecutionError(Exception):
             error_string += f"- Received {type(exception).__name__}"
             Base().log(f"Full stack trace: {exception}", level="debug")
             Base().log(error_string, level="warning")
+
+
+class HostUnavailableError(Exception):
+    """Raised when a host is known to be unreachable and is not being retried."""
+
+    def __init__(self, hostname: str) -> None:
+        """Raises when the circuit breaker for the provided host is open."""
+        from ..base import Base
+
+        self.hostname = hostname
+        Base().log(
+            f"Host '{hostname}' is marked as unavailable after repeated connection failures. Skipping execution.",
+            level="warning",
+        )
+
+
+class AWSCLINotFoundError(Exception):
+    """Raised when the AWS CLI cannot be found on the local system."""
+
+    def __init__(self) -> None:
+        """Raises when the aws executable is not available."""
+        from ..base import Base
+
+        Base().log(
+            "Unable to find the AWS CLI (aws) on the local system. Please install it and ensure it is on your PATH.",
+            level="critical",
+        )
+
+
+class BotocoreNotInstalledError(Exception):
+    """Raised when AWS API actions are used without botocore installed."""
+
+    def __init__(self) -> None:
+        """Raises when the botocore package cannot be imported."""
+        from ..base import Base
+
+        Base().log(
+            "Running AWS API actions requires botocore. Please install it using 'pip install atomic-operator-runner[aws]'.",
+            level="critical",
+        )
+
+
+class PrerequisiteDependencyError(Exception):
+    """Raised when the dependencies declared between prerequisites cannot be resolved."""
+
+    def __init__(self, reason: str) -> None:
+        """Raises when a prerequisite depends on an unknown prerequisite or on itself through a cycle."""
+        from ..base import Base
+
+        Base().log(f"Unable to order the provided prerequisites. {reason}", level="critical")
+
+
+class ElevationError(Exception):
+    """Raised when an elevated session cannot be opened or is lost."""
+
+    def __init__(self, hostname: str, reason: str) -> None:
+        """Raises when sudo rejects the credentials or the elevated session closes unexpectedly."""
+        from ..base import Base
+
+        self.hostname = hostname
+        self.reason = reason
+        Base().log(f"Unable to run elevated on '{hostname}'. {reason}", level="critical")
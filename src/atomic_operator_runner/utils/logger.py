@@ -1,12 +1,17 @@
 """Logger metaclass and custom formatter."""
 # Copyright: (c) 2022, Swimlane <info@swimlane.com>
 # MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import atexit
 import logging.config
 import os
 from logging import DEBUG
 from logging import FileHandler
+from logging import Filter
 from logging import Formatter
 from logging import LogRecord
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
+from queue import SimpleQueue
 from typing import Optional
 
 import yaml
@@ -33,12 +38,36 @@ class CustomFormatter(Formatter):
             logging.ERROR: self.red + self.fmt + self.reset,
             logging.CRITICAL: self.bold_red + self.fmt + self.reset,
         }
+        self._formatters = {level: logging.Formatter(log_fmt) for level, log_fmt in self.FORMATS.items()}
+        self._default_formatter = logging.Formatter(self.fmt)
 
     def format(self, record: LogRecord) -> str:
         """Used to format a log record object."""
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
-        return formatter.format(record)
+        return self._formatters.get(record.levelno, self._default_formatter).format(record)
+
+
+class PayloadSizeFilter(Filter):
+    """Truncates large log messages so that huge payloads are not written to every handler."""
+
+    def __init__(self, max_size: int = 8192) -> None:
+        """Used to limit the size of log messages.
+
+        Args:
+            max_size (int, optional): The maximum number of characters kept from a message. Defaults to 8192.
+        """
+        super().__init__()
+        self.max_size = max_size
+
+    def filter(self, record: LogRecord) -> bool:
+        """Keeps the head and tail of messages larger than max_size."""
+        message = record.getMessage()
+        if len(message) > self.max_size:
+            half = self.max_size // 2
+            record.msg = (
+                f"{message[:half]}\n... [{len(message) - self.max_size} characters truncated] ...\n{message[-half:]}"
+            )
+            record.args = None
+        return True
 
 
 class DebugFileHandler(FileHandler):
@@ -65,6 +94,9 @@ class DebugFileHandler(FileHandler):
 class LoggingBase(type):
     """Logging metaclass."""
 
+    _logging_configured = False
+    _listener: Optional[QueueListener] = None
+
     def __init__(cls, *args: str) -> None:
         """Logging base metaclass."""
         super().__init__(*args)
@@ -84,7 +116,15 @@ class LoggingBase(type):
         default_level: int = logging.INFO,
         env_key: str = "LOG_CFG",
     ) -> None:
-        """Setup logging configuration."""
+        """Setup logging configuration.
+
+        Logging is configured once per process. The configured root handlers are moved behind a
+        QueueHandler and run on a background QueueListener so that executing threads never wait on
+        console or file I/O.
+        """
+        if LoggingBase._logging_configured:
+            return
+        LoggingBase._logging_configured = True
         path = os.path.abspath(os.path.expanduser(os.path.expandvars(default_path)))
         value = os.getenv(env_key, None)
         if value:
@@ -95,3 +135,26 @@ class LoggingBase(type):
             logging.config.dictConfig(config)
         else:
             logging.basicConfig(level=default_level)
+        cls.start_queue_listener()
+
+    def start_queue_listener(cls) -> None:
+        """Moves the root logger handlers to a background listener thread."""
+        root = logging.getLogger()
+        handlers = [handler for handler in root.handlers if not isinstance(handler, QueueHandler)]
+        if not handlers or LoggingBase._listener is not None:
+            return
+        queue: SimpleQueue = SimpleQueue()
+        queue_handler = QueueHandler(queue)
+        queue_handler.addFilter(PayloadSizeFilter())
+        for handler in handlers:
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        LoggingBase._listener = QueueListener(queue, *handlers, respect_handler_level=True)
+        LoggingBase._listener.start()
+        atexit.register(cls.stop_queue_listener)
+
+    def stop_queue_listener(cls) -> None:
+        """Flushes any queued log records and stops the background listener thread."""
+        if LoggingBase._listener is not None:
+            LoggingBase._listener.stop()
+            LoggingBase._listener = None
@@ -0,0 +1,194 @@
+"""Watches command output for patterns while it streams."""
+# Copyright: (c) 2022, Swimlane <info@swimlane.com>
+# MIT License (see LICENSE or https://opensource.org/licenses/MIT)
+import re
+import threading
+from contextlib import contextmanager
+from contextlib import nullcontext
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Match
+from typing import Optional
+from typing import Pattern
+from typing import Tuple
+from typing import Union
+
+from .base import Base
+from .cancellation import CancellationToken
+from .models import PatternMatch
+
+
+class OutputWatch(Base):
+    """Patterns which are looked for in the output of every command ran with this watch.
+
+    Patterns are compiled once into a single regular expression, so each line of output is scanned
+    once no matter how many patterns there are. Patterns with groups or inline flags, which would
+    change meaning in a combined expression, are instead matched one by one. Patterns are matched
+    against complete lines of the raw output bytes, so they should match UTF-8 text. Output is
+    scanned while it streams for local commands, commands over SSH and elevated commands on Linux
+    and macOS. Output of PowerShell and WinRS commands is scanned once the command completes.
+
+    One watch can be used by any number of executions at once, each of which gets its own
+    OutputScanner.
+    """
+
+    def __init__(
+        self,
+        patterns: Union[List[str], Dict[str, str]],
+        callback: Optional[Callable[[PatternMatch], None]] = None,
+        stop_on_match: bool = False,
+        ignore_case: bool = False,
+    ) -> None:
+        """Compiles the provided patterns.
+
+        Args:
+            patterns (Union[List[str], Dict[str, str]]): Regular expressions to look for. When a dict is
+                provided, its keys name the patterns in matches. Patterns in a list are named by themselves.
+            callback (Callable[[PatternMatch], None], optional): Called with every match, from the thread
+                reading the output. Defaults to None.
+            stop_on_match (bool, optional): Whether or not the command is stopped, like a cancelled command,
+                on the first match. Defaults to False.
+            ignore_case (bool, optional): Whether or not patterns ignore case. Defaults to False.
+
+        Raises:
+            ValueError: Raised when no patterns are provided.
+            re.error: Raised when a pattern is not a valid regular expression.
+        """
+        if not isinstance(patterns, dict):
+            patterns = {pattern: pattern for pattern in patterns}
+        if not patterns:
+            raise ValueError("At least one pattern is required.")
+        self.names = list(patterns)
+        self.callback = callback
+        self.stop_on_match = stop_on_match
+        flags = re.IGNORECASE if ignore_case else 0
+        # every pattern is compiled on its own first, so that an invalid one is reported by itself
+        self.patterns = [re.compile(pattern.encode("utf-8"), flags) for pattern in patterns.values()]
+        self.regex: Optional[Pattern[bytes]] = None
+        # groups would be renumbered and inline flags would apply to, or be rejected in, a combined expression
+        if all(not regex.groups and not re.compile(regex.pattern).flags for regex in self.patterns):
+            self.regex = re.compile(
+                b"|".join(b"(?P<p%d>%s)" % (index, regex.pattern) for index, regex in enumerate(self.patterns)),
+                flags,
+            )
+
+    def finditer(self, data: bytes) -> Iterator[Tuple[int, Match[bytes]]]:
+        """Yields the index of the pattern and the match of every match in the provided data, in order.
+
+        Args:
+            data (bytes): The data to scan.
+
+        Yields:
+            Tuple[int, Match[bytes]]: The index of the pattern in the names of the watch and the match.
+        """
+        if self.regex is not None:
+            for match in self.regex.finditer(data):
+                yield int(match.lastgroup[1:]), match
+            return
+        matches = [(index, match) for index, regex in enumerate(self.patterns) for match in regex.finditer(data)]
+        yield from sorted(matches, key=lambda found: (found[1].start(), found[0]))
+
+    def scanner(self, cancellation: Optional[CancellationToken] = None) -> "OutputScanner":
+        """Returns a scanner for the output of a single execution.
+
+        Args:
+            cancellation (CancellationToken, optional): The token of the execution. Defaults to None.
+
+        Returns:
+            OutputScanner: The scanner.
+        """
+        return OutputScanner(watch=self, cancellation=cancellation)
+
+
+class OutputScanner(Base):
+    """Scans the output of a single execution for the patterns of an OutputWatch.
+
+    While a scanner is active on a thread, every OutputCapture created on that thread feeds it.
+    """
+
+    # a line longer than this is scanned in pieces instead of waiting for its end
+    MAX_LINE = 65536
+
+    _active = threading.local()
+
+    def __init__(self, watch: OutputWatch, cancellation: Optional[CancellationToken] = None) -> None:
+        """Creates a scanner for the provided watch.
+
+        Args:
+            watch (OutputWatch): The patterns to look for.
+            cancellation (CancellationToken, optional): The token of the execution. Defaults to None.
+        """
+        self.watch = watch
+        self.parent = cancellation
+        # stopping on a match cancels a token of its own, so that a match is not reported as a cancellation
+        self.cancellation = CancellationToken() if watch.stop_on_match else cancellation
+        self.matches: List[PatternMatch] = []
+        self.stopped = False
+        self._pending = b""
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def current() -> Optional["OutputScanner"]:
+        """Returns the scanner active on the current thread or None."""
+        return getattr(OutputScanner._active, "scanner", None)
+
+    @contextmanager
+    def activate(self) -> Iterator["OutputScanner"]:
+        """Makes this the scanner of the current thread for the duration of the block."""
+        previous = OutputScanner.current()
+        OutputScanner._active.scanner = self
+        linked = self.parent is not None and self.cancellation is not self.parent
+        try:
+            with self.parent.on_cancel(self.cancellation.cancel) if linked else nullcontext():
+                yield self
+        finally:
+            OutputScanner._active.scanner = previous
+
+    def feed(self, data: Union[bytes, bytearray, memoryview]) -> None:
+        """Scans the complete lines in the provided chunk of output and keeps the rest for the next chunk.
+
+        Args:
+            data (Union[bytes, bytearray, memoryview]): The output chunk.
+        """
+        with self._lock:
+            pending = self._pending + bytes(data)
+            end = pending.rfind(b"\n") + 1
+            if not end and len(pending) > self.MAX_LINE:
+                end = len(pending)
+            if end:
+                self._scan(pending[:end])
+                pending = pending[end:]
+            self._pending = pending
+
+    def close(self) -> None:
+        """Scans the output which did not end with a newline."""
+        with self._lock:
+            if self._pending:
+                self._scan(self._pending)
+                self._pending = b""
+
+    def _scan(self, data: bytes) -> None:
+        """Records every match in the provided complete lines. Must hold the lock."""
+        for index, match in self.watch.finditer(data):
+            start = data.rfind(b"\n", 0, match.start()) + 1
+            end = data.find(b"\n", match.end())
+            found = PatternMatch(
+                pattern=self.watch.names[index],
+                text=match.group().decode("utf-8", "replace"),
+                line=data[start : end if end != -1 else len(data)].decode("utf-8", "replace").rstrip("\r"),
+                offset=self._offset + match.start(),
+            )
+            self.matches.append(found)
+            if self.watch.callback is not None:
+                try:
+                    self.watch.callback(found)
+                except Exception as e:
+                    self.__logger.warning(f"Output watch callback failed on a match of '{found.pattern}'. {e}")
+            if self.watch.stop_on_match and not self.stopped:
+                self.stopped = True
+                self.__logger.info(f"Output matched '{found.pattern}'. Stopping the command.")
+                self.cancellation.cancel()
+        self._offset += len(data)
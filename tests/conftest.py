@@ -1,5 +1,9 @@
 """Configuration for the pytest test suite."""
 import random
+import re
+import subprocess
+from typing import Any
+from typing import Callable
 
 import pytest
 from click.testing import CliRunner
@@ -19,6 +23,16 @@ CONFIG = {
     "ssh_timeout": random.randint(1, 10),
 }
 
+FAKE_SUDO = """
+printf '%s' "$1" >&2
+read password
+if [ "$password" = secret ]; then echo "$2"; exec /bin/sh; fi
+echo 'Sorry, try again.' >&2
+printf '%s' "$1" >&2
+read password
+exit 1
+"""
+
 
 @pytest.fixture
 def runner() -> CliRunner:
@@ -36,3 +50,23 @@ def main_runner_class() -> Runner:
 def remote_configured_runner_class() -> Runner:
     """Returns a remote configured Runner class object."""
     return Runner(**CONFIG)
+
+
+@pytest.fixture
+def fake_sudo() -> Callable[[str], Any]:
+    """Returns a stream opener for ElevatedShell which prompts like sudo -S and accepts the password secret."""
+    from atomic_operator_runner.elevation import ProcessStream
+
+    def open_stream(command: str) -> ProcessStream:
+        prompt = re.search(r"atomic_operator_runner_prompt_\w+", command).group(0)
+        ready = re.search(r"atomic_operator_runner_ready_\w+", command).group(0)
+        return ProcessStream(
+            subprocess.Popen(
+                ["/bin/sh", "-c", FAKE_SUDO, "sudo", prompt, ready],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        )
+
+    return open_stream
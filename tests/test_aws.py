@@ -0,0 +1,70 @@
+"""Tests AWSRunner class methods."""
+import os
+import stat
+
+import pytest
+
+
+@pytest.fixture
+def fake_aws_cli(tmp_path, monkeypatch):
+    """Puts a fake aws executable first on the PATH."""
+    from atomic_operator_runner.aws import AWSRunner
+
+    cli = tmp_path / "aws"
+    cli.write_text('#!/bin/sh\necho "aws-cli/2.0.0 $AWS_PROFILE $AWS_DEFAULT_REGION $*"\n')
+    cli.chmod(cli.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(AWSRunner, "_cli_path", None)
+    monkeypatch.setattr(AWSRunner, "_environments", {})
+    return str(cli)
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Requires a POSIX shell")
+def test_cli_is_resolved_once(fake_aws_cli, main_runner_class, monkeypatch):
+    """Tests the AWS CLI version check only happens once per process."""
+    import subprocess
+
+    from atomic_operator_runner.aws import AWSRunner
+
+    main_runner_class(platform="aws", aws_profile="audit", aws_region="us-east-1")
+    calls = []
+    original_run = subprocess.run
+
+    def counting_run(*args, **kwargs):
+        calls.append(args)
+        return original_run(*args, **kwargs)
+
+    monkeypatch.setattr(subprocess, "run", counting_run)
+    assert AWSRunner()._resolve_cli() == fake_aws_cli
+    assert AWSRunner()._resolve_cli() == fake_aws_cli
+    assert len(calls) == 1
+    assert AWSRunner._cli_version.startswith("aws-cli/2.0.0")
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Requires a POSIX shell")
+def test_run_many_uses_profile(fake_aws_cli, main_runner_class):
+    """Tests AWS commands run concurrently with the configured profile and region."""
+    runner = main_runner_class(platform="aws", aws_profile="audit", aws_region="us-east-1")
+    responses = runner.run_many(commands=[f"aws s3 ls bucket-{i}" for i in range(4)], executor="sh", max_workers=2)
+    assert [r.output.strip() for r in responses] == [
+        f"aws-cli/2.0.0 audit us-east-1 s3 ls bucket-{i}" for i in range(4)
+    ]
+    assert all(r.return_code == 0 for r in responses)
+    assert all(r.environment.platform == "aws" for r in responses)
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Requires a POSIX shell")
+def test_timed_out_command_output_is_not_waited_for(fake_aws_cli, main_runner_class, monkeypatch):
+    """Tests a timed out AWS command returns even when a child process keeps its output open."""
+    import time
+
+    from atomic_operator_runner.aws import AWSRunner
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.local import LocalRunner
+
+    monkeypatch.setattr(LocalRunner, "READER_TIMEOUT", 0.5)
+    main_runner_class(platform="aws", aws_profile="audit", aws_region="us-east-1")
+    start = time.monotonic()
+    with Base.execution_context():
+        AWSRunner().run(executor="sh", command="sleep 10 & sleep 10", timeout=1)
+    assert time.monotonic() - start < 5
@@ -0,0 +1,59 @@
+"""Tests AWSAPIRunner class methods."""
+import pytest
+
+
+botocore = pytest.importorskip("botocore")
+
+
+@pytest.fixture
+def aws_runner(main_runner_class, monkeypatch):
+    """Returns a Runner configured for offline AWS API actions."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    return main_runner_class(platform="aws", aws_region="us-east-1")
+
+
+def test_clients_are_shared(aws_runner):
+    """Tests clients are created once per service."""
+    from atomic_operator_runner.aws_api import AWSAPIRunner
+
+    assert AWSAPIRunner()._get_client("s3") is AWSAPIRunner()._get_client("s3")
+
+
+def test_run_aws_actions(aws_runner):
+    """Tests AWS API actions are run concurrently and errors become records."""
+    import threading
+
+    from botocore.stub import Stubber
+
+    from atomic_operator_runner.aws_api import AWSAPIRunner
+    from atomic_operator_runner.models import AWSAction
+
+    # both actions have to be in flight at once to get past the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait_for_both(**kwargs):
+        barrier.wait()
+
+    clients = [AWSAPIRunner()._get_client("s3"), AWSAPIRunner()._get_client("sts")]
+    for client in clients:
+        client.meta.events.register("before-parameter-build", wait_for_both)
+    try:
+        with Stubber(clients[0]) as s3, Stubber(clients[1]) as sts:
+            s3.add_response("list_buckets", {"Buckets": [{"Name": "atomic-bucket"}]})
+            sts.add_client_error("get_caller_identity", service_error_code="AccessDenied", service_message="Denied")
+            responses = aws_runner.run_aws_actions(
+                actions=[
+                    AWSAction(service="s3", operation="ListBuckets"),
+                    AWSAction(service="sts", operation="get-caller-identity"),
+                ],
+                max_workers=2,
+            )
+    finally:
+        for client in clients:
+            client.meta.events.unregister("before-parameter-build", wait_for_both)
+    assert responses[0].return_code == 0
+    assert "atomic-bucket" in responses[0].output
+    assert responses[0].executor == "botocore"
+    assert responses[1].return_code == 254
+    assert responses[1].records[-1].message_data == "AccessDenied: Denied"
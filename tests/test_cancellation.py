@@ -0,0 +1,65 @@
+"""Tests CancellationToken class methods."""
+import sys
+import threading
+import time
+
+import pytest
+
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="Runs local sh commands.")
+
+
+def test_cancel_kills_the_process_tree(main_runner_class):
+    """Tests a cancelled local command stops with its children and keeps the output received so far."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.cancellation import CancellationToken
+
+    runner = main_runner_class(platform="linux")
+    token = CancellationToken()
+    threading.Timer(0.5, token.cancel).start()
+    start = time.monotonic()
+    with Base.execution_context():
+        # the background sleep keeps the output pipe open unless the whole process group is killed
+        response = runner._execute(
+            command="echo started; sleep 4 & wait; echo finished",
+            executor="sh",
+            cwd=None,
+            elevation_required=False,
+            cancellation=token,
+        )
+    assert time.monotonic() - start < 3
+    assert response.cancelled is True
+    assert response.output.strip() == "started"
+    assert response.end_timestamp is not None
+
+
+def test_cancelled_sweeps_do_not_start(main_runner_class):
+    """Tests commands are not ran once their token is cancelled and callbacks are called right away."""
+    from atomic_operator_runner.cancellation import CancellationToken
+
+    runner = main_runner_class(platform="linux")
+    token = CancellationToken()
+    token.cancel()
+    called = []
+    with token.on_cancel(lambda: called.append(True)):
+        pass
+    assert called == [True]
+    responses = runner.run_many(commands=["echo one", "echo two"], executor="sh", cancellation=token)
+    assert [(response.cancelled, response.output, response.command) for response in responses] == [
+        (True, None, "echo one"),
+        (True, None, "echo two"),
+    ]
+
+
+def test_cancel_ends_the_elevated_shell(main_runner_class, fake_sudo):
+    """Tests a command in an elevated shell returns its partial output without a return code when cancelled."""
+    from atomic_operator_runner.cancellation import CancellationToken
+    from atomic_operator_runner.elevation import ElevatedShell
+
+    main_runner_class(platform="linux")
+    shell = ElevatedShell(open_stream=fake_sudo, password="secret")
+    token = CancellationToken()
+    threading.Timer(0.5, token.cancel).start()
+    return_code, output, _output_file, _errors = shell.run("echo partial; sleep 5", cancellation=token)
+    assert (return_code, output.strip()) == (None, "partial")
+    assert not shell.stream.alive()
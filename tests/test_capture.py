@@ -0,0 +1,116 @@
+"""Tests OutputCapture class methods."""
+import io
+import os
+import sys
+import time
+
+import pytest
+
+
+def test_capture_in_memory():
+    """Tests output below the limit stays in memory."""
+    from atomic_operator_runner.capture import OutputCapture
+
+    capture = OutputCapture(max_size=1024)
+    capture.consume(io.BytesIO(b"Hello World!"))
+    output, output_file = capture.close()
+    assert output == "Hello World!"
+    assert output_file is None
+    assert not capture.spilled
+
+
+def test_capture_spills_to_disk():
+    """Tests output above the limit is written to a temporary file."""
+    from atomic_operator_runner.capture import OutputCapture
+
+    data = os.urandom(512).hex().encode()
+    capture = OutputCapture(max_size=100, preview_size=10)
+    for i in range(0, len(data), 33):
+        capture.write(data[i : i + 33])
+    output, output_file = capture.close()
+    assert output is None
+    assert capture.spilled
+    try:
+        assert output_file.size == len(data)
+        assert output_file.head == data[:10].decode()
+        assert output_file.tail == data[-10:].decode()
+        assert b"".join(output_file.iter_chunks(chunk_size=7)) == data
+        assert output_file.read(size=5, offset=20) == data[20:25]
+    finally:
+        output_file.remove()
+    assert not os.path.exists(output_file.path)
+    output_file.remove()
+
+
+def test_capture_falls_back_to_console_encoding():
+    """Tests output which is not valid UTF-8 is decoded with the fallback encoding."""
+    from atomic_operator_runner.capture import OutputCapture
+    from atomic_operator_runner.capture import get_console_encoding
+
+    assert get_console_encoding("linux", "/bin/sh") == "utf-8"
+    capture = OutputCapture(fallback_encoding="cp1252")
+    capture.consume(io.BufferedReader(io.BytesIO("Café résumé".encode("cp1252"))))
+    output, _ = capture.close()
+    assert output == "Café résumé"
+
+
+def test_spilled_output_decodes_incrementally():
+    """Tests multi-byte characters split across chunks are decoded correctly."""
+    from atomic_operator_runner.capture import OutputCapture
+
+    text = "é€" * 100
+    capture = OutputCapture(max_size=10, preview_size=16)
+    capture.write(text.encode("utf-8"))
+    _, output_file = capture.close()
+    try:
+        assert output_file.encoding == "utf-8"
+        assert "".join(output_file.iter_text(chunk_size=7)) == text
+    finally:
+        os.remove(output_file.path)
+
+
+def test_compressed_output_is_decompressed_in_chunks():
+    """Tests gzip output is decompressed as it is consumed and uncompressed output passes through."""
+    import gzip
+    import io
+
+    from atomic_operator_runner.capture import OutputCapture
+
+    data = b"atomic red team\n" * 100000
+    compressed = gzip.compress(data[:800000]) + gzip.compress(data[800000:])
+    capture = OutputCapture(max_size=len(data) * 2)
+    assert capture.consume(io.BytesIO(compressed), compressed=True) == len(compressed)
+    output, output_file = capture.close()
+    assert output.encode() == data
+    capture = OutputCapture()
+    capture.consume(io.BytesIO(b"not compressed"), compressed=True)
+    assert capture.close()[0] == "not compressed"
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Runs a local sh command.")
+def test_timed_out_command_output_is_not_waited_for(main_runner_class, monkeypatch):
+    """Tests a timed out command returns even when its children keep its output open."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.local import LocalRunner
+
+    monkeypatch.setattr(LocalRunner, "READER_TIMEOUT", 0.5)
+    main_runner_class(platform="linux")
+    start = time.monotonic()
+    with Base.execution_context():
+        LocalRunner().run(executor="sh", command="sleep 30 & sleep 30", timeout=1)
+    assert time.monotonic() - start < 5
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Runs a local sh command.")
+def test_timed_out_command_keeps_its_spilled_output(main_runner_class):
+    """Tests the partial output a timed out command spilled to a file is handed to the caller."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.local import LocalRunner
+
+    main_runner_class(platform="linux", max_output_size=16)
+    with Base.execution_context() as response:
+        LocalRunner().run(executor="sh", command="printf '%064d' 0; exec sleep 30", timeout=1)
+    assert response.output_file is not None
+    assert os.path.getsize(response.output_file.path) == 64
+    response.output_file.remove()
+    assert not os.path.exists(response.output_file.path)
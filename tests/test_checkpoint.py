@@ -0,0 +1,45 @@
+"""Tests CheckpointStore class methods."""
+import os
+
+import pytest
+
+
+def test_checkpoint_survives_interrupted_write(tmp_path):
+    """Tests recorded executions are reloaded and a partially written line is ignored."""
+    from atomic_operator_runner import CheckpointStore
+    from atomic_operator_runner.models import RunnerResponse
+
+    path = str(tmp_path / "sweep.jsonl")
+    key = CheckpointStore.key(hostname="host1", command="whoami", executor="sh")
+    assert key != CheckpointStore.key(hostname="host2", command="whoami", executor="sh")
+    CheckpointStore(path=path).add(key, RunnerResponse(command="whoami", executor="sh", **{"return-code": 0}))
+    with open(path, "a") as f:
+        f.write('{"key": "interrupted", "resp')
+    store = CheckpointStore(path=path)
+    assert len(store) == 1
+    assert store.get(key).return_code == 0
+    other = CheckpointStore.key(hostname="host2", command="whoami", executor="sh")
+    store.add(other, RunnerResponse(command="whoami", executor="sh", **{"return-code": 1}))
+    assert len(CheckpointStore(path=path)) == 2
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Requires a POSIX shell")
+def test_resumed_sweep_skips_completed_commands(main_runner_class, tmp_path):
+    """Tests a resumed sweep only runs commands which have not completed."""
+    from atomic_operator_runner import CheckpointStore
+
+    path = str(tmp_path / "sweep.jsonl")
+    marker = tmp_path / "ran"
+    runner = main_runner_class(platform="linux")
+    runner.run_many(commands=["echo one"], executor="sh", checkpoint=CheckpointStore(path=path))
+    responses = runner.run_many(
+        commands=["echo one", f"echo two && touch {marker}"], executor="sh", checkpoint=CheckpointStore(path=path)
+    )
+    assert [r.output.strip() for r in responses] == ["one", "two"]
+    assert marker.exists()
+    marker.unlink()
+    responses = runner.run_many(
+        commands=[f"echo two && touch {marker}"], executor="sh", checkpoint=CheckpointStore(path=path)
+    )
+    assert responses[0].output.strip() == "two"
+    assert not marker.exists()
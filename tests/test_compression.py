@@ -0,0 +1,57 @@
+"""Tests Compression class methods."""
+import os
+import subprocess
+import time
+
+import pytest
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Requires a POSIX shell")
+def test_posix_wrapper_keeps_exit_status():
+    """Tests the wrapped command returns gzip output and the exit status of the command."""
+    import gzip
+    import shutil
+
+    from atomic_operator_runner.compression import Compression
+
+    if not shutil.which("gzip"):
+        pytest.skip("Requires gzip")
+    command = Compression.wrap_posix("echo hello; echo oops >&2; exit 3")
+    result = subprocess.run(["/bin/sh", "-c", command], stdout=subprocess.PIPE, stderr=subprocess.PIPE)  # noqa: S603
+    assert result.returncode == 3
+    assert gzip.decompress(result.stdout) == b"hello\n"
+    assert result.stderr == b"oops\n"
+
+
+def test_auto_mode_follows_measured_bandwidth(main_runner_class):
+    """Tests auto mode compresses only after a slow transfer has been measured."""
+    from atomic_operator_runner.compression import Compression
+
+    main_runner_class(platform="linux", hostname="slow-host", compression="auto", compression_threshold=1000000)
+    compression = Compression()
+    assert not compression.enabled()
+    compression.record(size=100, seconds=10)
+    assert not compression.enabled()
+    compression.record(size=1000000, seconds=10)
+    assert compression.enabled()
+
+
+def test_transfer_time_starts_at_the_first_chunk():
+    """Tests the time a command takes before writing output is not counted as transfer time."""
+    from atomic_operator_runner.capture import OutputCapture
+
+    class SlowStartStream:
+        def __init__(self):
+            self.chunks = [b"a" * 100, b"b" * 100]
+            self.started = False
+
+        def read(self, size):
+            if not self.started:
+                self.started = True
+                time.sleep(0.5)
+            return self.chunks.pop(0) if self.chunks else b""
+
+    capture = OutputCapture()
+    assert capture.consume(SlowStartStream()) == 200
+    assert capture.transfer_size == 100
+    assert capture.transfer_time < 0.25
@@ -0,0 +1,398 @@
+"""Tests SSHConnectionPool class methods."""
+import io
+import threading
+import time
+
+import pytest
+
+
+class FakeChannel:
+    """Stands in for a paramiko channel."""
+
+    def recv_exit_status(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class FakeTransport:
+    """Stands in for a paramiko transport."""
+
+    def is_active(self):
+        return True
+
+    def set_keepalive(self, interval):
+        pass
+
+
+class FakeSSHClient:
+    """Stands in for a paramiko SSHClient, counting handshakes and concurrent channels."""
+
+    connects = 0
+    open_channels = 0
+    max_open_channels = 0
+    lock = threading.Lock()
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, hostname, **kwargs):
+        with FakeSSHClient.lock:
+            FakeSSHClient.connects += 1
+        time.sleep(0.05)
+
+    def get_transport(self):
+        return FakeTransport()
+
+    def exec_command(self, command):
+        with FakeSSHClient.lock:
+            FakeSSHClient.open_channels += 1
+            FakeSSHClient.max_open_channels = max(FakeSSHClient.max_open_channels, FakeSSHClient.open_channels)
+        time.sleep(0.05)
+        with FakeSSHClient.lock:
+            FakeSSHClient.open_channels -= 1
+        stdout = io.BytesIO(command.encode())
+        stdout.channel = FakeChannel()
+        return io.BytesIO(), stdout, io.BytesIO()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def reset_fakes():
+    """Resets the counters and recordings of the fake clients before every test."""
+    FakeSSHClient.connects = 0
+    FakeSSHClient.open_channels = 0
+    FakeSSHClient.max_open_channels = 0
+    FakeBastionSSHClient.connections = []
+    FakeBastionTransport.channels = []
+    FakeWinRS.opened = 0
+
+
+def test_commands_share_one_transport(main_runner_class, monkeypatch):
+    """Tests concurrent commands against one host use a single handshake and respect the channel limit."""
+    from atomic_operator_runner import connections
+    from atomic_operator_runner.connections import SSHConnectionPool
+
+    monkeypatch.setattr(connections, "SSHClient", FakeSSHClient)
+    runner = main_runner_class(platform="linux", hostname="pooled-host", password="password", max_channels=2)
+    SSHConnectionPool().close()
+    responses = runner.run_many(commands=[f"echo {i}" for i in range(6)], executor="sh", max_workers=6)
+    assert [r.output for r in responses] == [f"echo {i}" for i in range(6)]
+    assert all(r.return_code == 0 for r in responses)
+    assert FakeSSHClient.connects == 1
+    assert FakeSSHClient.max_open_channels == 2
+    FakeSSHClient.max_open_channels = 0
+    runner = main_runner_class(platform="linux", hostname="pooled-host", password="password", max_channels=3)
+    runner.run_many(commands=[f"echo {i}" for i in range(6)], executor="sh", max_workers=6)
+    assert FakeSSHClient.max_open_channels == 3
+    assert FakeSSHClient.connects == 1
+    SSHConnectionPool().close()
+
+
+def test_only_new_connections_are_rate_limited(main_runner_class, monkeypatch):
+    """Tests scheduled jobs reusing a pooled transport do not wait for the connection rate limit."""
+    from atomic_operator_runner import Scheduler
+    from atomic_operator_runner import connections
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.connections import SSHConnectionPool
+    from atomic_operator_runner.models import Host
+    from atomic_operator_runner.models import Job
+
+    monkeypatch.setattr(connections, "SSHClient", FakeSSHClient)
+    host = Host(hostname="limited-host", platform="linux", password="password")
+    scheduler = Scheduler(runner=main_runner_class(platform="linux"), per_host_limit=1, connections_per_second=1)
+    for i in range(4):
+        scheduler.submit(Job(command=f"echo {i}", executor="sh", host=host))
+    start = time.monotonic()
+    responses = scheduler.run()
+    assert time.monotonic() - start < 1
+    assert [r.output for r in responses] == [f"echo {i}" for i in range(4)]
+    assert FakeSSHClient.connects == 1
+    with Base.execution_context(config=host):
+        SSHConnectionPool().close()
+
+
+def test_stderr_is_read_while_stdout_is_drained(main_runner_class, monkeypatch):
+    """Tests a command writing a lot to stderr before finishing stdout does not block its channel."""
+    from atomic_operator_runner import connections
+    from atomic_operator_runner.base import Base
+
+    stderr_read = threading.Event()
+
+    class BlockedStdout:
+        channel = FakeChannel()
+
+        def __init__(self, data):
+            self.data = io.BytesIO(data)
+
+        def read(self, size=-1):
+            # the host only finishes stdout once stderr has been read
+            assert stderr_read.wait(timeout=5)
+            return self.data.read(size)
+
+    class Stderr(io.BytesIO):
+        def read(self, size=-1):
+            data = super().read(size)
+            stderr_read.set()
+            return data
+
+    class NoisySSHClient(FakeSSHClient):
+        def exec_command(self, command):
+            return io.BytesIO(), BlockedStdout(b"done\n"), Stderr(b"warning\n" * 100000)
+
+    monkeypatch.setattr(connections, "SSHClient", NoisySSHClient)
+    runner = main_runner_class(platform="linux", hostname="noisy-host", password="password")
+    with Base.execution_context():
+        response = runner._execute(command="noisy", executor="sh", cwd=None, elevation_required=False)
+    assert response.output == "done\n"
+    assert response.return_code == 0
+    connections.SSHConnectionPool().close()
+
+
+class FakeBastionTransport(FakeTransport):
+    """Stands in for the transport of a bastion, recording the channels opened through it."""
+
+    channels = []
+
+    def open_channel(self, kind, dest_addr, src_addr, timeout=None):
+        FakeBastionTransport.channels.append((kind, dest_addr))
+        return f"channel to {dest_addr[0]}"
+
+
+class FakeBastionSSHClient(FakeSSHClient):
+    """Stands in for a paramiko SSHClient, recording connections made directly or through a bastion."""
+
+    connections = []
+
+    def connect(self, hostname, sock=None, **kwargs):
+        FakeBastionSSHClient.connections.append((hostname, sock))
+        self._transport = FakeBastionTransport()
+
+    def get_transport(self):
+        return self._transport
+
+
+def test_targets_share_one_bastion(main_runner_class, monkeypatch):
+    """Tests SSH targets behind a bastion are reached over channels of a single bastion connection."""
+    from atomic_operator_runner import connections
+    from atomic_operator_runner.connections import SSHConnectionPool
+
+    monkeypatch.setattr(connections, "SSHClient", FakeBastionSSHClient)
+    for target in ["10.0.0.1", "10.0.0.2"]:
+        main_runner_class(platform="linux", hostname=target, password="password", bastion_hostname="jump")
+        SSHConnectionPool().get_client()
+    assert FakeBastionSSHClient.connections == [
+        ("jump", None),
+        ("10.0.0.1", "channel to 10.0.0.1"),
+        ("10.0.0.2", "channel to 10.0.0.2"),
+    ]
+    assert FakeBastionTransport.channels == [("direct-tcpip", ("10.0.0.1", 22)), ("direct-tcpip", ("10.0.0.2", 22))]
+    SSHConnectionPool.close_all()
+
+
+def test_tunnel_forwards_connections():
+    """Tests connections to the local port of a tunnel reach the target."""
+    import socket
+
+    from atomic_operator_runner.connections import Tunnel
+
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+
+    def echo():
+        connection, _address = server.accept()
+        connection.sendall(connection.recv(1024).upper())
+        connection.close()
+
+    threading.Thread(target=echo, daemon=True).start()
+    tunnel = Tunnel(open_channel=lambda: socket.create_connection(server.getsockname()))
+    client = socket.create_connection(("127.0.0.1", tunnel.port), timeout=5)
+    client.sendall(b"winrm")
+    assert client.recv(1024) == b"WINRM"
+    client.close()
+    tunnel.close()
+    server.close()
+
+
+def _serve_tls(tmp_path, hostname):
+    """Serves HTTPS on a local port with a self-signed certificate for the provided hostname."""
+    import datetime
+    import http.server
+    import ssl
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, hostname)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(hostname)]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    certificate_path, key_path = tmp_path / "host.pem", tmp_path / "host.key"
+    certificate_path.write_bytes(certificate.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(
+        key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    )
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(str(certificate_path), str(key_path))
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, str(certificate_path)
+
+
+def test_tunnelled_winrm_validates_the_hostname(main_runner_class, monkeypatch, tmp_path):
+    """Tests WinRM over a bastion tunnel validates the certificate against the hostname of the host."""
+    import requests
+
+    from atomic_operator_runner.connections import SSHConnectionPool
+    from atomic_operator_runner.remote import RemoteRunner
+
+    server, certificate = _serve_tls(tmp_path, "winrm-host")
+    monkeypatch.setattr(SSHConnectionPool, "get_tunnel_port", lambda self, port: server.server_address[1])
+    try:
+        for hostname, valid in [("winrm-host", True), ("other-host", False)]:
+            main_runner_class(platform="windows", hostname=hostname, bastion_hostname="jump", verify_ssl=True)
+            session = RemoteRunner()._get_pypsrp_client().wsman.transport.session
+            url = f"https://127.0.0.1:{server.server_address[1]}/"
+            if valid:
+                assert session.get(url, verify=certificate, timeout=5).status_code == 200
+            else:
+                with pytest.raises(requests.exceptions.SSLError):
+                    session.get(url, verify=certificate, timeout=5)
+            session.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_warm_connects_hosts_ahead_of_time(main_runner_class, monkeypatch):
+    """Tests warming connects every host once, reports latency and leaves the transports for later commands."""
+    from paramiko.ssh_exception import AuthenticationException
+
+    from atomic_operator_runner import connections
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.connections import SSHConnectionPool
+    from atomic_operator_runner.models import Host
+
+    class FlakySSHClient(FakeSSHClient):
+        def connect(self, hostname, **kwargs):
+            if hostname == "locked-host":
+                raise AuthenticationException("Authentication failed.")
+            super().connect(hostname, **kwargs)
+
+    monkeypatch.setattr(connections, "SSHClient", FlakySSHClient)
+    runner = main_runner_class(platform="linux", hostname="warm-host-1", password="password")
+    hosts = [
+        Host(hostname=name, password="password", platform="linux", run_type="remote")
+        for name in ("warm-host-1", "warm-host-2", "locked-host")
+    ]
+    results = runner.warm(hosts=hosts)
+    assert [result.hostname for result in results] == ["warm-host-1", "warm-host-2", "locked-host"]
+    assert [result.connected for result in results] == [True, True, False]
+    assert all(result.connect_latency >= 0.05 for result in results[:2])
+    assert "Authentication failed" in results[2].error
+    assert FakeSSHClient.connects == 2
+    with Base.execution_context():
+        runner.run(command="echo warm", executor="sh")
+    assert FakeSSHClient.connects == 2
+    for host in hosts[:2]:
+        with Base.execution_context(config=host):
+            SSHConnectionPool().close()
+
+
+class FakeWinRS:
+    """Stands in for a pypsrp WinRS shell, counting the shells opened."""
+
+    opened = 0
+
+    def __init__(self, wsman):
+        self.wsman = wsman
+        self.id = None
+        self.expired = False
+
+    def open(self):
+        FakeWinRS.opened += 1
+        self.id = f"shell-{FakeWinRS.opened}"
+
+    def close(self):
+        self.id = None
+
+
+class FakeProcess:
+    """Stands in for a pypsrp Process, failing to start in a shell the host has closed."""
+
+    def __init__(self, shell, executable):
+        from pypsrp.shell import CommandState
+
+        self.shell = shell
+        self.executable = executable
+        self.id = None
+        self.state = CommandState.PENDING
+        self.rc = None
+        self.stdout = b""
+        self.stderr = b""
+
+    def invoke(self):
+        from pypsrp.exceptions import WSManFaultError
+        from pypsrp.shell import CommandState
+
+        if self.shell.expired:
+            raise WSManFaultError(2150858843, "winrs-host", "The shell was not found on the server.", "", "", "")
+        self.id = "command"
+        self.state = CommandState.DONE
+        self.rc = 0
+        self.stdout = f"{self.shell.id}: {self.executable}\r\n".encode()
+
+    def signal(self, code):
+        pass
+
+
+def test_cmd_commands_share_a_winrs_shell(main_runner_class, monkeypatch):
+    """Tests cmd commands reuse one open shell and a shell closed by the host is replaced."""
+    from atomic_operator_runner import connections
+    from atomic_operator_runner import remote
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.connections import WinRSShellPool
+
+    monkeypatch.setattr(connections, "WinRS", FakeWinRS)
+    monkeypatch.setattr(remote, "Process", FakeProcess)
+    runner = main_runner_class(platform="windows", hostname="winrs-host", username="user", password="password")
+    with Base.execution_context():
+        outputs = [runner._execute(command="echo 0", executor="cmd", cwd=None, elevation_required=False).output]
+        outputs.append(runner._execute(command="echo 1", executor="cmd", cwd=None, elevation_required=False).output)
+        for idle in WinRSShellPool._idle.values():
+            for shell in idle:
+                shell.expired = True
+        response = runner._execute(command="echo 2", executor="cmd", cwd=None, elevation_required=False)
+    assert outputs == ["shell-1: echo 0\r\n", "shell-1: echo 1\r\n"]
+    assert (response.output, response.return_code) == ("shell-2: echo 2\r\n", 0)
+    assert FakeWinRS.opened == 2
+    WinRSShellPool.close_all()
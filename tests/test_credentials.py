@@ -0,0 +1,50 @@
+"""Tests CredentialCache class methods."""
+import io
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def rsa_key():
+    """Generates a private key for the tests in this module."""
+    from paramiko import RSAKey
+
+    return RSAKey.generate(bits=1024)
+
+
+def test_key_file_is_parsed_once(rsa_key, tmp_path, monkeypatch):
+    """Tests a key file is parsed once and reloaded only when it changes."""
+    import os
+
+    from atomic_operator_runner.credentials import CredentialCache
+
+    path = str(tmp_path / "id_rsa")
+    rsa_key.write_private_key_file(path, password="secret")
+    cache = CredentialCache()
+    calls = []
+    parse = cache._parse
+    monkeypatch.setattr(cache, "_parse", lambda data, passphrase: calls.append(1) or parse(data, passphrase))
+    key = cache.load_key_file(path, passphrase="secret")
+    assert key == rsa_key
+    assert cache.load_key_file(path, passphrase="secret") is key
+    assert len(calls) == 1
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+    assert cache.load_key_file(path, passphrase="secret") == rsa_key
+    assert len(calls) == 2
+
+
+def test_key_string_is_cached(rsa_key):
+    """Tests private key strings are parsed without knowing the key type and cached."""
+    from paramiko.ssh_exception import SSHException
+
+    from atomic_operator_runner.credentials import CredentialCache
+
+    data = io.StringIO()
+    rsa_key.write_private_key(data)
+    cache = CredentialCache()
+    key = cache.load_key_string(data.getvalue())
+    assert key.get_name() == "ssh-rsa"
+    assert cache.load_key_string(data.getvalue()) is key
+    with pytest.raises(SSHException):
+        cache.load_key_string("not a key")
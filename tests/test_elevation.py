@@ -0,0 +1,135 @@
+"""Tests ElevatedShell and ElevatedSession class methods."""
+import os
+import sys
+
+import pytest
+
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="The elevated shell runs on Linux and macOS.")
+
+
+def test_sudo_password_is_sent_once(main_runner_class, fake_sudo):
+    """Tests the password answers a single prompt and commands then run without authenticating."""
+    from atomic_operator_runner.elevation import ElevatedShell
+    from atomic_operator_runner.utils.exceptions import ElevationError
+
+    main_runner_class(platform="linux")
+    with pytest.raises(ElevationError):
+        ElevatedShell(open_stream=fake_sudo, password="wrong")
+    with pytest.raises(ElevationError):
+        ElevatedShell(open_stream=fake_sudo)
+    shell = ElevatedShell(open_stream=fake_sudo, password="secret")
+    return_code, output, output_file, errors = shell.run("printf partial; echo oops >&2; exit 3")
+    assert (return_code, output, output_file, errors) == (3, "partial", None, "oops\n")
+    return_code, output, _output_file, _errors = shell.run("echo $0", executor="bash", cwd="/")
+    assert return_code == 0
+    assert output.strip().endswith("bash")
+    shell.close()
+
+
+@pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() != 0, reason="Opening a root shell needs root.")
+def test_elevated_commands_share_one_session(main_runner_class):
+    """Tests elevated local commands run in a single shell which is reopened once it exits."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.elevation import ElevatedSession
+
+    runner = main_runner_class(platform="linux")
+    session = ElevatedSession()
+    with Base.execution_context():
+        runner._execute(command="cd /tmp; echo one", executor="sh", cwd=None, elevation_required=True)
+        shell = ElevatedSession._shells[session._key()]
+        response = runner._execute(command="pwd; echo two; exit 4", executor="sh", cwd="/", elevation_required=True)
+        assert ElevatedSession._shells[session._key()] is shell
+        shell.close()
+        runner._execute(command="echo three", executor="sh", cwd=None, elevation_required=True)
+        assert ElevatedSession._shells[session._key()] is not shell
+    assert response.return_code == 4
+    assert response.elevation_required is True
+    assert response.output.split() == ["/", "two"]
+    ElevatedSession.close_all()
+
+
+class FakeRunspacePool:
+    """Stands in for a pypsrp RunspacePool, recording whether it was closed."""
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakePowerShell:
+    """Stands in for a pypsrp PowerShell pipeline, returning the objects queued for the next script."""
+
+    results = []
+    scripts = []
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.streams = type("Streams", (), {"error": []})()
+        self.had_errors = False
+        self.arguments = []
+
+    def add_script(self, script):
+        self.script = script
+        FakePowerShell.scripts.append(self)
+
+    def add_argument(self, value):
+        self.arguments.append(value)
+
+    def invoke(self):
+        result = FakePowerShell.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_cmd_exit_code_is_read_from_its_own_object(main_runner_class, monkeypatch):
+    """Tests the exit code of an elevated cmd command is not parsed from its output and a failed pool is closed."""
+    from pypsrp import powershell
+
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.elevation import ElevatedSession
+
+    pools = []
+    monkeypatch.setattr(powershell, "PowerShell", FakePowerShell)
+    monkeypatch.setattr(ElevatedSession, "_get_pool", lambda self, key: pools.append(FakeRunspacePool()) or pools[-1])
+    main_runner_class(platform="windows", hostname="elevated-host")
+    FakePowerShell.results = [["done\r\n42\r\n", 3], ["not a number\r\n"], ConnectionResetError("reset")]
+    FakePowerShell.scripts = []
+    with Base.execution_context():
+        session = ElevatedSession()
+        assert session.run_cmd("echo done & echo 42 & exit /b 3") == ("done\r\n42\r\n", "", 3)
+        assert session.run_cmd("missing") == ("not a number\r\n", "", -1)
+        with pytest.raises(ConnectionResetError):
+            session.run_cmd("echo lost")
+    assert [pool.closed for pool in pools] == [False, False, True]
+    # the command is an argument of the script, so a line ending a here-string cannot break out of it
+    FakePowerShell.results = [["", 0]]
+    with Base.execution_context():
+        ElevatedSession().run_cmd("echo one\n'@\nWrite-Output injected")
+    pipeline = FakePowerShell.scripts[-1]
+    assert pipeline.arguments == ["echo one\n'@\nWrite-Output injected"]
+    assert "injected" not in pipeline.script
+
+
+def test_local_windows_commands_record_that_they_are_not_elevated(main_runner_class):
+    """Tests an elevated command on the local Windows system runs unelevated and says so on its response."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.executors import EXECUTORS
+    from atomic_operator_runner.models import Executor
+
+    EXECUTORS.register(
+        Executor(name="test-windows-python", paths={"windows": sys.executable}, arguments=["-c"], input="argument")
+    )
+    runner = main_runner_class(platform="windows")
+    try:
+        with Base.execution_context():
+            response = runner._execute(
+                command="print('unelevated')", executor="test-windows-python", cwd=None, elevation_required=True
+            )
+    finally:
+        EXECUTORS.unregister("test-windows-python")
+    assert response.output.strip() == "unelevated"
+    assert response.elevation_required is False
@@ -0,0 +1,110 @@
+"""Tests ExecutorRegistry class methods."""
+import subprocess
+import sys
+
+import pytest
+
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="The executors used here run on Linux and macOS.")
+
+
+def test_registered_executors_run_locally(main_runner_class):
+    """Tests registered executors run with each input method and appear in the command map."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.executors import EXECUTORS
+    from atomic_operator_runner.models import Executor
+
+    paths = {"linux": sys.executable, "macos": sys.executable}
+    EXECUTORS.register(Executor(name="test-python-stdin", paths=paths, arguments=["-"]))
+    EXECUTORS.register(Executor(name="test-python-argument", paths=paths, arguments=["-c"], input="argument"))
+    EXECUTORS.register(Executor(name="test-python-file", paths=paths, input="file", file_extension=".py"))
+    assert Base.COMMAND_MAP["test-python-file"] == paths
+    runner = main_runner_class(platform="linux")
+    try:
+        for name in ("test-python-stdin", "test-python-argument", "test-python-file"):
+            with Base.execution_context():
+                response = runner._execute(
+                    command="import sys\nprint('hello')\nsys.exit(3)", executor=name, cwd=None, elevation_required=False
+                )
+            assert response.output.strip() == "hello"
+            assert response.return_code == 3
+    finally:
+        for name in ("test-python-stdin", "test-python-argument", "test-python-file"):
+            EXECUTORS.unregister(name)
+    assert "test-python-file" not in Base.COMMAND_MAP
+    with pytest.raises(ValueError):
+        EXECUTORS.register(Executor(name="test-unknown", input="socket"))
+
+
+@pytest.mark.parametrize("input_method", ["stdin", "argument", "file"])
+def test_shell_command_keeps_output_and_exit_status(input_method):
+    """Tests the shell command of each input method runs the command and keeps its exit status."""
+    from atomic_operator_runner.executors import ExecutorRegistry
+    from atomic_operator_runner.models import Executor
+
+    registry = ExecutorRegistry()
+    registry.register(
+        Executor(
+            name="test-sh",
+            paths={"linux": "/bin/sh", "macos": "/bin/sh"},
+            arguments=["-c"] if input_method == "argument" else [],
+            input=input_method,
+        )
+    )
+    command = registry.shell_command("test-sh", "echo \"$((1 + 1))\" '$HOME'\nexit 5", platform="linux")
+    result = subprocess.run(["/bin/sh", "-c", command], capture_output=True)
+    assert result.stdout == b"2 $HOME\n"
+    assert result.returncode == 5
+
+
+def test_windows_transports_only_reach_windows_hosts(main_runner_class):
+    """Tests WinRS and PowerShell executors run over SSH on other platforms or are rejected when they cannot."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.executors import EXECUTORS
+    from atomic_operator_runner.remote import RemoteRunner
+    from atomic_operator_runner.utils.exceptions import IncorrectExecutorError
+
+    assert EXECUTORS.transport("command_prompt", "windows") == "winrs"
+    assert EXECUTORS.transport("command_prompt", "linux") == "ssh"
+    assert EXECUTORS.transport("cmd", "macos") is None
+    assert EXECUTORS.transport("powershell", "linux") is None
+    assert EXECUTORS.transport("sh", "linux") == "ssh"
+    main_runner_class(platform="linux", hostname="linux-host")
+    with Base.execution_context(), pytest.raises(IncorrectExecutorError):
+        RemoteRunner()._run(executor="cmd", command="dir")
+
+
+def test_pwsh_runs_over_powershell_remoting_on_windows(main_runner_class, monkeypatch):
+    """Tests pwsh runs its Windows binary from a runspace with the command passed encoded."""
+    import base64
+    from contextlib import contextmanager
+
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.executors import EXECUTORS
+    from atomic_operator_runner.remote import RemoteRunner
+
+    assert EXECUTORS.transport("pwsh", "windows") == "powershell"
+    assert EXECUTORS.transport("pwsh", "linux") == "ssh"
+    scripts = []
+
+    @contextmanager
+    def session(self):
+        yield None
+
+    def execute_ps(self, client, script, cancellation=None):
+        scripts.append(script)
+        return "done", [], False
+
+    monkeypatch.setattr(RemoteRunner, "_pypsrp_session", session)
+    monkeypatch.setattr(RemoteRunner, "_execute_ps", execute_ps)
+    main_runner_class(platform="windows", hostname="windows-host")
+    command = "Write-Output @'\n'@\nWrite-Output 'it''s'"
+    with Base.execution_context():
+        RemoteRunner()._run(executor="pwsh", command=command)
+        assert Base.response.output == "done"
+    assert scripts[0].splitlines()[1] == (
+        "$atomic_operator_runner_command | & 'C:\\Program Files\\PowerShell\\7\\pwsh.exe'"
+        " '-NoProfile' '-NonInteractive' '-Command' '-'"
+    )
+    assert base64.b64encode(command.encode("utf-8")).decode("ascii") in scripts[0]
+    assert command not in scripts[0]
@@ -0,0 +1,75 @@
+"""Tests FactCache class methods."""
+import sys
+from datetime import datetime
+
+import pytest
+
+
+def test_local_facts_are_discovered_once(main_runner_class, monkeypatch):
+    """Tests local facts are discovered once and again after the time to live has passed."""
+    from atomic_operator_runner.facts import FactCache
+
+    cache = FactCache()
+    discover_local = cache._discover_local
+    calls = []
+    monkeypatch.setattr(FactCache, "_discover_local", lambda self: calls.append(1) or discover_local())
+    main_runner_class(platform="linux")
+    cache.clear()
+    assert cache.get() is None
+    main_runner_class(platform="linux", discover_facts=True)
+    facts = cache.get()
+    assert facts.user and facts.hostname
+    assert cache.get() is facts
+    assert len(calls) == 1
+    main_runner_class(platform="linux", discover_facts=True, facts_ttl=-1)
+    cache.get()
+    assert len(calls) == 2
+    cache.clear()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Runs a local sh command.")
+def test_sudo_is_only_asked_for_elevated_commands(main_runner_class, monkeypatch):
+    """Tests local discovery does not run sudo until an elevated command is about to run."""
+    from atomic_operator_runner import facts as facts_module
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.facts import FactCache
+
+    asked = []
+    monkeypatch.setattr(facts_module.shutil, "which", lambda name: f"/usr/bin/{name}")
+    monkeypatch.setattr(facts_module.os, "geteuid", lambda: 1000)
+    monkeypatch.setattr(FactCache, "_can_sudo_locally", lambda self: asked.append(1) or False)
+    runner = main_runner_class(platform="linux", discover_facts=True)
+    cache = FactCache()
+    cache.clear()
+    with Base.execution_context():
+        runner._execute(command="echo plain", executor="sh", cwd=None, elevation_required=False)
+    assert asked == []
+    assert cache.get().can_elevate is None
+    assert cache.can_elevate(cache.get()) is False
+    assert cache.can_elevate(cache.get()) is False
+    assert asked == [1]
+    cache.clear()
+
+
+def test_remote_facts_are_parsed_and_checked(main_runner_class):
+    """Tests probe output is parsed and unavailable executors are rejected before running."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.facts import FactCache
+    from atomic_operator_runner.models import HostFacts
+    from atomic_operator_runner.utils.exceptions import IncorrectExecutorError
+
+    runner = main_runner_class(platform="linux", hostname="probed-host", username="user")
+    cache = FactCache()
+    assert cache.get() is None
+    facts = cache._parse_probe(
+        "os:Linux 5.15.0\nuser:user\nexecutor:sh\nelevate:false\n",
+        HostFacts(hostname="probed-host", platform="linux", discovered_at=datetime.now()),
+    )
+    assert facts.os_version == "Linux 5.15.0"
+    assert facts.executors == ["sh"]
+    assert facts.can_elevate is False
+    assert facts.powershell_version is None
+    FactCache._facts[cache._key()] = facts
+    with Base.execution_context(), pytest.raises(IncorrectExecutorError):
+        runner.run(command="echo hello", executor="bash")
+    cache.clear()
@@ -0,0 +1,112 @@
+"""Tests HostHealth class methods."""
+import socket
+
+import pytest
+
+
+def failing_connection():
+    """Simulates a host refusing connections."""
+    raise ConnectionRefusedError("Connection refused")
+
+
+def test_retries_then_opens_circuit(main_runner_class):
+    """Tests transient errors are retried and open the circuit once the threshold is reached."""
+    from atomic_operator_runner.health import HostHealth
+    from atomic_operator_runner.utils.exceptions import HostUnavailableError
+
+    main_runner_class(
+        platform="linux", hostname="down-host", retries=1, retry_backoff=0, failure_threshold=2, recovery_timeout=60
+    )
+    health = HostHealth()
+    health.reset("down-host")
+    with pytest.raises(ConnectionRefusedError):
+        health.call(failing_connection)
+    status = health.status("down-host")
+    assert status.state == HostHealth.OPEN
+    assert status.consecutive_failures == 2
+    with pytest.raises(HostUnavailableError):
+        health.call(failing_connection)
+
+
+def test_half_open_probe_closes_circuit(main_runner_class):
+    """Tests a successful probe after the recovery timeout closes the circuit."""
+    from atomic_operator_runner.health import HostHealth
+
+    main_runner_class(
+        platform="linux", hostname="flaky-host", retries=0, retry_backoff=0, failure_threshold=1, recovery_timeout=0
+    )
+    health = HostHealth()
+    health.reset("flaky-host")
+    with pytest.raises(ConnectionRefusedError):
+        health.call(failing_connection)
+    assert health.status("flaky-host").state == HostHealth.OPEN
+    assert health.call(lambda: "recovered") == "recovered"
+    assert health.status("flaky-host").state == HostHealth.CLOSED
+
+
+def test_non_transient_errors_are_not_retried(main_runner_class):
+    """Tests errors which are not connection errors are raised immediately."""
+    from atomic_operator_runner.health import HostHealth
+
+    main_runner_class(platform="linux", hostname="auth-host", retries=3, retry_backoff=0)
+    health = HostHealth()
+    health.reset("auth-host")
+    calls = []
+
+    def bad_credentials():
+        calls.append(1)
+        raise ValueError("bad credentials")
+
+    with pytest.raises(ValueError):
+        health.call(bad_credentials)
+    assert len(calls) == 1
+    assert health.status("auth-host").state == HostHealth.CLOSED
+
+
+class TimingOutSSHClient:
+    """Stands in for a paramiko SSHClient which connects and then times out running a command."""
+
+    commands = []
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, hostname, **kwargs):
+        pass
+
+    def get_transport(self):
+        return self
+
+    def is_active(self):
+        return True
+
+    def set_keepalive(self, interval):
+        pass
+
+    def exec_command(self, command):
+        TimingOutSSHClient.commands.append(command)
+        raise socket.timeout("timed out")
+
+    def close(self):
+        pass
+
+
+def test_sent_commands_are_not_retried(main_runner_class, monkeypatch):
+    """Tests a transient error after a command was sent is raised without running the command again."""
+    from atomic_operator_runner import connections
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.connections import SSHConnectionPool
+    from atomic_operator_runner.health import HostHealth
+    from atomic_operator_runner.remote import RemoteRunner
+    from atomic_operator_runner.utils.exceptions import RemoteRunnerExecutionError
+
+    monkeypatch.setattr(connections, "SSHClient", TimingOutSSHClient)
+    main_runner_class(platform="linux", hostname="slow-host", password="password", retries=3, retry_backoff=0)
+    HostHealth().reset("slow-host")
+    SSHConnectionPool().close()
+    with Base.execution_context():
+        with pytest.raises(RemoteRunnerExecutionError):
+            RemoteRunner().run(executor="sh", command="echo once")
+    assert len(TimingOutSSHClient.commands) == 1
+    assert HostHealth().status("slow-host").state == HostHealth.CLOSED
+    SSHConnectionPool().close()
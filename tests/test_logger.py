@@ -0,0 +1,21 @@
+"""Tests logging classes."""
+import logging
+
+
+def test_payload_size_filter_truncates():
+    """Tests large log messages keep only their head and tail."""
+    from atomic_operator_runner.utils.logger import PayloadSizeFilter
+
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "%s", ("a" * 50 + "b" * 50,), None)
+    assert PayloadSizeFilter(max_size=20).filter(record)
+    assert record.getMessage() == "a" * 10 + "\n... [80 characters truncated] ...\n" + "b" * 10
+
+
+def test_root_handlers_run_on_listener():
+    """Tests the configured handlers are moved behind a queue handler."""
+    from logging.handlers import QueueHandler
+
+    from atomic_operator_runner.utils.logger import LoggingBase
+
+    assert LoggingBase._listener is not None
+    assert any(isinstance(handler, QueueHandler) for handler in logging.getLogger().handlers)
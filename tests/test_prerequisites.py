@@ -0,0 +1,69 @@
+"""Tests PrerequisiteRunner class methods."""
+import os
+
+import pytest
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Requires a POSIX shell")
+def test_only_failed_checks_are_installed_in_order(main_runner_class, tmp_path):
+    """Tests installs run only for failed checks, after their dependencies, and are checked again."""
+    from atomic_operator_runner.models import Prerequisite
+
+    log = tmp_path / "installs"
+    present, tool, plugin = tmp_path / "present", tmp_path / "tool", tmp_path / "plugin"
+    present.touch()
+    prerequisites = [
+        Prerequisite(
+            name="plugin",
+            check_command=f"test -f {plugin}",
+            install_command=f"test -f {tool} && touch {plugin} && echo plugin >> {log}",
+            depends_on=["tool"],
+        ),
+        Prerequisite(
+            name="tool", check_command=f"test -f {tool}", install_command=f"touch {tool} && echo tool >> {log}"
+        ),
+        Prerequisite(name="present", check_command=f"test -f {present}", install_command=f"echo present >> {log}"),
+        Prerequisite(name="missing", check_command="exit 1"),
+    ]
+    response = main_runner_class(platform="linux").check_prerequisites(prerequisites=prerequisites, executor="sh")
+    results = {result.name: result for result in response.prerequisites}
+    assert [result.name for result in response.prerequisites] == ["plugin", "tool", "present", "missing"]
+    assert log.read_text().split() == ["tool", "plugin"]
+    assert results["plugin"].installed and results["plugin"].satisfied
+    assert results["plugin"].check_return_code != 0 and results["plugin"].recheck_return_code == 0
+    assert results["present"].satisfied and not results["present"].installed
+    assert results["missing"].skipped and not results["missing"].satisfied
+    assert response.return_code == 1
+
+
+def test_circular_dependencies_are_rejected(main_runner_class):
+    """Tests prerequisites which depend on each other are rejected before anything runs."""
+    from atomic_operator_runner.models import Prerequisite
+    from atomic_operator_runner.utils.exceptions import PrerequisiteDependencyError
+
+    prerequisites = [
+        Prerequisite(name="a", check_command="exit 1", depends_on=["b"]),
+        Prerequisite(name="b", check_command="exit 1", depends_on=["a"]),
+    ]
+    with pytest.raises(PrerequisiteDependencyError):
+        main_runner_class(platform="linux").check_prerequisites(prerequisites=prerequisites, executor="sh")
+
+
+def test_commands_use_the_config_of_the_calling_thread(main_runner_class, monkeypatch):
+    """Tests prerequisites checked inside an execution context run against its host, not the shared one."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.models import Host
+    from atomic_operator_runner.models import Prerequisite
+
+    runner = main_runner_class(platform="linux", hostname="shared-host")
+    hostnames = []
+
+    def _execute(**kwargs):
+        hostnames.append(Base.config.hostname)
+        return runner._new_response()
+
+    monkeypatch.setattr(runner, "_execute", _execute)
+    prerequisites = [Prerequisite(name=name, check_command="exit 0") for name in ("a", "b", "c")]
+    with Base.execution_context(config=Host(platform="linux", hostname="bound-host")):
+        runner.check_prerequisites(prerequisites=prerequisites, executor="sh")
+    assert hostnames == ["bound-host"] * 3
@@ -148,3 +148,44 @@ def test_handle_windows_streams():
     response = processor._handle_windows_streams(stream=SamplePSDataStreams())
     assert isinstance(response, list)
     assert len(response) == 1
+
+
+def test_records_are_deduplicated_and_capped():
+    """Testing repeated records are counted and records over the limit are dropped."""
+    from atomic_operator_runner.models import RunnerResponse
+    from atomic_operator_runner.processor import Processor
+
+    processor = Processor(**SAMPLE_DATA)
+    processor.response = RunnerResponse()
+    processor.MAX_RECORDS_PER_TYPE = 3
+    processor.MAX_MESSAGE_SIZE = 10
+    for _ in range(5):
+        processor._capture_base_records(data="repeated error")
+    for i in range(5):
+        processor._capture_base_records(data=f"error {i}")
+    assert len(processor.response.records) == 3
+    assert processor.response.records[0].count == 5
+    assert processor.response.records[0].message_data.startswith("repeated e... [truncated")
+    assert processor.response.dropped_records == {"error": 3}
+    processor.response = RunnerResponse()
+
+
+def test_records_built_in_process_pool(main_runner_class):
+    """Tests records built in worker processes match records built on the current thread."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.processor import Processor
+    from atomic_operator_runner.processor import _get_pool
+
+    errors = {"record-type": "error", "message": "access denied"}
+    config = main_runner_class(platform="linux").config
+    responses = []
+    for process_workers in [0, 2]:
+        with Base.execution_context(config=config.copy(update={"process_workers": process_workers})) as response:
+            Processor(command="whoami", executor="sh", return_code=1, output="x" * 100000, errors=errors)
+            responses.append(response)
+    assert responses[0].dict(exclude={"end_timestamp"}) == responses[1].dict(exclude={"end_timestamp"})
+    assert responses[1].records[0].message_data == "access denied"
+    assert len(responses[1].output) == 100000
+    pool = _get_pool(2)
+    assert _get_pool(2) is pool
+    assert _get_pool(3) is not pool
@@ -0,0 +1,56 @@
+"""Tests Profiler class methods."""
+import os
+import sys
+
+import pytest
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Runs a local sh command.")
+def test_phases_are_recorded_on_the_response(main_runner_class, tmp_path):
+    """Tests each phase of an execution is profiled and reports are written to the profile directory."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.profiling import Profiler
+
+    events = []
+
+    def hook(event, profile):
+        events.append((event, profile.phase))
+
+    runner = main_runner_class(platform="linux", profile="full", profile_directory=str(tmp_path))
+    Profiler.add_hook(hook)
+    try:
+        with Base.execution_context():
+            response = runner._execute(command="echo profiled", executor="sh", cwd=None, elevation_required=False)
+    finally:
+        Profiler.remove_hook(hook)
+    assert response.output.strip() == "profiled"
+    assert [profile.phase for profile in response.profile] == ["execute", "run", "process"]
+    assert events == [
+        ("start", "execute"),
+        ("start", "run"),
+        ("start", "process"),
+        ("end", "process"),
+        ("end", "run"),
+        ("end", "execute"),
+    ]
+    execute = response.profile[0]
+    assert execute.duration >= response.profile[1].duration >= response.profile[2].duration
+    assert execute.peak_traced_memory is not None
+    assert execute.collections >= 0
+    assert sorted(os.path.splitext(path)[1] for path in execute.reports) == [".prof", ".tracemalloc"]
+    assert all(os.path.exists(path) for path in execute.reports)
+    assert not response.profile[1].reports
+
+
+def test_profiling_is_off_by_default(main_runner_class):
+    """Tests nothing is recorded unless profiling is enabled and unknown modes are rejected."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.profiling import Profiler
+    from atomic_operator_runner.utils.exceptions import IncorrectProfileError
+
+    main_runner_class(platform="linux")
+    with Base.execution_context():
+        with Profiler().phase("execute") as profile:
+            assert profile is None
+    with pytest.raises(IncorrectProfileError):
+        main_runner_class(platform="linux", profile="everything")
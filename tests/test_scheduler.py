@@ -0,0 +1,76 @@
+"""Tests Scheduler class methods."""
+import os
+
+import pytest
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Requires a POSIX shell")
+def test_jobs_run_in_priority_order(main_runner_class):
+    """Tests jobs against one host run in priority order when limited to one at a time."""
+    from atomic_operator_runner import Scheduler
+    from atomic_operator_runner.models import Job
+
+    scheduler = Scheduler(runner=main_runner_class(platform="linux"), per_host_limit=1, max_sessions=4)
+    for priority in [3, 1, 2]:
+        scheduler.submit(Job(command=f"echo {priority}", executor="sh", priority=priority))
+    assert scheduler.metrics().queue_depth == {"localhost": 3}
+    responses = scheduler.run()
+    assert [r.output.strip() for r in responses] == ["3", "1", "2"]
+    ordered = sorted(responses, key=lambda r: r.start_timestamp)
+    assert [r.output.strip() for r in ordered] == ["1", "2", "3"]
+    metrics = scheduler.metrics()
+    assert metrics.completed == 3
+    assert metrics.failed == 0
+    assert metrics.queued == 0
+
+
+def test_hosts_take_turns(main_runner_class):
+    """Tests hosts with equal priority jobs are served in turn."""
+    from atomic_operator_runner import Scheduler
+    from atomic_operator_runner.models import Host
+    from atomic_operator_runner.models import Job
+
+    scheduler = Scheduler(runner=main_runner_class(platform="linux"))
+    for hostname in ["a", "a", "a", "b"]:
+        scheduler.submit(Job(command="id", executor="sh", host=Host(hostname=hostname, platform="linux")))
+    order = []
+    with scheduler._condition:
+        while True:
+            next_job = scheduler._next_job()
+            if next_job is None:
+                break
+            order.append(next_job[1].host.hostname)
+    assert order == ["a", "b", "a"]
+
+
+def test_rate_limiter():
+    """Tests the rate limiter blocks once the burst is used up."""
+    import time
+
+    from atomic_operator_runner.scheduler import RateLimiter
+
+    limiter = RateLimiter(rate=20, burst=1)
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Requires a POSIX shell")
+def test_checkpoint_failures_do_not_stall_the_run(main_runner_class, tmp_path):
+    """Tests a job whose checkpoint cannot be written still completes and the run returns."""
+    from atomic_operator_runner import Scheduler
+    from atomic_operator_runner.checkpoint import CheckpointStore
+    from atomic_operator_runner.models import Job
+
+    class FullCheckpointStore(CheckpointStore):
+        def add(self, key, response):
+            raise OSError("No space left on device")
+
+    scheduler = Scheduler(
+        runner=main_runner_class(platform="linux"), checkpoint=FullCheckpointStore(str(tmp_path / "checkpoint"))
+    )
+    scheduler.submit(Job(command="echo done", executor="sh"))
+    responses = scheduler.run()
+    assert [r.output.strip() for r in responses] == ["done"]
+    assert scheduler.metrics().running == 0
@@ -0,0 +1,153 @@
+"""Tests ScriptStager class methods."""
+import io
+import os
+import sys
+
+import pytest
+
+
+class FakeSFTPFile(io.BytesIO):
+    """Stands in for a file opened over SFTP, saving its content when closed."""
+
+    def __init__(self, files, path):
+        super().__init__()
+        self.files = files
+        self.path = path
+
+    def close(self):
+        self.files[self.path] = self.getvalue()
+        super().close()
+
+
+class FakeSFTPClient:
+    """Stands in for a paramiko SFTPClient, keeping files in memory."""
+
+    files = {}
+    directories = []
+
+    def normalize(self, path):
+        return "/home/user"
+
+    def mkdir(self, path, mode=511):
+        if path in FakeSFTPClient.directories:
+            raise IOError(f"{path} exists")
+        FakeSFTPClient.directories.append(path)
+
+    def chmod(self, path, mode):
+        pass
+
+    def rmdir(self, path):
+        FakeSFTPClient.directories.remove(path)
+
+    def open(self, path, mode="r"):
+        return FakeSFTPFile(FakeSFTPClient.files, path)
+
+    def remove(self, path):
+        del FakeSFTPClient.files[path]
+
+    def close(self):
+        pass
+
+
+class FakeChannel:
+    """Stands in for a paramiko channel."""
+
+    def recv_exit_status(self):
+        return 0
+
+    def close(self):
+        pass
+
+
+class FakeTransport:
+    """Stands in for a paramiko transport."""
+
+    def is_active(self):
+        return True
+
+    def set_keepalive(self, interval):
+        pass
+
+
+class FakeSSHClient:
+    """Stands in for a paramiko SSHClient, echoing the commands it runs."""
+
+    commands = []
+
+    def set_missing_host_key_policy(self, policy):
+        pass
+
+    def connect(self, hostname, **kwargs):
+        pass
+
+    def get_transport(self):
+        return FakeTransport()
+
+    def open_sftp(self):
+        return FakeSFTPClient()
+
+    def exec_command(self, command):
+        FakeSSHClient.commands.append(command)
+        stdout = io.BytesIO(command.encode())
+        stdout.channel = FakeChannel()
+        return io.BytesIO(), stdout, io.BytesIO()
+
+    def close(self):
+        pass
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="The staged script is ran with /bin/sh.")
+def test_large_local_commands_are_staged_once(main_runner_class, monkeypatch):
+    """Tests a large local command is written to a script file once, ran by path and removed on cleanup."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.staging import ScriptStager
+
+    uploads = []
+    upload = ScriptStager._upload
+    monkeypatch.setattr(
+        ScriptStager, "_upload", lambda self, path, command: uploads.append(path) or upload(self, path, command)
+    )
+    runner = main_runner_class(platform="linux", staging_threshold=64)
+    command = "echo staged\n" + "# padding\n" * 10 + "exit 2"
+    with Base.execution_context():
+        first = runner._execute(command=command, executor="sh", cwd=None, elevation_required=False)
+        second = runner._execute(command=command, executor="sh", cwd=None, elevation_required=False)
+        small = runner._execute(command="echo small", executor="sh", cwd=None, elevation_required=False)
+    assert first.output.strip() == second.output.strip() == "staged"
+    assert first.return_code == second.return_code == 2
+    assert first.command == command
+    assert small.output.strip() == "small"
+    assert len(uploads) == 1
+    assert os.path.exists(uploads[0])
+    ScriptStager().cleanup()
+    assert not os.path.exists(uploads[0])
+
+
+def test_large_remote_commands_are_uploaded_over_sftp(main_runner_class, monkeypatch):
+    """Tests a large remote command is uploaded once over SFTP and the executor runs it by path."""
+    from atomic_operator_runner import connections
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.connections import SSHConnectionPool
+    from atomic_operator_runner.staging import ScriptStager
+
+    monkeypatch.setattr(connections, "SSHClient", FakeSSHClient)
+    runner = main_runner_class(platform="linux", hostname="staging-host", password="password", staging_threshold=32)
+    command = "print('staged')\n" + "#" * 64
+    with Base.execution_context():
+        runner._execute(command=command, executor="python", cwd=None, elevation_required=False)
+        response = runner._execute(command=command, executor="python", cwd=None, elevation_required=False)
+    assert len(FakeSFTPClient.files) == 1
+    path, content = next(iter(FakeSFTPClient.files.items()))
+    directory = FakeSFTPClient.directories[-1]
+    assert directory.startswith("/home/user/.atomic-operator-runner/atomic-operator-runner-")
+    assert path.startswith(f"{directory}/atomic-operator-runner-") and path.endswith(".py")
+    assert content == command.encode()
+    assert FakeSSHClient.commands == [f"/usr/bin/python3 {path}"] * 2
+    assert response.command == command
+    with Base.execution_context():
+        # another process stages in a directory of its own
+        assert ScriptStager()._make_directory() != directory
+    ScriptStager().cleanup()
+    assert FakeSFTPClient.files == {}
+    assert directory not in FakeSFTPClient.directories
+    SSHConnectionPool().close()
@@ -0,0 +1,68 @@
+"""Tests ResultStore class methods."""
+from datetime import datetime
+
+
+def _response(hostname, command, return_code, output):
+    from atomic_operator_runner.models import BaseRecord
+    from atomic_operator_runner.models import RunnerResponse
+    from atomic_operator_runner.models import TargetEnvironment
+
+    return RunnerResponse(
+        environment=TargetEnvironment(platform="linux", hostname=hostname, user="root"),
+        command=command,
+        executor="sh",
+        start_timestamp=datetime.now(),
+        output=output,
+        records=[BaseRecord(**{"record-type": "INFO", "message": output})],
+        **{"return-code": return_code},
+    )
+
+
+def test_query_and_diff_runs(tmp_path):
+    """Tests stored runs can be queried and compared."""
+    from atomic_operator_runner.store import ResultStore
+
+    store = ResultStore(path=str(tmp_path / "results.db"))
+    store.add(
+        [_response("a", "whoami", 0, "root"), _response("a", "id", 0, "uid=0"), _response("b", "whoami", 0, "root")],
+        run="monday",
+    )
+    store.add(
+        [_response("a", "whoami", 0, "root"), _response("a", "id", 1, "denied"), _response("c", "whoami", 0, "root")],
+        run="tuesday",
+    )
+    assert store.runs() == ["monday", "tuesday"]
+    results = store.query(hostname="a", command="id")
+    assert [r.return_code for r in results] == [1, 0]
+    assert results[0].run == "tuesday"
+    assert store.get(results[0].id).records[0].message_data == "denied"
+    assert len(store.query(run="monday", return_code=0)) == 3
+    changes = {(d.change, d.hostname, d.command): d for d in store.diff(before="monday", after="tuesday")}
+    assert set(changes) == {("changed", "a", "id"), ("added", "c", "whoami"), ("removed", "b", "whoami")}
+    assert changes[("changed", "a", "id")].output_changed
+    assert changes[("changed", "a", "id")].before_return_code == 0
+    # only the latest execution of a command on a host is compared
+    store.add([_response("a", "whoami", 2, "retried"), _response("a", "whoami", 3, "failed")], run="tuesday")
+    changes = [(d.change, d.hostname, d.command, d.after_return_code) for d in store.diff("monday", "tuesday")]
+    assert sorted(changes) == [
+        ("added", "c", "whoami", 0),
+        ("changed", "a", "id", 1),
+        ("changed", "a", "whoami", 3),
+        ("removed", "b", "whoami", None),
+    ]
+    store.close()
+
+
+def test_results_cli(runner, tmp_path):
+    """Tests the results command line diffs stored runs."""
+    from atomic_operator_runner.__main__ import results
+    from atomic_operator_runner.store import ResultStore
+
+    db = str(tmp_path / "results.db")
+    store = ResultStore(path=db)
+    store.add([_response("a", "whoami", 0, "root")], run="monday")
+    store.add([_response("a", "whoami", 1, "")], run="tuesday")
+    store.close()
+    output = runner.invoke(results, ["--db", db, "diff", "monday", "tuesday"]).output
+    assert '"change": "changed"' in output
+    assert runner.invoke(results, ["--db", db, "runs"]).output.split() == ["monday", "tuesday"]
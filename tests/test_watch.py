@@ -0,0 +1,69 @@
+"""Tests OutputWatch and OutputScanner class methods."""
+import sys
+import time
+
+import pytest
+
+
+def test_patterns_are_matched_across_chunks():
+    """Tests every pattern is found in lines split over several chunks and reported to the callback."""
+    from atomic_operator_runner.watch import OutputWatch
+
+    found = []
+    watch = OutputWatch(patterns={"marker": r"DETECTED-\d+", "banner": "success"}, callback=found.append)
+    scanner = watch.scanner()
+    for chunk in [b"line one\nDETEC", b"TED-42 and success\nno newline ", b"succ", b"ess"]:
+        scanner.feed(chunk)
+    scanner.close()
+    assert [(match.pattern, match.text, match.offset) for match in scanner.matches] == [
+        ("marker", "DETECTED-42", 9),
+        ("banner", "success", 25),
+        ("banner", "success", 44),
+    ]
+    assert scanner.matches[0].line == "DETECTED-42 and success"
+    assert found == scanner.matches
+    with pytest.raises(ValueError):
+        OutputWatch(patterns=[])
+
+
+def test_patterns_with_groups_and_flags_are_matched_one_by_one():
+    """Tests patterns which cannot be combined into one expression are accepted and matched on their own."""
+    from atomic_operator_runner.watch import OutputWatch
+
+    watch = OutputWatch(
+        patterns={"ready": "(?i)ready", "repeat": r"(a)\1", "first": "(?P<id>x)1", "second": "(?P<id>y)2"}
+    )
+    assert watch.regex is None
+    scanner = watch.scanner()
+    scanner.feed(b"READY y2 aa x1\n")
+    scanner.close()
+    assert [(match.pattern, match.text, match.offset) for match in scanner.matches] == [
+        ("ready", "READY", 0),
+        ("second", "y2", 6),
+        ("repeat", "aa", 9),
+        ("first", "x1", 12),
+    ]
+    assert OutputWatch(patterns=["ready", "done"]).regex is not None
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Runs a local sh command.")
+def test_command_stops_on_first_match(main_runner_class):
+    """Tests a watched command is stopped once its output matches without being marked as cancelled."""
+    from atomic_operator_runner.base import Base
+    from atomic_operator_runner.watch import OutputWatch
+
+    runner = main_runner_class(platform="linux")
+    start = time.monotonic()
+    with Base.execution_context():
+        response = runner._execute(
+            command="echo starting; echo ATOMIC-READY; sleep 4; echo finished",
+            executor="sh",
+            cwd=None,
+            elevation_required=False,
+            watch=OutputWatch(patterns=["ATOMIC-READY"], stop_on_match=True),
+        )
+    assert time.monotonic() - start < 3
+    assert response.stopped_on_match is True
+    assert response.cancelled is False
+    assert [match.line for match in response.matches] == ["ATOMIC-READY"]
+    assert "finished" not in response.output